@@ -0,0 +1,42 @@
+// Loader for the artifacts written by `python -m pipeline publish`.
+// manifest.json maps each artifact name to its content-hashed file, so the
+// hashed files can be cached indefinitely and only the manifest is revalidated.
+
+export type Columns = Record<string, (string | number | null)[]>;
+
+type Manifest = {
+  files: Record<string, { path: string; bytes: number; gzip_bytes: number }>;
+};
+
+let manifest: Promise<Manifest> | null = null;
+
+const loadManifest = (): Promise<Manifest> => {
+  if (!manifest) {
+    manifest = fetch('/data/manifest.json', { cache: 'no-cache' }).then(res => {
+      if (!res.ok) throw new Error(`manifest.json: ${res.status}`);
+      return res.json();
+    });
+  }
+  return manifest;
+};
+
+export const artifactUrl = async (name: string): Promise<string> => {
+  const entry = (await loadManifest()).files[name];
+  if (!entry) throw new Error(`${name} has not been published`);
+  return `/data/${entry.path}`;
+};
+
+export const loadArtifact = async <T,>(name: string): Promise<T> => {
+  const res = await fetch(await artifactUrl(name));
+  return res.json();
+};
+
+// Columnar payload ({column: [values]}) back to row objects
+export const toRows = <T,>(columns: Columns | null | undefined): T[] => {
+  if (!columns) return [];
+  const keys = Object.keys(columns);
+  const length = keys.length ? columns[keys[0]].length : 0;
+  return Array.from({ length }, (_, i) =>
+    Object.fromEntries(keys.map(key => [key, columns[key][i]])) as T
+  );
+};
@@ -1,16 +1,24 @@
 import { useEffect, useMemo, useState } from 'react';
-import Papa from 'papaparse';
 import { ExternalLink } from 'lucide-react';
 import { dataSourceGroups, dataSourceNotes } from '../data/dataSources';
+import { type Columns, loadArtifact, toRows } from '../data/published';
 
 type ProductRow = {
   sku: string;
   product_name: string;
-  category: string;
   pack_size: string;
   active_flag: string;
 };
 
+type CatalogArtifact = {
+  products: number;
+  beers: number;
+  active_beers: number;
+  by_category: Record<string, number>;
+  beer_pack_sizes: Record<string, number>;
+  beer_products: Columns;
+};
+
 type CountEntry = {
   label: string;
   count: number;
@@ -22,47 +30,23 @@ const toCountEntries = (counts: Record<string, number>): CountEntry[] =>
     .sort((a, b) => b.count - a.count || a.label.localeCompare(b.label));
 
 const Catalog = () => {
-  const [products, setProducts] = useState<ProductRow[]>([]);
+  const [catalog, setCatalog] = useState<CatalogArtifact | null>(null);
 
   useEffect(() => {
-    Papa.parse<ProductRow>('/data/dim_product.csv', {
-      download: true,
-      header: true,
-      complete: (results) => {
-        const rows = results.data.filter(row => row && row.sku);
-        setProducts(rows);
-      }
-    });
+    loadArtifact<CatalogArtifact>('catalog.json')
+      .then(setCatalog)
+      .catch(err => console.error('Failed to load catalog', err));
   }, []);
 
-  const stats = useMemo(() => {
-    const totalProducts = products.length;
-    const beerProducts = products.filter(product => product.category === 'Beer');
-    const activeBeers = beerProducts.filter(product => product.active_flag === '1');
-    const inactiveBeers = beerProducts.filter(product => product.active_flag !== '1');
-
-    const categoryCounts = products.reduce<Record<string, number>>((acc, row) => {
-      const key = row.category || 'Unknown';
-      acc[key] = (acc[key] || 0) + 1;
-      return acc;
-    }, {});
-
-    const packCounts = beerProducts.reduce<Record<string, number>>((acc, row) => {
-      const key = row.pack_size || 'Unknown';
-      acc[key] = (acc[key] || 0) + 1;
-      return acc;
-    }, {});
-
-    return {
-      totalProducts,
-      totalBeers: beerProducts.length,
-      activeBeers: activeBeers.length,
-      inactiveBeers: inactiveBeers.length,
-      categoryCounts: toCountEntries(categoryCounts),
-      packCounts: toCountEntries(packCounts),
-      beerProducts
-    };
-  }, [products]);
+  const stats = useMemo(() => ({
+    totalProducts: catalog?.products ?? 0,
+    totalBeers: catalog?.beers ?? 0,
+    activeBeers: catalog?.active_beers ?? 0,
+    inactiveBeers: (catalog?.beers ?? 0) - (catalog?.active_beers ?? 0),
+    categoryCounts: toCountEntries(catalog?.by_category ?? {}),
+    packCounts: toCountEntries(catalog?.beer_pack_sizes ?? {}),
+    beerProducts: toRows<ProductRow>(catalog?.beer_products)
+  }), [catalog]);
 
   const catalogSources = dataSourceGroups.filter(group =>
     group.title.includes('Collective Arts')
@@ -1,18 +1,23 @@
 
 import { useEffect, useState } from 'react';
-import Papa from 'papaparse';
 import { Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, Area, ComposedChart } from 'recharts';
 import { ExternalLink } from 'lucide-react';
 import { dataSourceGroups, dataSourceNotes } from '../data/dataSources';
+import { type Columns, loadArtifact, toRows } from '../data/published';
 
+// Daily forecast per SKU, summed over channels by `pipeline publish`
 interface ForecastData {
     date: string;
-    channel: string;
     sku: string;
     yhat: number;
     yhat_lower: number;
     yhat_upper: number;
-    model_version: string;
+}
+
+interface ForecastArtifact {
+    daily_by_sku: Columns;
+    weekly_by_channel: Columns;
+    weekly_by_category: Columns;
 }
 
 const Forecast = () => {
@@ -22,23 +27,20 @@ const Forecast = () => {
     const [selectedSku, setSelectedSku] = useState<string>('');
 
     useEffect(() => {
-        Papa.parse<ForecastData>('/data/forecast_daily.csv', {
-            download: true,
-            header: true,
-            dynamicTyping: true,
-            complete: (results) => {
-                const raw = results.data;
+        loadArtifact<ForecastArtifact>('forecast.json')
+            .then(artifact => {
+                const raw = toRows<ForecastData>(artifact.daily_by_sku);
                 setData(raw);
-                const uniqueSkus = Array.from(new Set(raw.map((r: ForecastData) => r.sku))).sort() as string[];
+                const uniqueSkus = Array.from(new Set(raw.map(r => r.sku))).sort();
                 setSkus(uniqueSkus);
                 if (uniqueSkus.length > 0) setSelectedSku(uniqueSkus[0]);
-            }
-        });
+            })
+            .catch(err => console.error("Failed to load forecast", err));
     }, []);
 
     useEffect(() => {
         if (selectedSku) {
-            setFilteredData(data.filter((r: any) => r.sku === selectedSku));
+            setFilteredData(data.filter(r => r.sku === selectedSku));
         }
     }, [selectedSku, data]);
 
@@ -1,8 +1,8 @@
 
 import { useEffect, useState } from 'react';
-import Papa from 'papaparse';
 import { CheckCircle, XCircle, ExternalLink } from 'lucide-react';
 import { dataSourceGroups, dataSourceNotes } from '../data/dataSources';
+import { type Columns, loadArtifact, toRows } from '../data/published';
 
 interface MetricData {
     channel: string;
@@ -19,61 +19,28 @@ interface DqReport {
     steps?: string[];
 }
 
-interface Summary {
-    avgMape?: string;
-}
-
-interface ProductRow {
-    sku: string;
-    product_name: string;
-    category: string;
-    pack_size: string;
-    active_flag: string;
+interface OverviewArtifact {
+    report: DqReport | null;
+    catalog: { products: number; beers: number; active_beers: number };
+    metrics: { series: number; avg_mape_ml: number | null; worst: Columns } | null;
 }
 
 const Overview = () => {
-    const [metrics, setMetrics] = useState<MetricData[] | null>(null);
-    const [dqReport, setDqReport] = useState<DqReport | null>(null);
-    const [summary, setSummary] = useState<Summary>({});
-    const [products, setProducts] = useState<ProductRow[]>([]);
+    const [overview, setOverview] = useState<OverviewArtifact | null>(null);
 
     useEffect(() => {
-        // Load Forecast Metrics
-        Papa.parse<MetricData>('/data/forecast_metrics.csv', {
-            download: true,
-            header: true,
-            complete: (results) => {
-                const rows = results.data.filter(row => row && row.channel && row.sku);
-                setMetrics(rows);
-                // Calculate aggregations
-                if (rows.length > 0) {
-                    const avgMape = rows.reduce((acc: number, curr: MetricData) => acc + (Number(curr.mape_ml) || 0), 0) / rows.length;
-                    setSummary(prev => ({ ...prev, avgMape: (avgMape * 100).toFixed(1) }));
-                }
-            }
-        });
-
-        // Load Pipeline Report
-        fetch('/data/pipeline_report.json')
-            .then(res => res.json())
-            .then(data => setDqReport(data))
-            .catch(err => console.error("Failed to load pipeline report", err));
-
-        // Load Product Catalog
-        Papa.parse<ProductRow>('/data/dim_product.csv', {
-            download: true,
-            header: true,
-            complete: (results) => {
-                const rows = results.data.filter(row => row && row.sku);
-                setProducts(rows);
-            }
-        });
-
+        loadArtifact<OverviewArtifact>('overview.json')
+            .then(setOverview)
+            .catch(err => console.error("Failed to load overview", err));
     }, []);
 
-    const totalProducts = products.length;
-    const totalBeers = products.filter(product => product.category === 'Beer').length;
-    const activeBeers = products.filter(product => product.category === 'Beer' && product.active_flag === '1').length;
+    const dqReport = overview?.report;
+    const metrics = toRows<MetricData>(overview?.metrics?.worst);
+    const avgMape = overview?.metrics?.avg_mape_ml;
+    const summary = { avgMape: avgMape != null ? (avgMape * 100).toFixed(1) : undefined };
+    const totalProducts = overview?.catalog.products;
+    const totalBeers = overview?.catalog.beers;
+    const activeBeers = overview?.catalog.active_beers;
 
     return (
         <div className="space-y-6">
@@ -108,7 +75,7 @@ const Overview = () => {
 
             {/* Model Details List */}
             <div className="bg-white p-6 rounded-lg shadow-sm border border-gray-100">
-                <h3 className="font-bold text-lg mb-4">Forecast Model Performance by SKU</h3>
+                <h3 className="font-bold text-lg mb-4">Forecast Model Performance (worst MAPE first)</h3>
                 <div className="overflow-x-auto">
                     <table className="min-w-full text-sm">
                         <thead>
@@ -121,7 +88,7 @@ const Overview = () => {
                             </tr>
                         </thead>
                         <tbody>
-                            {metrics && metrics.slice(0, 10).map((row: any, i: number) => (
+                            {metrics.slice(0, 10).map((row, i) => (
                                 <tr key={i} className="border-t">
                                     <td className="p-3">{row.channel}</td>
                                     <td className="p-3">{row.sku}</td>
@@ -130,8 +97,8 @@ const Overview = () => {
                                             {row.best_model}
                                         </span>
                                     </td>
-                                    <td className="p-3">{(parseFloat(row.mape_ml) * 100).toFixed(1)}%</td>
-                                    <td className="p-3">{(parseFloat(row.mape_baseline) * 100).toFixed(1)}%</td>
+                                    <td className="p-3">{(row.mape_ml * 100).toFixed(1)}%</td>
+                                    <td className="p-3">{(row.mape_baseline * 100).toFixed(1)}%</td>
                                 </tr>
                             ))}
                         </tbody>
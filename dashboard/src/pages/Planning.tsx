@@ -1,8 +1,8 @@
 
 import { useEffect, useState } from 'react';
-import Papa from 'papaparse';
 import { Download, AlertTriangle, ExternalLink } from 'lucide-react';
 import { dataSourceGroups, dataSourceNotes } from '../data/dataSources';
+import { type Columns, artifactUrl, loadArtifact, toRows } from '../data/published';
 
 interface PlanRow {
     week_start: string;
@@ -15,23 +15,30 @@ interface PlanRow {
     notes?: string;
 }
 
+// Largest production runs of the plan; the full plan is the CSV download
+interface PlanningArtifact {
+    rows: number;
+    weekly: Columns;
+    top_production: Columns;
+}
+
 const Planning = () => {
     const [plan, setPlan] = useState<PlanRow[]>([]);
+    const [totalRows, setTotalRows] = useState(0);
 
     useEffect(() => {
-        Papa.parse<PlanRow>('/data/production_plan_weekly.csv', {
-            download: true,
-            header: true,
-            complete: (results) => {
-                setPlan(results.data);
-            }
-        });
+        loadArtifact<PlanningArtifact>('planning.json')
+            .then(artifact => {
+                setPlan(toRows<PlanRow>(artifact.top_production));
+                setTotalRows(artifact.rows);
+            })
+            .catch(err => console.error("Failed to load plan", err));
     }, []);
 
-    const downloadCsv = () => {
+    const downloadCsv = async () => {
         // Simple client-side download trigger since file is already static
         const link = document.createElement('a');
-        link.href = '/data/production_plan_weekly.csv';
+        link.href = await artifactUrl('production_plan_weekly.csv');
         link.download = 'production_plan_weekly.csv';
         document.body.appendChild(link);
         link.click();
@@ -51,6 +58,9 @@ const Planning = () => {
             </div>
 
             <div className="bg-white rounded-lg shadow-sm border border-gray-100 overflow-hidden">
+                <p className="px-4 pt-4 text-xs text-gray-400">
+                    Largest {plan.length} production runs of {totalRows} plan rows; download the CSV for the full plan.
+                </p>
                 <div className="overflow-x-auto">
                     <table className="min-w-full text-sm">
                         <thead className="bg-gray-50 text-gray-600 font-medium">
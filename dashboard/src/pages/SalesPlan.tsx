@@ -1,25 +1,7 @@
-import { useEffect, useMemo, useState } from 'react';
-import Papa from 'papaparse';
+import { useEffect, useState } from 'react';
 import { ExternalLink } from 'lucide-react';
 import { dataSourceGroups, dataSourceNotes } from '../data/dataSources';
-
-type PlanRow = {
-  week_start: string;
-  sku: string;
-  product_name: string;
-  forecast_units: string;
-  safety_stock: string;
-  on_hand: string;
-  suggested_production: string;
-  notes?: string;
-};
-
-type ForecastRow = {
-  date: string;
-  channel: string;
-  sku: string;
-  yhat: number;
-};
+import { type Columns, loadArtifact, toRows } from '../data/published';
 
 type JoinedRow = {
   sku: string;
@@ -30,73 +12,33 @@ type JoinedRow = {
   variance: number;
 };
 
+type Totals = Omit<JoinedRow, 'sku' | 'product_name'>;
+
+// Totals over every SKU, table of the SKUs with the largest variance
+type SalesPlanArtifact = {
+  totals: Totals;
+  skus: number;
+  top_variance: Columns;
+};
+
 const SalesPlan = () => {
-  const [planRows, setPlanRows] = useState<PlanRow[]>([]);
-  const [forecastRows, setForecastRows] = useState<ForecastRow[]>([]);
+  const [joinedRows, setJoinedRows] = useState<JoinedRow[]>([]);
+  const [totals, setTotals] = useState<Totals>({
+    forecasted_sales: 0,
+    planned_sales: 0,
+    suggested_production: 0,
+    variance: 0
+  });
 
   useEffect(() => {
-    Papa.parse<PlanRow>('/data/production_plan_weekly.csv', {
-      download: true,
-      header: true,
-      complete: results => {
-        const rows = results.data.filter(row => row && row.sku);
-        setPlanRows(rows);
-      }
-    });
-
-    Papa.parse<ForecastRow>('/data/forecast_daily.csv', {
-      download: true,
-      header: true,
-      dynamicTyping: true,
-      complete: results => {
-        const rows = results.data.filter(row => row && row.sku);
-        setForecastRows(rows);
-      }
-    });
+    loadArtifact<SalesPlanArtifact>('sales_plan.json')
+      .then(artifact => {
+        setJoinedRows(toRows<JoinedRow>(artifact.top_variance));
+        setTotals(artifact.totals);
+      })
+      .catch(err => console.error('Failed to load sales plan', err));
   }, []);
 
-  const joinedRows = useMemo<JoinedRow[]>(() => {
-    const forecastBySku = forecastRows.reduce<Record<string, number>>((acc, row) => {
-      const key = row.sku || 'Unknown';
-      const value = Number(row.yhat) || 0;
-      acc[key] = (acc[key] || 0) + value;
-      return acc;
-    }, {});
-
-    return planRows.map(row => {
-      const plannedSales = Number(row.forecast_units) || 0;
-      const suggestedProduction = Number(row.suggested_production) || 0;
-      const forecastedSales = forecastBySku[row.sku] || 0;
-      const variance = plannedSales - forecastedSales;
-      return {
-        sku: row.sku,
-        product_name: row.product_name,
-        forecasted_sales: forecastedSales,
-        planned_sales: plannedSales,
-        suggested_production: suggestedProduction,
-        variance
-      };
-    });
-  }, [forecastRows, planRows]);
-
-  const totals = useMemo(() => {
-    return joinedRows.reduce(
-      (acc, row) => {
-        acc.forecasted_sales += row.forecasted_sales;
-        acc.planned_sales += row.planned_sales;
-        acc.suggested_production += row.suggested_production;
-        acc.variance += row.variance;
-        return acc;
-      },
-      {
-        forecasted_sales: 0,
-        planned_sales: 0,
-        suggested_production: 0,
-        variance: 0
-      }
-    );
-  }, [joinedRows]);
-
   return (
     <div className="space-y-6">
       <div className="flex items-center justify-between">
@@ -108,12 +50,12 @@ const SalesPlan = () => {
         <div className="bg-white p-6 rounded-lg shadow-sm border border-gray-100">
           <h3 className="text-gray-500 text-sm font-medium">Forecasted Sales</h3>
           <p className="text-3xl font-bold text-blue-600">{Math.round(totals.forecasted_sales)}</p>
-          <span className="text-xs text-gray-400">Sum of forecast_daily.csv (yhat)</span>
+          <span className="text-xs text-gray-400">Sum of forecast (yhat)</span>
         </div>
         <div className="bg-white p-6 rounded-lg shadow-sm border border-gray-100">
           <h3 className="text-gray-500 text-sm font-medium">Planned Sales</h3>
           <p className="text-3xl font-bold text-gray-800">{Math.round(totals.planned_sales)}</p>
-          <span className="text-xs text-gray-400">production_plan_weekly.csv forecast_units</span>
+          <span className="text-xs text-gray-400">Plan forecast_units</span>
         </div>
         <div className="bg-white p-6 rounded-lg shadow-sm border border-gray-100">
           <h3 className="text-gray-500 text-sm font-medium">Suggested Production</h3>
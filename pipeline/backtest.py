@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from pipeline.forecast import (
+    DEFAULT_HORIZON, FEATURE_CONFIG, FEATURES, MIN_HISTORY, SERIES_KEYS, TARGET,
+    _history_matrix, _local_model, recursive_forecast,
+)
+from pipeline.transform import add_features, history_length
+from pipeline.intervals import DEFAULT_COVERAGE, INTERVALS_PATH, interval_offsets
+from pipeline.profiling import stage
+
+BACKTEST_METRICS_PATH = "data/outputs/backtest_metrics.csv"
+BACKTEST_RESIDUALS_PATH = "data/outputs/backtest_residuals.csv"
+DEFAULT_FOLDS = 4
+
+
+def rolling_origins(last_date, n_folds: int = DEFAULT_FOLDS, horizon: int = DEFAULT_HORIZON,
+                    step: int | None = None) -> list:
+    """Forecast origins (last training day) for each fold, oldest first.
+
+    The newest fold's horizon ends on `last_date`; earlier folds move the
+    origin back `step` days (default: one horizon, so test windows don't overlap).
+    """
+    step = step or horizon
+    last_date = pd.Timestamp(last_date)
+    return [last_date - pd.Timedelta(days=horizon + step * i) for i in reversed(range(n_folds))]
+
+
+def _backtest_series(channel, sku, group: pd.DataFrame, cutoffs: list, horizon: int):
+    """Refit and forecast one series at every origin.
+
+    Returns long residual rows (fold, cutoff, model, date, y, yhat), or None
+    when no fold has enough history. Module level so it pickles for the pool.
+    """
+    group = group.sort_values('date')
+    lookback = history_length(FEATURE_CONFIG)
+    rows = []
+    for fold, cutoff in enumerate(cutoffs):
+        train = group[group['date'] <= cutoff]
+        test = group[(group['date'] > cutoff) & (group['date'] <= cutoff + pd.Timedelta(days=horizon))]
+        if len(train) < MIN_HISTORY or test.empty:
+            continue
+        model = _local_model()
+        model.fit(train[FEATURES], train[TARGET])
+        history, last = _history_matrix(train, lookback)
+        ml = recursive_forecast(lambda X: model.predict(X[FEATURES]), history, last, horizon)
+        sma = np.nanmean(history[:, -7:])
+
+        actual = test.set_index('date')[TARGET]
+        for name, yhat in (('ML', ml.set_index('date')['yhat']), ('Baseline_SMA', pd.Series(sma, index=ml['date']))):
+            yhat = yhat.reindex(actual.index)
+            rows.append(pd.DataFrame({
+                'channel': channel, 'sku': sku, 'fold': fold, 'cutoff': cutoff, 'model': name,
+                'date': actual.index, 'y': actual.to_numpy(dtype=float), 'yhat': yhat.to_numpy(),
+            }))
+    return pd.concat(rows, ignore_index=True) if rows else None
+
+
+def score(residuals: pd.DataFrame, keys: list | None = None) -> pd.DataFrame:
+    """MAE, WAPE, bias and zero-safe MAPE per group, from one groupby-sum.
+
+    MAPE averages only over days with non-zero actuals (NaN if there are
+    none) instead of replacing zeros with 1; WAPE is NaN when all actuals are 0.
+    """
+    keys = keys or SERIES_KEYS + ['fold', 'cutoff', 'model']
+    y = residuals['y'].to_numpy(dtype=float)
+    err = residuals['yhat'].to_numpy(dtype=float) - y
+    nonzero = y != 0
+    parts = residuals[keys].assign(
+        n=1, abs_err=np.abs(err), err=err, abs_y=np.abs(y), nonzero=nonzero,
+        ape=np.divide(np.abs(err), np.abs(y), out=np.zeros_like(y), where=nonzero),
+    )
+    sums = parts.groupby(keys, sort=True).sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        metrics = pd.DataFrame({
+            'n': sums['n'],
+            'mae': sums['abs_err'] / sums['n'],
+            'wape': np.where(sums['abs_y'] > 0, sums['abs_err'] / sums['abs_y'], np.nan),
+            'bias': sums['err'] / sums['n'],
+            'mape': np.where(sums['nonzero'] > 0, sums['ape'] / sums['nonzero'], np.nan),
+        }, index=sums.index)
+    return metrics.reset_index()
+
+
+def run_backtest(df: pd.DataFrame, n_folds: int = DEFAULT_FOLDS, horizon: int = DEFAULT_HORIZON,
+                 step: int | None = None, n_jobs: int = 1, save_residuals: bool = False,
+                 coverage: float = DEFAULT_COVERAGE, interval_method: str = 'conformal') -> pd.DataFrame:
+    """Rolling-origin backtest of the local ML model and the SMA baseline.
+
+    Features are computed once for the whole panel; each fold slices them
+    by date and forecasts its horizon recursively, like production. Series
+    run in a process pool (all of a series' folds in one task), and results
+    come back in submission order, so the output doesn't depend on n_jobs.
+    Writes backtest_metrics.csv (one row per series/fold/model) and the
+    per-step interval offsets the forecast stage turns into yhat_lower/upper
+    (see pipeline.intervals).
+    """
+    print(f"Backtesting {n_folds} rolling origins, {horizon}-day horizon...")
+    with stage('backtest') as record:
+        record['rows_in'] = len(df)
+        df = add_features(df, FEATURE_CONFIG)
+        cutoffs = rolling_origins(df['date'].max(), n_folds, horizon, step)
+        groups = df.groupby(SERIES_KEYS)
+        if n_jobs == 1:
+            results = [_backtest_series(channel, sku, group, cutoffs, horizon) for (channel, sku), group in groups]
+        else:
+            results = Parallel(n_jobs=n_jobs, batch_size='auto')(
+                delayed(_backtest_series)(channel, sku, group, cutoffs, horizon) for (channel, sku), group in groups
+            )
+        results = [r for r in results if r is not None]
+        residuals = pd.concat(results, ignore_index=True) if results else pd.DataFrame(
+            columns=SERIES_KEYS + ['fold', 'cutoff', 'model', 'date', 'y', 'yhat'])
+        metrics = score(residuals)
+
+        metrics.to_csv(BACKTEST_METRICS_PATH, index=False)
+        interval_offsets(residuals, coverage, interval_method).to_csv(INTERVALS_PATH, index=False)
+        if save_residuals:
+            residuals.to_csv(BACKTEST_RESIDUALS_PATH, index=False)
+        record['rows_out'] = len(metrics)
+        record['folds'] = n_folds
+
+    if not residuals.empty:
+        overall = score(residuals, keys=['model'])
+        for row in overall.itertuples():
+            print(f"  {row.model:<13} MAE {row.mae:.2f}  WAPE {row.wape:.3f}  bias {row.bias:+.2f}  MAPE {row.mape:.3f}")
+    print("Backtest complete.")
+    return metrics
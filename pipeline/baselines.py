@@ -0,0 +1,150 @@
+import numpy as np
+
+# Statistical baselines over a (n_series, n_days) matrix of daily units, as
+# built by panel_matrix. Days before a series' first sale are NaN, so every
+# method only looks at each series' own history. Each method returns a
+# (n_series, horizon) forecast matrix computed for all series at once.
+
+METHODS = ('seasonal_naive', 'sma', 'wma', 'ses', 'croston', 'sba')
+# model_version written to forecast_daily.csv for each method
+MODEL_NAMES = {
+    'seasonal_naive': 'SeasonalNaive',
+    'sma': 'Baseline_SMA',
+    'wma': 'Baseline_WMA',
+    'ses': 'SES',
+    'croston': 'Croston',
+    'sba': 'SBA',
+}
+SEASON = 7
+WINDOW = 7
+SES_ALPHA = 0.2
+CROSTON_ALPHA = 0.1
+# Syntetos-Boylan: above this average inter-demand interval a series is
+# intermittent and Croston-type methods beat smoothing the zeros
+ADI_CUTOFF = 1.32
+
+
+def panel_matrix(panel, col: str = 'units_sold') -> np.ndarray:
+    """Float copy of a SalesPanel value matrix with pre-launch days as NaN."""
+    Y = panel.values[col].astype(float)
+    Y[np.arange(panel.n_days)[None, :] < panel.first_day[:, None]] = np.nan
+    return Y
+
+
+def _flat(level: np.ndarray, horizon: int) -> np.ndarray:
+    return np.repeat(np.nan_to_num(level)[:, None], horizon, axis=1)
+
+
+def _weighted_mean(values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    observed = ~np.isnan(values)
+    w = np.where(observed, weights, 0.0)
+    total = w.sum(axis=1)
+    return np.divide((w * np.nan_to_num(values)).sum(axis=1), total,
+                     out=np.full(len(values), np.nan), where=total > 0)
+
+
+def _ses_level(values: np.ndarray, events: np.ndarray, alpha: float) -> np.ndarray:
+    """Final level of simple exponential smoothing over each row's events.
+
+    With the level initialised to the first event x_1, SES over m events
+    ends at sum_j alpha (1 - alpha)^r_j x_j + (1 - alpha)^m x_1, where r_j
+    is the event's rank from the end. That is one weighted sum per row
+    instead of a Python loop over days. NaN for rows without events.
+    """
+    rank = np.cumsum(events[:, ::-1], axis=1)[:, ::-1] - 1
+    # exp/log rather than ** : float power is several times slower over the full matrix
+    weights = np.where(events, alpha * np.exp(np.maximum(rank, 0) * np.log1p(-alpha)), 0.0)
+    m = events.sum(axis=1)
+    first = np.take_along_axis(np.nan_to_num(values), events.argmax(axis=1)[:, None], axis=1)[:, 0]
+    level = (weights * np.nan_to_num(values)).sum(axis=1) + (1 - alpha) ** m * first
+    return np.where(m > 0, level, np.nan)
+
+
+def seasonal_naive(Y: np.ndarray, horizon: int, season: int = SEASON) -> np.ndarray:
+    """Repeat the last full season; gaps fall back to the series mean."""
+    last = Y[:, -season:]
+    if last.shape[1] < season:
+        last = np.hstack([np.full((len(Y), season - last.shape[1]), np.nan), last])
+    # Day h of the horizon shares its weekday with position h % season of the last season
+    F = last[:, np.arange(horizon) % season]
+    fallback = _flat(_weighted_mean(Y, np.ones(Y.shape[1])), horizon)
+    return np.where(np.isnan(F), fallback, F)
+
+
+def sma(Y: np.ndarray, horizon: int, window: int = WINDOW) -> np.ndarray:
+    return _flat(_weighted_mean(Y[:, -window:], np.ones(min(window, Y.shape[1]))), horizon)
+
+
+def wma(Y: np.ndarray, horizon: int, window: int = WINDOW) -> np.ndarray:
+    """Linearly weighted moving average, newest day weighted `window`."""
+    tail = Y[:, -window:]
+    return _flat(_weighted_mean(tail, np.arange(1, tail.shape[1] + 1, dtype=float)), horizon)
+
+
+def ses(Y: np.ndarray, horizon: int, alpha: float = SES_ALPHA) -> np.ndarray:
+    return _flat(_ses_level(Y, ~np.isnan(Y), alpha), horizon)
+
+
+def croston(Y: np.ndarray, horizon: int, alpha: float = CROSTON_ALPHA, sba: bool = False) -> np.ndarray:
+    """Croston's method: smooth demand sizes and inter-demand intervals separately.
+
+    sba=True applies the Syntetos-Boylan (1 - alpha/2) bias correction.
+    Series that never sold forecast 0.
+    """
+    n, T = Y.shape
+    demand = np.nan_to_num(Y) > 0
+    idx = np.arange(T)
+    started = ~np.isnan(Y)
+    start = np.where(started.any(axis=1), started.argmax(axis=1), 0)
+    # Interval since the previous demand (or since launch for the first one)
+    last_event = np.maximum.accumulate(np.where(demand, idx, -1), axis=1)
+    prev = np.hstack([np.full((n, 1), -1), last_event[:, :-1]])
+    interval = np.where(prev >= 0, idx - prev, idx - start[:, None] + 1).astype(float)
+
+    size = _ses_level(Y, demand, alpha)
+    period = _ses_level(interval, demand, alpha)
+    rate = np.divide(size, period, out=np.zeros(n), where=demand.any(axis=1))
+    if sba:
+        rate = rate * (1 - alpha / 2)
+    return _flat(rate, horizon)
+
+
+def sba(Y: np.ndarray, horizon: int, alpha: float = CROSTON_ALPHA) -> np.ndarray:
+    return croston(Y, horizon, alpha=alpha, sba=True)
+
+
+def adi(Y: np.ndarray) -> np.ndarray:
+    """Average inter-demand interval: observed days per day with demand (inf if none)."""
+    observed = (~np.isnan(Y)).sum(axis=1)
+    demand_days = (np.nan_to_num(Y) > 0).sum(axis=1)
+    return np.divide(observed, demand_days, out=np.full(len(Y), np.inf), where=demand_days > 0)
+
+
+def select_methods(Y: np.ndarray) -> np.ndarray:
+    """SBA for intermittent series (ADI above ADI_CUTOFF), SMA otherwise."""
+    return np.where(adi(Y) > ADI_CUTOFF, 'sba', 'sma')
+
+
+_FUNCTIONS = {
+    'seasonal_naive': seasonal_naive, 'sma': sma, 'wma': wma, 'ses': ses, 'croston': croston, 'sba': sba,
+}
+
+
+def forecast_matrix(Y: np.ndarray, horizon: int, method: str = 'auto'):
+    """Forecast every series with one method, or per-series with 'auto'.
+
+    Returns (F, methods): the (n_series, horizon) forecast, clipped at 0,
+    and the method used for each series.
+    """
+    if method == 'auto':
+        methods = select_methods(Y)
+        F = np.zeros((len(Y), horizon))
+        for m in np.unique(methods):
+            rows = methods == m
+            F[rows] = _FUNCTIONS[m](Y[rows], horizon)
+    elif method in _FUNCTIONS:
+        methods = np.full(len(Y), method)
+        F = _FUNCTIONS[method](Y, horizon)
+    else:
+        raise ValueError(f"Unknown baseline {method!r}, expected 'auto' or one of {METHODS}")
+    return np.maximum(F, 0), methods
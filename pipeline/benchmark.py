@@ -0,0 +1,156 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import sklearn
+
+# Generator configs per scale factor, relative to the demo dataset
+# (5 stores x 5 SKUs x 365 days, ~8k raw rows)
+SCALES = {
+    '1x': {'n_stores': 5, 'n_skus': 5},
+    '10x': {'n_stores': 10, 'n_skus': 25},
+    '100x': {'n_stores': 50, 'n_skus': 50},
+    '1000x': {'n_stores': 200, 'n_skus': 125},
+}
+DEFAULT_THRESHOLD = 0.25
+
+
+def _measure(fn, repeats: int):
+    """Median/min wall time over `repeats` runs, then one traced run for peak memory.
+
+    Timing runs don't trace allocations, so tracemalloc overhead never shows
+    up in the seconds.
+    """
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {
+        'seconds': round(statistics.median(times), 5),
+        'min_seconds': round(min(times), 5),
+        'repeats': repeats,
+        'peak_mb': round(peak / 2**20, 2),
+    }
+
+
+def run_scale(scale: str, repeats: int = 3, seed: int = 42, engine: str = 'local') -> dict:
+    """Generate inputs for one scale factor in a scratch dir and time every stage."""
+    from pipeline import generate_data
+    from pipeline.ingest import ingest_and_validate
+    from pipeline.transform import create_fact_sales_daily, add_features
+    from pipeline.panel import build_panel
+    from pipeline.forecast import train_forecast_model
+    from pipeline.plan import generate_production_plan
+    from pipeline.storage import write_curated
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix=f"bench_{scale}_")
+    results = {}
+    try:
+        os.chdir(workdir)
+        for d in ('data/raw', 'data/curated', 'data/outputs'):
+            os.makedirs(d)
+        # The pipeline prints progress; keep benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_data.main(seed=seed, end_date='2024-12-31', **SCALES[scale])
+
+            (sku_map, pos, ecom, inv), results['ingest_and_validate'] = _measure(ingest_and_validate, repeats)
+            results['ingest_and_validate']['rows'] = len(pos) + len(ecom)
+
+            fact, results['create_fact_sales_daily'] = _measure(
+                lambda: create_fact_sales_daily(pos.copy(), ecom.copy()), repeats)
+            results['create_fact_sales_daily']['rows'] = len(fact)
+
+            fact = fact.merge(sku_map[['sku', 'category']], on='sku', how='left')
+            frame = build_panel(fact, attrs=['category']).to_frame()
+            model_input, results['add_features'] = _measure(lambda: add_features(frame), repeats)
+            results['add_features']['rows'] = len(model_input)
+
+            # Model fitting dominates; one timed run is enough to spot regressions
+            _, results['train_forecast_model'] = _measure(
+                lambda: train_forecast_model(model_input, engine=engine, refit='always'), 1)
+            results['train_forecast_model']['rows'] = len(model_input)
+            results['train_forecast_model']['series'] = int(model_input.groupby(['channel', 'sku']).ngroups)
+
+            write_curated(inv, 'fact_inventory_daily', export_csv=False)
+            write_curated(sku_map, 'dim_product', export_csv=False)
+            plan, results['generate_production_plan'] = _measure(generate_production_plan, repeats)
+            results['generate_production_plan']['rows'] = len(plan)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def run_benchmarks(scales: list, repeats: int = 3, seed: int = 42, engine: str = 'local') -> dict:
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'sklearn': sklearn.__version__,
+            'seed': seed,
+            'engine': engine,
+        },
+        'results': {},
+    }
+    for scale in scales:
+        print(f"Benchmarking scale {scale}...")
+        report['results'][scale] = run_scale(scale, repeats=repeats, seed=seed, engine=engine)
+        for name, res in report['results'][scale].items():
+            print(f"  {name:<26} {res['seconds']:>9.4f}s  peak {res['peak_mb']:>8.1f} MB  rows {res.get('rows', '')}")
+    return report
+
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """Benchmarks that got slower (or used more memory) than baseline by more than `threshold`.
+
+    Only scale/benchmark pairs present in both reports are compared.
+    """
+    regressions = []
+    for scale, benches in current['results'].items():
+        for name, res in benches.items():
+            base = baseline.get('results', {}).get(scale, {}).get(name)
+            if not base:
+                continue
+            for metric in ('seconds', 'peak_mb'):
+                if base[metric] > 0 and res[metric] > base[metric] * (1 + threshold):
+                    regressions.append({
+                        'scale': scale,
+                        'benchmark': name,
+                        'metric': metric,
+                        'baseline': base[metric],
+                        'current': res[metric],
+                        'change': round(res[metric] / base[metric] - 1, 3),
+                    })
+    return regressions
+
+
+def save(report: dict, path: str):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
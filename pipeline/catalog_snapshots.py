@@ -0,0 +1,140 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from pipeline.collective_arts_collect import ROOT, add_to_summary, empty_summary
+
+SNAPSHOT_DB = ROOT / "data" / "curated" / "catalog_snapshots.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    run_at TEXT NOT NULL,
+    added INTEGER NOT NULL,
+    changed INTEGER NOT NULL,
+    removed INTEGER NOT NULL,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS product_changes (
+    product_id TEXT NOT NULL,
+    valid_from TEXT NOT NULL,
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    removed INTEGER NOT NULL DEFAULT 0,
+    available INTEGER,
+    price_from REAL,
+    digest TEXT,
+    record TEXT,
+    PRIMARY KEY (product_id, valid_from)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS product_changes_valid_from ON product_changes (valid_from);
+"""
+
+
+def record_digest(item: dict) -> str:
+    return hashlib.sha256(json.dumps(item, sort_keys=True).encode()).hexdigest()
+
+
+def _as_of_bound(as_of: str) -> str:
+    # A bare date covers every run on that day
+    return f"{as_of}T23:59:59Z" if len(as_of) == 10 else as_of
+
+
+class CatalogSnapshots:
+    """Append-only catalog history: one row per product per change.
+
+    Each run stores only products that were added, changed (different
+    record digest) or removed since the latest state, keyed by
+    (product_id, valid_from), so the catalog as of any time is the newest
+    row per product at or before it. The run's summary is the previous
+    one adjusted by those changes alone (add_to_summary), never a pass
+    over the full catalog. available and price_from are kept as columns
+    for sold-out / price history queries.
+    """
+
+    def __init__(self, path: Path = SNAPSHOT_DB):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _latest(self, as_of: str | None = None) -> dict:
+        bound = _as_of_bound(as_of) if as_of else "9999"
+        rows = self.conn.execute(
+            """
+            SELECT c.product_id, c.digest, c.record
+            FROM product_changes c
+            JOIN (SELECT product_id, MAX(valid_from) AS valid_from FROM product_changes
+                  WHERE valid_from <= ? GROUP BY product_id) latest
+              ON latest.product_id = c.product_id AND latest.valid_from = c.valid_from
+            WHERE c.removed = 0
+            """,
+            (bound,),
+        )
+        return {product_id: (digest, record) for product_id, digest, record in rows}
+
+    def as_of(self, as_of: str | None = None) -> list:
+        """Catalog items as they stood at `as_of` (ISO date or timestamp; default latest)."""
+        items = [json.loads(record) for _, record in self._latest(as_of).values()]
+        return sorted(items, key=lambda item: item.get("title") or "")
+
+    def summary(self, as_of: str | None = None) -> dict:
+        """Summary stored with the last run at or before `as_of`, or None."""
+        bound = _as_of_bound(as_of) if as_of else "9999"
+        row = self.conn.execute(
+            "SELECT summary FROM runs WHERE run_at <= ? ORDER BY run_at DESC, run_id DESC LIMIT 1", (bound,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def history(self, product_id: str) -> list:
+        """Every recorded change of one product, oldest first."""
+        rows = self.conn.execute(
+            "SELECT valid_from, removed, available, price_from FROM product_changes "
+            "WHERE product_id = ? ORDER BY valid_from",
+            (str(product_id),),
+        )
+        return [{"valid_from": v, "removed": bool(r), "available": None if a is None else bool(a), "price_from": p}
+                for v, r, a, p in rows]
+
+    def record(self, catalog: list, run_at: str | None = None) -> dict:
+        """Store one collection run; returns its change counts and summary."""
+        run_at = run_at or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        previous = self._latest()
+        summary = self.summary() or empty_summary(run_at)
+        summary["updated_at"] = run_at
+
+        current = {str(item["id"]): item for item in catalog}
+        changes, counts = [], {"added": 0, "changed": 0, "removed": 0}
+        for product_id, item in current.items():
+            digest = record_digest(item)
+            if product_id in previous:
+                old_digest, old_record = previous[product_id]
+                if old_digest == digest:
+                    continue
+                add_to_summary(summary, json.loads(old_record), -1)
+                counts["changed"] += 1
+            else:
+                counts["added"] += 1
+            add_to_summary(summary, item)
+            changes.append((product_id, run_at, 0, int(bool(item.get("available"))), item.get("price_from"),
+                            digest, json.dumps(item, sort_keys=True)))
+        for product_id in previous.keys() - current.keys():
+            add_to_summary(summary, json.loads(previous[product_id][1]), -1)
+            counts["removed"] += 1
+            changes.append((product_id, run_at, 1, None, None, None, None))
+
+        with self.conn:
+            run_id = self.conn.execute(
+                "INSERT INTO runs (run_at, added, changed, removed, summary) VALUES (?, ?, ?, ?, ?)",
+                (run_at, counts["added"], counts["changed"], counts["removed"], json.dumps(summary)),
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO product_changes "
+                "(product_id, valid_from, removed, available, price_from, digest, record, run_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [change + (run_id,) for change in changes],
+            )
+        return {"run_id": run_id, **counts, "summary": summary}
@@ -1,62 +1,224 @@
 
 import click
 from pipeline.ingest import ingest_and_validate
-from pipeline.transform import run_transform
-from pipeline.forecast import train_forecast_model
-from pipeline.plan import generate_production_plan
-from pipeline import generate_data
-import shutil
+from pipeline.plan import SAFETY_FACTOR, MOQ
+from pipeline.simulation import DEFAULT_PATHS, SERVICE_METRICS
+from pipeline.baselines import METHODS
+from pipeline.registry import REFIT_POLICIES
+from pipeline.hierarchy import RECONCILE_METHODS
+from pipeline.stages import (
+    FORECAST_OUTPUTS, STORE_FORECAST_OUTPUTS, GRANULARITIES, generate_stage, transform_stage, forecast_stage, plan_stage, schedule_stage,
+    store_transform_stage, store_forecast_stage,
+)
+from pipeline.schedule import LINES_PATH, SOLVERS, TIME_LIMIT
+from pipeline.profiling import StageProfiler, activate, stage
+from pipeline.publish import DASHBOARD_DATA_DIR, build_artifacts, write_artifacts
+from pipeline import serve
 import os
 import json
 from datetime import datetime
 
+REPORT_PATH = "data/outputs/pipeline_report.json"
+PROFILE_DIR = "data/profiles"
+
+INCREMENTAL_OPTION = click.option('--incremental', is_flag=True, help="Transform only rows appended since the last run and re-feature just the months they touch")
+FORCE_OPTION = click.option('--force', is_flag=True, help="Recompute even if inputs, code and parameters are unchanged")
+N_JOBS_OPTION = click.option('--n-jobs', default=1, show_default=True, help="Worker processes for per-series training (-1 = all cores)")
+ENGINE_OPTION = click.option('--engine', type=click.Choice(['local', 'global', 'baseline']), default='local', show_default=True, help="Per-series GBRs, one cross-series model, or statistical baselines only")
+REFIT_OPTION = click.option('--refit', type=click.Choice(REFIT_POLICIES), default='changed', show_default=True, help="Which stored models to refit: always, changed data, drifted error, or never (predict-only)")
+RECONCILE_OPTION = click.option('--reconcile', type=click.Choice(['none', *RECONCILE_METHODS]), default='none', show_default=True, help="Make forecasts coherent across total/channel/category/sku")
+GRANULARITY_OPTION = click.option('--granularity', type=click.Choice(GRANULARITIES), default='channel', show_default=True, help="Series grain: channel x sku, or store x channel x sku (baseline engine, batched)")
+BATCH_OPTION = click.option('--batch-size', default=None, type=int, help="Series per batch for store-level forecasts (default 5000)")
+BASELINE_OPTION = click.option('--baseline-method', type=click.Choice(['auto', *METHODS]), default='auto', show_default=True, help="Baseline for --engine baseline and the ML fallback (auto = SBA for intermittent series, else SMA)")
+HORIZON_OPTION = click.option('--horizon', default=7, show_default=True, help="Days to forecast ahead (recursive, e.g. 91 for 13 weeks)")
+SAFETY_OPTION = click.option('--safety-factor', default=SAFETY_FACTOR, show_default=True, help="Safety stock as a share of forecast demand")
+MOQ_OPTION = click.option('--moq', default=MOQ, show_default=True, help="Minimum order quantity to round production to")
+SERVICE_LEVEL_OPTION = click.option('--service-level', default=None, type=click.FloatRange(0, 1, min_open=True, max_open=True), help="Size safety stock by Monte Carlo simulation to hit this service level (replaces --safety-factor)")
+SERVICE_METRIC_OPTION = click.option('--service-metric', type=click.Choice(SERVICE_METRICS), default='cycle', show_default=True, help="Service level as P(no stockout per cycle) or fill rate")
+PATHS_OPTION = click.option('--paths', default=DEFAULT_PATHS, show_default=True, help="Simulated demand paths per SKU for --service-level")
+SOLVER_OPTION = click.option('--solver', type=click.Choice(SOLVERS), default='auto', show_default=True, help="Line scheduling: MILP (HiGHS) when small enough, greedy heuristic, or both and keep the cheaper")
+TIME_LIMIT_OPTION = click.option('--time-limit', default=TIME_LIMIT, show_default=True, help="Seconds the scheduling MILP may run")
+LINES_OPTION = click.option('--lines', 'lines_path', default=LINES_PATH, show_default=True, help="Line capacities, sku compatibility and changeover times (CSV; default: one line per pack size)")
+
 @click.group()
 def cli():
     """Beer Demand Planning Pipeline CLI"""
     pass
 
+@cli.command()
+@click.option('--stores', 'n_stores', default=5, show_default=True, type=int)
+@click.option('--skus', 'n_skus', default=5, show_default=True, type=int)
+@click.option('--days', default=365, show_default=True, type=int)
+@click.option('--end-date', default=None, help="Last day of history (YYYY-MM-DD, default today)")
+@click.option('--sparsity', default=0.0, show_default=True, help="Share of store/sku/days with no sale")
+@click.option('--promo-rate', default=0.05, show_default=True)
+@click.option('--negative-rate', default=0.01, show_default=True)
+@click.option('--duplicate-rate', default=0.003, show_default=True)
+@click.option('--unknown-sku-rate', default=0.0, show_default=True)
+@click.option('--seed', default=42, show_default=True, type=int)
+@click.option('--out-dir', default="data/raw", show_default=True)
+def generate(**config):
+    """Generate synthetic raw data (vectorized, chunked, seeded)"""
+    from pipeline import generate_data
+    generate_data.main(**config)
+
 @cli.command()
 def ingest():
     """Ingest and validate data"""
     ingest_and_validate()
 
 @cli.command()
-def transform():
+@INCREMENTAL_OPTION
+@GRANULARITY_OPTION
+@FORCE_OPTION
+def transform(incremental, granularity, force):
     """Run cleaning and transformation"""
-    run_transform()
+    if granularity == 'store':
+        store_transform_stage(force=force)
+    else:
+        transform_stage(force=force, incremental=incremental)
 
 @cli.command()
-def forecast():
+@N_JOBS_OPTION
+@ENGINE_OPTION
+@HORIZON_OPTION
+@BASELINE_OPTION
+@REFIT_OPTION
+@RECONCILE_OPTION
+@GRANULARITY_OPTION
+@BATCH_OPTION
+@INCREMENTAL_OPTION
+@FORCE_OPTION
+def forecast(n_jobs, engine, horizon, baseline_method, refit, reconcile, granularity, batch_size, incremental, force):
     """Run forecasting models"""
-    df, _, _ = run_transform() # ensure we have latest curated
-    train_forecast_model(df)
+    if granularity == 'store':
+        _store_forecast(engine, horizon, baseline_method, batch_size, force)
+        return
+    # Upstream transform is reused from cache when the raw data hasn't changed
+    (df, _, _), _ = transform_stage(incremental=incremental)
+    forecast_stage(df, engine=engine, n_jobs=n_jobs, horizon=horizon, baseline_method=baseline_method,
+                   refit=refit, reconcile=reconcile, force=force)
+
+def _store_forecast(engine, horizon, baseline_method, batch_size, force):
+    if engine != 'baseline':
+        print(f"Store granularity forecasts with the baseline engine (--engine {engine} ignored)")
+    (panel, _, _), ran_transform = store_transform_stage(force=force)
+    _, ran_forecast = store_forecast_stage(panel, horizon=horizon, baseline_method=baseline_method,
+                                           batch_size=batch_size, force=force)
+    return ran_transform, ran_forecast
+
+@cli.command()
+@click.option('--folds', default=4, show_default=True, help="Rolling forecast origins per series")
+@HORIZON_OPTION
+@click.option('--step', default=None, type=int, help="Days between origins (default: the horizon)")
+@N_JOBS_OPTION
+@click.option('--residuals', is_flag=True, help="Also write per-day residuals to data/outputs/backtest_residuals.csv")
+@click.option('--coverage', default=0.8, show_default=True, help="Target coverage of the forecast intervals")
+@click.option('--interval-method', type=click.Choice(['conformal', 'quantile']), default='conformal', show_default=True, help="Symmetric split-conformal bands or empirical error quantiles")
+def backtest(folds, horizon, step, n_jobs, residuals, coverage, interval_method):
+    """Rolling-origin backtest of the forecast models"""
+    from pipeline.backtest import run_backtest
+    (df, _, _), _ = transform_stage()
+    run_backtest(df, n_folds=folds, horizon=horizon, step=step, n_jobs=n_jobs, save_residuals=residuals,
+                 coverage=coverage, interval_method=interval_method)
+
+def _plan_params(safety_factor, moq, service_level, service_metric, paths):
+    params = {'safety_factor': safety_factor, 'moq': moq}
+    if service_level is not None:
+        params.update(service_level=service_level, service_metric=service_metric, paths=paths)
+    return params
 
 @cli.command()
-def plan():
+@SAFETY_OPTION
+@MOQ_OPTION
+@SERVICE_LEVEL_OPTION
+@SERVICE_METRIC_OPTION
+@PATHS_OPTION
+@GRANULARITY_OPTION
+@FORCE_OPTION
+def plan(safety_factor, moq, service_level, service_metric, paths, granularity, force):
     """Generate production plan"""
-    generate_production_plan()
+    plan_stage(_plan_params(safety_factor, moq, service_level, service_metric, paths), force=force,
+               granularity=granularity)
 
 @cli.command()
-def run_all():
+@click.argument('spec_path', type=click.Path(exists=True, dir_okay=False))
+@GRANULARITY_OPTION
+def scenarios(spec_path, granularity):
+    """Compare planning what-ifs (JSON list of scenarios and/or a grid)"""
+    from pipeline.scenarios import run_scenarios
+    with open(spec_path) as f:
+        spec = json.load(f)
+    forecast_path = STORE_FORECAST_OUTPUTS[0] if granularity == 'store' else FORECAST_OUTPUTS[0]
+    table = run_scenarios(spec, forecast_path=forecast_path)
+    click.echo(table.to_string(index=False))
+
+@cli.command()
+@MOQ_OPTION
+@SOLVER_OPTION
+@TIME_LIMIT_OPTION
+@LINES_OPTION
+@FORCE_OPTION
+def schedule(moq, solver, time_limit, lines_path, force):
+    """Schedule the production plan onto lines within capacity"""
+    schedule_stage({'moq': moq, 'solver': solver, 'time_limit': time_limit, 'lines_path': lines_path}, force=force)
+
+@cli.command()
+@N_JOBS_OPTION
+@ENGINE_OPTION
+@HORIZON_OPTION
+@BASELINE_OPTION
+@REFIT_OPTION
+@RECONCILE_OPTION
+@GRANULARITY_OPTION
+@BATCH_OPTION
+@INCREMENTAL_OPTION
+@SAFETY_OPTION
+@MOQ_OPTION
+@SERVICE_LEVEL_OPTION
+@SERVICE_METRIC_OPTION
+@PATHS_OPTION
+@click.option('--schedule', 'with_schedule', is_flag=True, help="Also schedule the plan onto production lines")
+@SOLVER_OPTION
+@TIME_LIMIT_OPTION
+@LINES_OPTION
+@FORCE_OPTION
+@click.option('--profile', is_flag=True, help=f"Dump a cProfile per stage to {PROFILE_DIR}")
+def run_all(n_jobs, engine, horizon, baseline_method, refit, reconcile, granularity, batch_size, incremental, safety_factor, moq,
+            service_level, service_metric, paths, with_schedule, solver, time_limit, lines_path, force, profile):
     """Run the full pipeline end-to-end"""
     start = datetime.now()
     print("Starting full pipeline run...")
+    profiler = StageProfiler(PROFILE_DIR if profile else None)
     
-    # 0. Generate Data (for demo purposes we regen to keep it fresh or ensure existence)
-    # in real prod we wouldn't regen, but this is a self-contained demo
-    os.system("python pipeline/generate_data.py")
-    
-    # 1. Ingest & Validate
-    ingest_and_validate()
-    
-    # 2. Transform
-    df, _, _ = run_transform()
-    
-    # 3. Forecast
-    train_forecast_model(df)
-    
-    # 4. Plan
-    generate_production_plan()
+    with activate(profiler):
+        # 0. Generate Data (for demo purposes we regen to keep it fresh or ensure existence)
+        # in real prod we wouldn't regen, but this is a self-contained demo.
+        # Cached per day, so re-runs on the same day keep the same raw data.
+        _, ran_generate = generate_stage(force=force)
+        
+        if granularity == 'store':
+            # 1-3. Store-level panel and batched forecast
+            ran_transform, ran_forecast = _store_forecast(engine, horizon, baseline_method, batch_size, force)
+        else:
+            # 1-2. Ingest & Validate, Transform
+            (df, _, _), ran_transform = transform_stage(force=force, incremental=incremental)
+            
+            # 3. Forecast
+            _, ran_forecast = forecast_stage(df, engine=engine, n_jobs=n_jobs, horizon=horizon,
+                                             baseline_method=baseline_method, refit=refit, reconcile=reconcile,
+                                             force=force)
+        
+        # 4. Plan
+        _, ran_plan = plan_stage(_plan_params(safety_factor, moq, service_level, service_metric, paths), force=force,
+                                 granularity=granularity)
+
+        # 4b. Schedule (optional)
+        steps = [("generate", ran_generate), ("transform", ran_transform), ("forecast", ran_forecast), ("plan", ran_plan)]
+        if with_schedule:
+            _, ran_schedule = schedule_stage({'moq': moq, 'solver': solver, 'time_limit': time_limit,
+                                              'lines_path': lines_path}, force=force)
+            steps.append(("schedule", ran_schedule))
     
     # 5. Report
     end = datetime.now()
@@ -66,29 +228,86 @@ def run_all():
         "status": "success",
         "runtime_seconds": duration,
         "timestamp": start.isoformat(),
-        "steps": ["generate", "ingest", "transform", "forecast", "plan"]
+        "steps": ["generate", "ingest", "transform", "forecast", "plan"] + (["schedule"] if with_schedule else []),
+        "cached_steps": [name for name, ran in steps if not ran],
+        "stages": profiler.report(),
     }
     
-    with open("data/outputs/pipeline_report.json", "w") as f:
+    with open(REPORT_PATH, "w") as f:
         json.dump(report, f, indent=2)
         
     print(f"Pipeline finished in {duration:.2f} seconds.")
 
+@cli.command()
+@click.option('--scales', default='1x,10x', show_default=True, help="Comma-separated scale factors to run (1x, 10x, 100x, 1000x)")
+@click.option('--repeats', default=3, show_default=True, help="Timed runs per benchmark (median is reported)")
+@ENGINE_OPTION
+@click.option('--output', default=None, help="Write results JSON here (default benchmarks/results/<timestamp>.json)")
+@click.option('--compare', 'baseline_path', default=None, help="Baseline JSON to check for regressions")
+@click.option('--threshold', default=0.25, show_default=True, help="Allowed slowdown / memory growth vs baseline")
+def benchmark(scales, repeats, engine, output, baseline_path, threshold):
+    """Time every pipeline stage at several data scales"""
+    from pipeline import benchmark as bench
+    names = [s.strip() for s in scales.split(',') if s.strip()]
+    unknown = [s for s in names if s not in bench.SCALES]
+    if unknown:
+        raise click.BadParameter(f"unknown scale(s) {unknown}, choose from {list(bench.SCALES)}", param_hint='--scales')
+
+    report = bench.run_benchmarks(names, repeats=repeats, engine=engine)
+    output = output or os.path.join("benchmarks", "results", f"{datetime.now():%Y%m%dT%H%M%S}.json")
+    bench.save(report, output)
+    print(f"Benchmark results written to {output}")
+
+    if baseline_path:
+        regressions = bench.compare(report, bench.load(baseline_path), threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['scale']} {r['benchmark']} {r['metric']}: "
+                  f"{r['baseline']} -> {r['current']} (+{r['change']:.0%})")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions beyond {threshold:.0%} against {baseline_path}")
+
 @cli.command()
 def publish():
     """Publish outputs to dashboard data directory"""
-    print("Publishing data to dashboard...")
-    dest_dir = "dashboard/public/data"
-    os.makedirs(dest_dir, exist_ok=True)
-    
-    # Copy all outputs
-    src_dir = "data/outputs"
-    for f in os.listdir(src_dir):
-        shutil.copy(os.path.join(src_dir, f), dest_dir)
-        
-    # Copy curated helpers if needed
-    shutil.copy("data/curated/dim_product.csv", dest_dir)
-    pass
+    profiler = StageProfiler()
+    with activate(profiler), stage('publish') as record:
+        print("Publishing data to dashboard...")
+        artifacts = build_artifacts()
+        stats = write_artifacts(artifacts, DASHBOARD_DATA_DIR)
+        record['rows_out'] = len(artifacts)  # artifacts published
+        record.update(stats)
+    print(f"Published {len(artifacts)} artifacts to {DASHBOARD_DATA_DIR}: {stats['written']} written, "
+          f"{stats['unchanged']} unchanged, {stats['removed']} stale files removed "
+          f"({stats['gzip_bytes'] / 1024:.1f} KiB gzipped)")
+
+    # Add the publish stage to the last run's report
+    if os.path.exists(REPORT_PATH):
+        with open(REPORT_PATH) as f:
+            report = json.load(f)
+        report.setdefault("stages", {}).update(profiler.report())
+        with open(REPORT_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+
+@cli.command('serve')
+@click.option('--host', default=serve.HOST, show_default=True)
+@click.option('--port', default=serve.PORT, show_default=True, type=int)
+@click.option('--cache-size', default=serve.CACHE_SIZE, show_default=True, help="Responses kept in the LRU cache")
+@click.option('--reload-interval', default=serve.RELOAD_INTERVAL, show_default=True, help="Seconds between checks for a new run")
+def serve_api(host, port, cache_size, reload_interval):
+    """Serve forecasts and plans over HTTP from an in-memory index"""
+    service = serve.ReadService(cache_size=cache_size)
+    service.watch(reload_interval)
+    server = serve.make_server(service, host, port)
+    print(f"Serving {service.index.rows['forecast']} forecast and {service.index.rows['plan']} plan rows "
+          f"on http://{host}:{server.server_port} (/forecast?sku=&days=, /plan?week=, /skus, /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
 
 if __name__ == "__main__":
     cli()
@@ -1,25 +1,39 @@
+import asyncio
+import hashlib
 import json
+import os
 import re
+import threading
 import time
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
 from pathlib import Path
-from typing import Dict, List, Optional, Set
-from urllib.error import HTTPError, URLError
-from urllib.request import Request, urlopen
+from urllib.parse import urlsplit
 
 ROOT = Path(__file__).resolve().parents[1]
 DATA_SOURCES_PATH = ROOT / "DATA_SOURCES.md"
 OUTPUT_DIR = ROOT / "dashboard" / "public" / "data"
+HTTP_CACHE_DIR = ROOT / "data" / ".cache" / "http"
 
 COLLECTION_REGEX = r"https://collectiveartscreativity.com/collections/[^\s)]+"
+USER_AGENT = "Mozilla/5.0"
+PAGE_LIMIT = 250
+
+# Async collector defaults: concurrent requests (and pooled connections),
+# steady request rate with a small burst, and pages requested ahead of the
+# last one seen
+CONCURRENCY = 8
+RATE_PER_SECOND = 4.0
+BURST = 4
+PAGE_WINDOW = 3
 
 
 def read_text(path: Path) -> str:
     return path.read_text(encoding="utf-8")
 
 
-def dedupe_keep_order(items: List[str]) -> List[str]:
-    seen: Set[str] = set()
-    ordered: List[str] = []
+def dedupe_keep_order(items: list[str]) -> list[str]:
+    seen: set[str] = set()
+    ordered: list[str] = []
     for item in items:
         if item not in seen:
             seen.add(item)
@@ -27,46 +41,219 @@ def dedupe_keep_order(items: List[str]) -> List[str]:
     return ordered
 
 
-def fetch_json(url: str) -> Dict:
-    req = Request(url, headers={"User-Agent": "Mozilla/5.0"})
-    with urlopen(req, timeout=30) as response:
-        return json.loads(response.read().decode("utf-8"))
+def page_url(collection_url: str, page: int) -> str:
+    return f"{collection_url}/products.json?limit={PAGE_LIMIT}&page={page}"
+
+
+class HttpCache:
+    """On-disk validators and bodies for conditional GETs, one JSON file per URL."""
 
+    def __init__(self, root: Path = HTTP_CACHE_DIR):
+        self.root = Path(root)
 
-def fetch_collection_products(collection_url: str) -> List[Dict]:
-    products: List[Dict] = []
-    page = 1
-    while True:
-        json_url = f"{collection_url}/products.json?limit=250&page={page}"
+    def _path(self, url: str) -> Path:
+        return self.root / f"{hashlib.sha256(url.encode()).hexdigest()[:32]}.json"
+
+    def get(self, url: str) -> dict | None:
+        path = self._path(url)
+        if not path.exists():
+            return None
         try:
-            payload = fetch_json(json_url)
-        except (HTTPError, URLError) as exc:
-            print(f"Failed to fetch {json_url}: {exc}")
-            break
+            return json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            return None
+
+    def put(self, url: str, etag: str | None, last_modified: str | None, body: str) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(url)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({"url": url, "etag": etag, "last_modified": last_modified, "body": body}),
+                       encoding="utf-8")
+        os.replace(tmp, path)
+
+
+class ConnectionPool:
+    """Keep-alive http.client connections per (scheme, host, port).
+
+    A connection is checked out for one request at a time and put back
+    unless the server asked to close it, so successive pages of a
+    collection reuse the same TCP/TLS session.
+    """
+
+    def __init__(self, timeout: float = 30):
+        self.timeout = timeout
+        self.idle: dict[tuple[str, str, int | None], list[HTTPConnection]] = {}
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def _checkout(self, key) -> tuple[HTTPConnection, bool]:
+        with self.lock:
+            if self.idle.get(key):
+                return self.idle[key].pop(), True
+            self.opened += 1
+        scheme, host, port = key
+        cls = HTTPSConnection if scheme == "https" else HTTPConnection
+        return cls(host, port, timeout=self.timeout), False
+
+    def request(self, url: str, headers: dict[str, str]) -> tuple[int, dict[str, str], bytes]:
+        """Blocking GET; returns (status, headers, body)."""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        while True:
+            conn, reused = self._checkout(key)
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (HTTPException, OSError):
+                conn.close()
+                if reused:
+                    # The server dropped an idle keep-alive connection; retry on a fresh one
+                    continue
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                with self.lock:
+                    self.idle.setdefault(key, []).append(conn)
+            return response.status, {k.lower(): v for k, v in response.getheaders()}, body
+
+    def close(self) -> None:
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle.clear()
+
+
+class TokenBucket:
+    """Async rate limit: `rate` requests per second on average, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncCollector:
+    """Fetches collections, and pages within each collection, concurrently.
+
+    Requests share a keep-alive ConnectionPool (driven from worker threads,
+    at most `concurrency` at a time) and a TokenBucket rate limit. Pages are
+    requested PAGE_WINDOW at a time until one comes back empty. Every GET
+    carries If-None-Match / If-Modified-Since from the HttpCache, so a page
+    that has not changed costs a 304 and is served from disk. A page that
+    fails stops its collection there and marks it incomplete, so a fetch
+    error is never mistaken for the last page.
+    """
+
+    def __init__(self, concurrency: int = CONCURRENCY, rate: float = RATE_PER_SECOND, burst: int = BURST,
+                 page_window: int = PAGE_WINDOW, cache_dir: Path | None = HTTP_CACHE_DIR, timeout: float = 30):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.page_window = page_window
+        self.cache = HttpCache(cache_dir) if cache_dir is not None else None
+        self.pool = ConnectionPool(timeout)
+        self.stats = {"requests": 0, "not_modified": 0, "errors": 0, "bytes": 0}
+        self.incomplete: list[str] = []
+
+    async def fetch_json(self, url: str) -> dict | None:
+        """Decoded page, or None if the request failed."""
+        cached = self.cache.get(url) if self.cache else None
+        headers = {"User-Agent": USER_AGENT, "Accept": "application/json", "Connection": "keep-alive"}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        await self.bucket.acquire()
+        async with self.slots:
+            try:
+                status, resp_headers, body = await asyncio.to_thread(self.pool.request, url, headers)
+            except (HTTPException, OSError) as exc:
+                self.stats["errors"] += 1
+                print(f"Failed to fetch {url}: {exc}")
+                return None
+        self.stats["requests"] += 1
+        self.stats["bytes"] += len(body)
+
+        if status == 304 and cached:
+            self.stats["not_modified"] += 1
+            return json.loads(cached["body"])
+        if status != 200:
+            self.stats["errors"] += 1
+            print(f"Failed to fetch {url}: HTTP {status}")
+            return None
+        text = body.decode("utf-8")
+        if self.cache and (resp_headers.get("etag") or resp_headers.get("last-modified")):
+            self.cache.put(url, resp_headers.get("etag"), resp_headers.get("last-modified"), text)
+        return json.loads(text)
+
+    async def fetch_collection_products(self, collection_url: str) -> list[dict]:
+        products: list[dict] = []
+        page = 1
+        while True:
+            window = range(page, page + self.page_window)
+            payloads = await asyncio.gather(*(self.fetch_json(page_url(collection_url, p)) for p in window))
+            for payload in payloads:
+                if payload is None:
+                    self.incomplete.append(collection_url)
+                    return products
+                batch = payload.get("products", [])
+                if not batch:
+                    return products
+                products.extend(batch)
+            page += self.page_window
+
+    async def collect(self, collection_urls: list[str]) -> list[list[dict]]:
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.bucket = TokenBucket(self.rate, self.burst)
+        try:
+            return await asyncio.gather(*(self.fetch_collection_products(url) for url in collection_urls))
+        finally:
+            self.pool.close()
+
 
-        batch = payload.get("products", [])
-        if not batch:
-            break
-        products.extend(batch)
-        page += 1
-        time.sleep(0.5)
-    return products
+def fetch_collections(collection_urls: list[str], **options) -> tuple[dict[str, list[dict]], dict]:
+    """Products per collection URL via AsyncCollector, plus its request stats.
 
+    stats["incomplete"] lists the collections cut short by a failed page.
+    """
+    collector = AsyncCollector(**options)
+    results = asyncio.run(collector.collect(collection_urls))
+    stats = {**collector.stats, "connections": collector.pool.opened, "incomplete": collector.incomplete}
+    return dict(zip(collection_urls, results)), stats
 
-def is_beer_like(product: Dict) -> bool:
+
+def is_beer_like(product: dict) -> bool:
     product_type = str(product.get("product_type", "")).lower()
     tags = " ".join(product.get("tags", [])).lower()
     return "beer" in product_type or "cider" in product_type or "beer" in tags or "cider" in tags
 
 
-def product_available(product: Dict) -> bool:
+def product_available(product: dict) -> bool:
     if "available" in product:
         return bool(product["available"])
     variants = product.get("variants", [])
     return any(variant.get("available") for variant in variants)
 
 
-def min_variant_price(product: Dict) -> Optional[float]:
+def min_variant_price(product: dict) -> float | None:
     prices = []
     for variant in product.get("variants", []):
         try:
@@ -76,7 +263,43 @@ def min_variant_price(product: Dict) -> Optional[float]:
     return min(prices) if prices else None
 
 
-def collect_from_sources() -> Dict:
+def empty_summary(updated_at: str) -> dict:
+    return {
+        "updated_at": updated_at,
+        "total_products": 0,
+        "beer_like_total": 0,
+        "beer_like_available": 0,
+        "beer_like_sold_out": 0,
+        "collection_counts": {},
+        "collection_available_counts": {},
+    }
+
+
+def add_to_summary(summary: dict, item: dict, sign: int = 1) -> None:
+    """Add (sign=1) or remove (sign=-1) one catalog item's counts in place.
+
+    Lets the summary be maintained from per-product changes alone.
+    """
+    available = bool(item.get("available"))
+    summary["total_products"] += sign
+    if is_beer_like(item):
+        summary["beer_like_total"] += sign
+        if available:
+            summary["beer_like_available"] += sign
+        else:
+            summary["beer_like_sold_out"] += sign
+
+    for collection in item.get("collections", []):
+        counts = [summary["collection_counts"]]
+        if available:
+            counts.append(summary["collection_available_counts"])
+        for count in counts:
+            count[collection] = count.get(collection, 0) + sign
+            if count[collection] == 0:
+                del count[collection]
+
+
+def collect_from_sources(**options) -> dict:
     if not DATA_SOURCES_PATH.exists():
         raise FileNotFoundError(f"Missing {DATA_SOURCES_PATH}")
 
@@ -85,11 +308,19 @@ def collect_from_sources() -> Dict:
     if not collection_urls:
         raise ValueError("No collection URLs found in DATA_SOURCES.md")
 
-    products_by_id: Dict[str, Dict] = {}
+    fetched, stats = fetch_collections(collection_urls, **options)
+    print(f"Fetched {stats['requests']} page(s) over {stats['connections']} connection(s), "
+          f"{stats['not_modified']} unchanged (304)")
+    return {**build_catalog(fetched), "incomplete": stats["incomplete"]}
+
+
+def build_catalog(fetched: dict[str, list[dict]]) -> dict:
+    """Summary and deduplicated catalog from the products of each collection URL."""
+    products_by_id: dict[str, dict] = {}
 
-    for collection_url in collection_urls:
+    for collection_url in fetched:
         collection_handle = collection_url.rstrip("/").split("/")[-1]
-        for product in fetch_collection_products(collection_url):
+        for product in fetched[collection_url]:
             product_id = str(product.get("id"))
             if not product_id:
                 continue
@@ -110,7 +341,7 @@ def collect_from_sources() -> Dict:
                 if not existing.get("available"):
                     existing["available"] = product_available(product)
 
-    catalog_items: List[Dict] = []
+    catalog_items: list[dict] = []
     for entry in products_by_id.values():
         handle = entry.get("handle") or ""
         entry["collections"] = sorted(entry["collections"])
@@ -119,47 +350,39 @@ def collect_from_sources() -> Dict:
 
     catalog_items.sort(key=lambda item: item.get("title") or "")
 
-    summary = {
-        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-        "total_products": len(catalog_items),
-        "beer_like_total": 0,
-        "beer_like_available": 0,
-        "beer_like_sold_out": 0,
-        "collection_counts": {},
-        "collection_available_counts": {},
-    }
-
+    summary = empty_summary(time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
     for item in catalog_items:
-        available = bool(item.get("available"))
-        beer_like = is_beer_like(item)
-        if beer_like:
-            summary["beer_like_total"] += 1
-            if available:
-                summary["beer_like_available"] += 1
-            else:
-                summary["beer_like_sold_out"] += 1
-
-        for collection in item.get("collections", []):
-            summary["collection_counts"][collection] = summary["collection_counts"].get(collection, 0) + 1
-            if available:
-                summary["collection_available_counts"][collection] = (
-                    summary["collection_available_counts"].get(collection, 0) + 1
-                )
+        add_to_summary(summary, item)
 
     return {"summary": summary, "catalog": catalog_items}
 
 
 def main() -> None:
+    from pipeline.catalog_snapshots import CatalogSnapshots
+
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     data = collect_from_sources()
+    if data["incomplete"]:
+        # A partial catalog would be recorded as products removed
+        raise SystemExit(f"Incomplete fetch of {len(data['incomplete'])} collection(s), catalog not updated: "
+                         + ", ".join(data["incomplete"]))
+    # Only per-product changes are appended to the snapshot history; the
+    # summary comes from the previous run's counts plus those changes
+    snapshots = CatalogSnapshots()
+    try:
+        run = snapshots.record(data["catalog"], data["summary"]["updated_at"])
+    finally:
+        snapshots.close()
+    print(f"Catalog changes: {run['added']} added, {run['changed']} changed, {run['removed']} removed")
+
     (OUTPUT_DIR / "collective_arts_summary.json").write_text(
-        json.dumps(data["summary"], indent=2), encoding="utf-8"
-    )
-    (OUTPUT_DIR / "collective_arts_catalog.json").write_text(
-        json.dumps(data["catalog"], indent=2), encoding="utf-8"
+        json.dumps(run["summary"], indent=2), encoding="utf-8"
     )
     print("Wrote dashboard/public/data/collective_arts_summary.json")
-    print("Wrote dashboard/public/data/collective_arts_catalog.json")
+    catalog_path = OUTPUT_DIR / "collective_arts_catalog.json"
+    if run["added"] or run["changed"] or run["removed"] or not catalog_path.exists():
+        catalog_path.write_text(json.dumps(data["catalog"], separators=(",", ":")), encoding="utf-8")
+        print("Wrote dashboard/public/data/collective_arts_catalog.json")
 
 
 if __name__ == "__main__":
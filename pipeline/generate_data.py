@@ -1,13 +1,14 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import random
 import os
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from pipeline.profiling import stage
 
 # Configuration
-START_DATE = datetime.now() - timedelta(days=365)
 END_DATE = datetime.now()
-DAYS = (END_DATE - START_DATE).days
+DAYS = 365
 STORES = [f"S{i:03d}" for i in range(1, 6)]
 CHANNELS = ["Retail", "Ecommerce"]
 SKUS = {
@@ -18,111 +19,211 @@ SKUS = {
     "UNKNOWN_SKU_999": {"name": "Discontinued Brew", "cat": "Legacy", "price": 5.00, "lead_time": 30}, # For testing DQ
 }
 
-np.random.seed(42)
-
-def generate_sku_map():
-    data = []
-    for sku, info in SKUS.items():
-        data.append({
-            "sku": sku,
-            "product_name": info["name"],
-            "category": info["cat"],
-            "pack_size": "6PK" if "6PK" in sku else "4PK",
-            "active_flag": True if "UNKNOWN" not in sku else False
-        })
-    df = pd.DataFrame(data)
-    df.to_csv("data/raw/sku_map.csv", index=False)
-    print("Generated sku_map.csv")
+# Scale knobs; the defaults reproduce the original demo dataset's shape
+DEFAULT_CONFIG = {
+    "n_stores": len(STORES),
+    "n_skus": len(SKUS),        # extra SKUs beyond the demo catalog are synthesized
+    "days": DAYS,
+    "end_date": None,           # defaults to today
+    "base_demand": 5.0,         # Poisson mean per store/sku/day before seasonality
+    "sparsity": 0.0,            # share of store/sku/days with no sale at all
+    "promo_rate": 0.05,
+    "negative_rate": 0.01,
+    "duplicate_rate": 0.003,    # share of POS rows written twice
+    "unknown_sku_rate": 0.0,    # share of POS rows with a SKU missing from sku_map
+    "discontinued_rate": 0.05,  # chance a store sells the legacy SKU on a given day
+    "ecom_skip_rate": 0.3,      # e-commerce is not sold every day
+    "seed": 42,
+    "out_dir": "data/raw",
+    "chunk_cells": 2_000_000,   # store x sku x day cells generated per chunk
+}
 
-def generate_pos_sales():
-    data = []
-    # Dates
-    dates = [START_DATE + timedelta(days=i) for i in range(DAYS)]
-    
-    for date in dates:
-        # Seasonality: higher in summer (months 6-8) and Dec (12)
-        seasonality = 1.0
-        if date.month in [6, 7, 8]: seasonality = 1.3
-        if date.month == 12: seasonality = 1.2
-        if date.weekday() >= 5: seasonality *= 1.5 # Weekends higher
-        
-        for store in STORES:
-            for sku, info in SKUS.items():
-                if "UNKNOWN" in sku and random.random() > 0.05: continue # Rare unknown sku
-                
-                # Base demand
-                lambda_val = 5 * seasonality
-                units = np.random.poisson(lambda_val)
-                
-                # Messy Data: Negatives
-                if random.random() < 0.01: units = -1 * units
-                
-                # Messy Data: Promo
-                promo = random.choice([True, False]) if random.random() < 0.1 else False
-                if promo and units > 0: units =int(units * 1.5)
-                
-                if units != 0:
-                    data.append({
-                        "date": date.strftime("%Y-%m-%d"),
-                        "store_id": store,
-                        "sku": sku,
-                        "units_sold": units,
-                        "unit_price": info["price"] if not promo else info["price"] * 0.8,
-                        "promo_flag": promo
-                    })
-    
-    # Introduce duplicates
-    data.extend(random.sample(data, 20))
-    
-    df = pd.DataFrame(data)
-    df.to_csv("data/raw/pos_sales.csv", index=False)
-    print(f"Generated pos_sales.csv with {len(df)} rows")
-
-def generate_ecommerce_sales():
-    data = []
-    dates = [START_DATE + timedelta(days=i) for i in range(DAYS)]
-    
-    for date in dates:
-        for sku, info in SKUS.items():
-            if "UNKNOWN" in sku: continue
-            
-            # Ecommerce is more volatile
-            if random.random() < 0.3: continue # Not sold every day
-            
-            units = np.random.randint(1, 20)
-            discount = 0.0
-            if random.random() < 0.05: discount = info["price"] * 0.1
-            
-            data.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "sku": sku,
-                "units_sold": units,
-                "unit_price": info["price"],
-                "discount": discount
+STYLES = ["LAGER", "IPA", "STOUT", "PALE", "SOUR", "PILS", "PORTER", "WHEAT"]
+
+
+def build_catalog(n_skus: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Demo SKUs first, then synthetic ones up to n_skus."""
+    rows = [
+        {"sku": sku, "name": info["name"], "cat": info["cat"], "price": info["price"], "lead_time": info["lead_time"]}
+        for sku, info in SKUS.items()
+    ][:n_skus]
+    extra = n_skus - len(rows)
+    if extra > 0:
+        styles = rng.choice(STYLES, size=extra)
+        packs = rng.choice(["6PK", "4PK", "12PK"], size=extra)
+        prices = np.round(rng.uniform(8.0, 16.0, size=extra), 2)
+        lead_times = rng.choice([7, 10, 14, 21], size=extra)
+        for i in range(extra):
+            rows.append({
+                "sku": f"BEER_{styles[i]}_{i:05d}_{packs[i]}",
+                "name": f"{styles[i].title()} #{i} {packs[i]}",
+                "cat": "Beer",
+                "price": float(prices[i]),
+                "lead_time": int(lead_times[i]),
             })
-            
-    df = pd.DataFrame(data)
-    df.to_csv("data/raw/ecommerce_sales.csv", index=False)
-    print(f"Generated ecommerce_sales.csv with {len(df)} rows")
+    return pd.DataFrame(rows)
 
-def generate_inventory():
-    data = []
-    # Only need current inventory really, but let's generate a snapshot
-    for sku, info in SKUS.items():
-        data.append({
-            "date": END_DATE.strftime("%Y-%m-%d"),
-            "sku": sku,
-            "on_hand": np.random.randint(0, 200),
-            "on_order": np.random.randint(0, 100) if random.random() > 0.5 else 0,
-            "lead_time_days": info["lead_time"]
+
+def _seasonality(dates: pd.DatetimeIndex) -> np.ndarray:
+    # Higher in summer (months 6-8) and Dec (12), weekends x1.5
+    month = dates.month.to_numpy()
+    season = np.where(np.isin(month, [6, 7, 8]), 1.3, np.where(month == 12, 1.2, 1.0))
+    return season * np.where(dates.dayofweek.to_numpy() >= 5, 1.5, 1.0)
+
+
+def _chunks(dates: pd.DatetimeIndex, cells_per_day: int, chunk_cells: int):
+    step = max(1, chunk_cells // max(cells_per_day, 1))
+    for i in range(0, len(dates), step):
+        yield i // step, dates[i:i + step]
+
+
+class _ChunkWriter:
+    """Streams chunks into one CSV; pyarrow's writer is much faster than
+    DataFrame.to_csv at tens of millions of rows."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.writer = None
+
+    def write(self, df: pd.DataFrame):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = pa_csv.CSVWriter(self.path, table.schema,
+                                           write_options=pa_csv.WriteOptions(quoting_style="none"))
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def generate_sku_map(catalog: pd.DataFrame, out_dir: str):
+    df = pd.DataFrame({
+        "sku": catalog["sku"],
+        "product_name": catalog["name"],
+        "category": catalog["cat"],
+        "pack_size": np.where(catalog["sku"].str.contains("6PK"), "6PK",
+                              np.where(catalog["sku"].str.contains("12PK"), "12PK", "4PK")),
+        "active_flag": ~catalog["sku"].str.contains("UNKNOWN"),
+    })
+    df.to_csv(os.path.join(out_dir, "sku_map.csv"), index=False)
+    print("Generated sku_map.csv")
+
+
+def generate_pos_sales(catalog: pd.DataFrame, dates: pd.DatetimeIndex, config: dict) -> int:
+    path = os.path.join(config["out_dir"], "pos_sales.csv")
+    stores = np.array([f"S{i:03d}" for i in range(1, config["n_stores"] + 1)])
+    skus = catalog["sku"].to_numpy()
+    prices = catalog["price"].to_numpy()
+    legacy = catalog["sku"].str.contains("UNKNOWN").to_numpy()
+    n_stores, n_skus = len(stores), len(skus)
+    writer, total = _ChunkWriter(path), 0
+
+    for chunk_id, chunk_dates in _chunks(dates, n_stores * n_skus, config["chunk_cells"]):
+        # One generator per chunk, so output depends only on seed + config
+        rng = np.random.default_rng([config["seed"], 1, chunk_id])
+        shape = (len(chunk_dates), n_stores, n_skus)
+
+        lam = config["base_demand"] * _seasonality(chunk_dates)[:, None, None]
+        units = rng.poisson(np.broadcast_to(lam, shape)).astype(np.int64)
+
+        # Messy Data: Negatives
+        units = np.where(rng.random(shape) < config["negative_rate"], -units, units)
+        # Messy Data: Promo
+        promo = rng.random(shape) < config["promo_rate"]
+        units = np.where(promo & (units > 0), (units * 1.5).astype(np.int64), units)
+
+        keep = units != 0
+        keep &= rng.random(shape) >= config["sparsity"]
+        # Rare legacy sku
+        keep &= ~legacy[None, None, :] | (rng.random(shape[:2])[..., None] < config["discontinued_rate"])
+
+        d_idx, st_idx, sku_idx = np.nonzero(keep)
+        chunk = pd.DataFrame({
+            "date": chunk_dates.strftime("%Y-%m-%d").to_numpy()[d_idx],
+            "store_id": stores[st_idx],
+            "sku": skus[sku_idx],
+            "units_sold": units[keep],
+            "unit_price": np.where(promo[keep], prices[sku_idx] * 0.8, prices[sku_idx]),
+            "promo_flag": promo[keep],
+        })
+
+        unknown = rng.random(len(chunk)) < config["unknown_sku_rate"]
+        chunk.loc[unknown, "sku"] = "SKU_NOT_IN_MAP"
+
+        # Introduce duplicates
+        dupes = chunk[rng.random(len(chunk)) < config["duplicate_rate"]]
+        chunk = pd.concat([chunk, dupes], ignore_index=True)
+
+        writer.write(chunk)
+        total += len(chunk)
+
+    writer.close()
+    print(f"Generated pos_sales.csv with {total} rows")
+    return total
+
+
+def generate_ecommerce_sales(catalog: pd.DataFrame, dates: pd.DatetimeIndex, config: dict) -> int:
+    path = os.path.join(config["out_dir"], "ecommerce_sales.csv")
+    active = catalog[~catalog["sku"].str.contains("UNKNOWN")]
+    skus, prices = active["sku"].to_numpy(), active["price"].to_numpy()
+    writer, total = _ChunkWriter(path), 0
+
+    for chunk_id, chunk_dates in _chunks(dates, len(skus), config["chunk_cells"]):
+        rng = np.random.default_rng([config["seed"], 2, chunk_id])
+        shape = (len(chunk_dates), len(skus))
+
+        sold = rng.random(shape) >= config["ecom_skip_rate"]
+        units = rng.integers(1, 20, size=shape)
+        discount = np.where(rng.random(shape) < 0.05, prices[None, :] * 0.1, 0.0)
+
+        d_idx, sku_idx = np.nonzero(sold)
+        chunk = pd.DataFrame({
+            "date": chunk_dates.strftime("%Y-%m-%d").to_numpy()[d_idx],
+            "sku": skus[sku_idx],
+            "units_sold": units[sold],
+            "unit_price": prices[sku_idx],
+            "discount": discount[sold],
         })
-    df = pd.DataFrame(data)
-    df.to_csv("data/raw/inventory.csv", index=False)
+        writer.write(chunk)
+        total += len(chunk)
+
+    writer.close()
+    print(f"Generated ecommerce_sales.csv with {total} rows")
+    return total
+
+
+def generate_inventory(catalog: pd.DataFrame, end_date: datetime, config: dict):
+    # Only need current inventory really, but let's generate a snapshot
+    rng = np.random.default_rng([config["seed"], 3])
+    n = len(catalog)
+    on_order = rng.integers(0, 100, size=n)
+    df = pd.DataFrame({
+        "date": end_date.strftime("%Y-%m-%d"),
+        "sku": catalog["sku"],
+        "on_hand": rng.integers(0, 200, size=n),
+        "on_order": np.where(rng.random(n) > 0.5, on_order, 0),
+        "lead_time_days": catalog["lead_time"],
+    })
+    df.to_csv(os.path.join(config["out_dir"], "inventory.csv"), index=False)
     print("Generated inventory.csv")
 
+
+def main(**overrides):
+    """Generate the raw CSVs. Same seed and config give byte-identical files."""
+    config = {**DEFAULT_CONFIG, **overrides}
+    end_date = pd.Timestamp(config["end_date"] or END_DATE).normalize()
+    dates = pd.date_range(end=end_date - timedelta(days=1), periods=config["days"], freq="D")
+
+    with stage('generate') as record:
+        os.makedirs(config["out_dir"], exist_ok=True)
+        catalog = build_catalog(config["n_skus"], np.random.default_rng([config["seed"], 0]))
+        generate_sku_map(catalog, config["out_dir"])
+        rows = generate_pos_sales(catalog, dates, config)
+        rows += generate_ecommerce_sales(catalog, dates, config)
+        generate_inventory(catalog, end_date, config)
+        record['rows_out'] = rows
+    return rows
+
 if __name__ == "__main__":
-    os.makedirs("data/raw", exist_ok=True)
-    generate_sku_map()
-    generate_pos_sales()
-    generate_ecommerce_sales()
-    generate_inventory()
+    main()
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.linalg import spsolve
+from pipeline import baselines
+from pipeline.panel import build_panel
+
+HIERARCHY_PATH = "data/outputs/forecast_hierarchy.csv"
+SERIES_KEYS = ['channel', 'sku']
+NODE_COLUMNS = ['channel', 'category', 'sku']
+# Placeholder for a key a level aggregates over
+ALL = '*'
+# Aggregate levels, top down, and the key columns each one keeps. The
+# bottom level is (channel, sku), the grain the ML engines forecast at.
+LEVELS = {
+    'total': [],
+    'channel': ['channel'],
+    'category': ['category'],
+    'category_channel': ['category', 'channel'],
+    'sku': ['category', 'sku'],
+}
+RECONCILE_METHODS = ('bottom_up', 'top_down', 'ols', 'mint')
+
+
+class Hierarchy:
+    """Summing matrix over (channel, sku) series.
+
+    `nodes` lists every aggregate node, then every bottom series, with
+    channel/category/sku set to ALL where the level sums over that key.
+    S is the sparse (n_nodes, n_bottom) summing matrix, so aggregate
+    values are S @ bottom values; its last n_bottom rows are the identity.
+    """
+
+    def __init__(self, nodes: pd.DataFrame, S: sp.csr_matrix, n_bottom: int):
+        self.nodes = nodes.reset_index(drop=True)
+        self.S = S
+        self.n_bottom = n_bottom
+
+    @property
+    def n_nodes(self) -> int:
+        return self.S.shape[0]
+
+    @property
+    def n_aggregate(self) -> int:
+        return self.n_nodes - self.n_bottom
+
+    def aggregate(self, bottom_values: np.ndarray) -> np.ndarray:
+        """Values for every node from a (n_bottom, k) bottom matrix."""
+        return np.asarray(self.S @ bottom_values)
+
+
+def build_hierarchy(bottom: pd.DataFrame) -> Hierarchy:
+    """Hierarchy for bottom series keyed by channel/sku, with their category.
+
+    Each level's rows of S come from one groupby-ngroup over the bottom
+    keys, so building it is vectorized in the number of series.
+    """
+    bottom = bottom[['channel', 'sku', 'category']].reset_index(drop=True)
+    bottom['category'] = bottom['category'].astype(object).fillna('Unknown')
+    n_bottom = len(bottom)
+    cols = np.arange(n_bottom)
+    node_frames, rows, offset = [], [], 0
+    for level, keys in LEVELS.items():
+        if keys:
+            g = bottom.groupby(keys, sort=True)
+            codes = g.ngroup().to_numpy()
+            level_nodes = g.size().index.to_frame(index=False)
+        else:
+            codes = np.zeros(n_bottom, dtype=int)
+            level_nodes = pd.DataFrame(index=[0])
+        node_frames.append(level_nodes.assign(level=level))
+        rows.append(offset + codes)
+        offset += len(level_nodes)
+    node_frames.append(bottom.assign(level='bottom'))
+    rows.append(offset + cols)
+
+    nodes = pd.concat(node_frames, ignore_index=True)
+    for col in NODE_COLUMNS:
+        nodes[col] = nodes[col].fillna(ALL) if col in nodes else ALL
+    rows = np.concatenate(rows)
+    S = sp.csr_matrix((np.ones(len(rows)), (rows, np.tile(cols, len(LEVELS) + 1))),
+                      shape=(offset + n_bottom, n_bottom))
+    return Hierarchy(nodes[['level'] + NODE_COLUMNS], S, n_bottom)
+
+
+def reconcile(h: Hierarchy, Yhat: np.ndarray, method: str = 'mint', history: np.ndarray = None,
+              variances: np.ndarray = None) -> np.ndarray:
+    """Coherent forecasts for every node from base forecasts Yhat (n_nodes, horizon).
+
+    bottom_up sums the bottom forecasts. top_down splits the total by each
+    bottom series' share of `history` (n_bottom, n_days). ols and mint
+    project Yhat onto the coherent subspace, with W = I for ols and
+    W = diag(variances) for mint (structural scaling, the number of bottom
+    series under each node, when no variances are given). The projection
+    y - W C' (C W C')^-1 C y, with C = [I, -S_agg] the aggregation
+    constraints, needs one sparse solve of size n_aggregate for all horizon
+    steps at once, instead of inverting the n_bottom x n_bottom S'W^-1 S.
+    """
+    Yhat = np.asarray(Yhat, dtype=float)
+    if method == 'bottom_up':
+        return h.aggregate(Yhat[h.n_aggregate:])
+    if method == 'top_down':
+        if history is None:
+            raise ValueError("top_down reconciliation needs the bottom history")
+        totals = np.nan_to_num(history).sum(axis=1)
+        shares = totals / totals.sum() if totals.sum() > 0 else np.full(h.n_bottom, 1 / h.n_bottom)
+        return h.aggregate(shares[:, None] * Yhat[0][None, :])
+    if method not in ('ols', 'mint'):
+        raise ValueError(f"Unknown reconciliation {method!r}, expected one of {RECONCILE_METHODS}")
+
+    if method == 'ols':
+        w = np.ones(h.n_nodes)
+    elif variances is not None:
+        w = np.maximum(np.asarray(variances, dtype=float), 1e-9)
+    else:
+        w = np.asarray(h.S.sum(axis=1)).ravel()
+    C = sp.hstack([sp.identity(h.n_aggregate, format='csr'), -h.S[:h.n_aggregate]], format='csr')
+    W = sp.diags(w)
+    incoherence = C @ Yhat
+    correction = spsolve((C @ W @ C.T).tocsc(), incoherence)
+    return Yhat - W @ C.T @ correction.reshape(h.n_aggregate, -1)
+
+
+def reconcile_forecast(df: pd.DataFrame, forecast_df: pd.DataFrame, method: str = 'mint',
+                       baseline_method: str = 'auto'):
+    """Reconcile forecast_daily across channel/category/sku/total.
+
+    Bottom base forecasts are the engine's yhat (baselines for series the
+    engine skipped); every aggregate node gets a statistical baseline
+    forecast of its summed history (pipeline.baselines), all nodes in one
+    matrix pass. mint weights each node by its baseline's holdout MSE.
+    Returns (forecast_df with reconciled yhat and its band shifted by the
+    same amount, long frame of every node's base and reconciled forecast).
+    """
+    if 'category' not in df.columns:
+        df = df.assign(category='Unknown')
+    panel = build_panel(df, attrs=['category'])
+    h = build_hierarchy(panel.keys)
+    Y = baselines.panel_matrix(panel)
+    horizon = int(forecast_df.groupby(SERIES_KEYS).size().max())
+
+    # Base forecasts: one baseline pass over the whole hierarchy's history
+    Y_all = np.vstack([np.asarray(h.S[:h.n_aggregate] @ np.nan_to_num(Y)), Y])
+    base, _ = baselines.forecast_matrix(Y_all, horizon, baseline_method)
+    test_size = min(horizon, Y.shape[1] - 1)
+    holdout, _ = baselines.forecast_matrix(Y_all[:, :-test_size], test_size, baseline_method)
+    errors = np.nan_to_num(Y_all[:, -test_size:] - holdout)
+    variances = (errors ** 2).mean(axis=1)
+
+    # Engine forecasts replace the baseline at the bottom level
+    fc = forecast_df.reset_index(drop=True)
+    step = fc.groupby(SERIES_KEYS, sort=False).cumcount().to_numpy()
+    series = pd.MultiIndex.from_frame(panel.keys[SERIES_KEYS]).get_indexer(pd.MultiIndex.from_frame(fc[SERIES_KEYS]))
+    base[h.n_aggregate + series, step] = fc['yhat'].to_numpy()
+
+    coherent = np.maximum(reconcile(h, base, method, history=Y, variances=variances), 0)
+    # Clipping negatives can break coherence, so re-aggregate from the bottom
+    coherent = h.aggregate(coherent[h.n_aggregate:])
+
+    delta = coherent[h.n_aggregate + series, step] - fc['yhat'].to_numpy()
+    fc['yhat'] = fc['yhat'] + delta
+    fc['yhat_lower'] = np.maximum(fc['yhat_lower'] + delta, 0)
+    fc['yhat_upper'] = fc['yhat_upper'] + delta
+
+    dates = panel.dates[-1] + pd.to_timedelta(np.arange(1, horizon + 1), unit='D')
+    hierarchy_df = h.nodes.loc[np.repeat(np.arange(h.n_nodes), horizon)].reset_index(drop=True)
+    hierarchy_df.insert(0, 'date', np.tile(dates, h.n_nodes))
+    hierarchy_df['yhat_base'] = base.ravel()
+    hierarchy_df['yhat'] = coherent.ravel()
+    return fc, hierarchy_df
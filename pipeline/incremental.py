@@ -0,0 +1,245 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import pandas as pd
+from pipeline.ingest import validate_frames
+from pipeline.storage import CURATED_TABLES, PARQUET_DIR, has_curated, read_curated, write_curated
+from pipeline.panel import build_panel
+from pipeline.transform import (
+    DEFAULT_FEATURE_CONFIG, SERIES_KEYS, add_features, create_fact_sales_daily, history_length,
+)
+
+# Watermarks live next to the store they describe, so wiping the store also
+# resets ingestion to a full load.
+STATE_PATH = os.path.join(PARQUET_DIR, "_ingest_state.json")
+
+SOURCES = {
+    'pos': {'path': "data/raw/pos_sales.csv", 'staging': 'stg_pos_sales'},
+    'ecom': {'path': "data/raw/ecommerce_sales.csv", 'staging': 'stg_ecommerce_sales'},
+}
+
+# Bytes sampled at each end of the already-ingested prefix to detect a
+# rewritten file without hashing the whole history.
+FINGERPRINT_BYTES = 64 * 1024
+
+
+def load_state() -> dict:
+    if not os.path.exists(STATE_PATH):
+        return {}
+    with open(STATE_PATH) as f:
+        return json.load(f)
+
+
+def save_state(state: dict):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    tmp = STATE_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, STATE_PATH)
+
+
+def _prefix_fingerprint(f, offset: int) -> str:
+    h = hashlib.sha256()
+    f.seek(0)
+    h.update(f.read(min(offset, FINGERPRINT_BYTES)))
+    f.seek(max(0, offset - FINGERPRINT_BYTES))
+    h.update(f.read(min(offset, FINGERPRINT_BYTES)))
+    return h.hexdigest()
+
+
+def read_new_rows(path: str, source_state: dict):
+    """Read only the rows appended to an append-only CSV since the last run.
+
+    Returns (rows, new_state, is_full). Falls back to a full read when there
+    is no watermark yet or the already-ingested prefix has been rewritten
+    (file shrank or fingerprint changed).
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        header = f.readline()
+        offset = source_state.get('offset', 0)
+        is_full = (
+            offset == 0
+            or size < offset
+            or _prefix_fingerprint(f, offset) != source_state.get('fingerprint')
+        )
+        start = len(header) if is_full else offset
+        f.seek(start)
+        tail = f.read()
+
+    # Only consume whole lines; a partially written last line waits for the next run
+    end = tail.rfind(b'\n') + 1
+    tail = tail[:end]
+    new_offset = start + end
+
+    rows = pd.read_csv(io.BytesIO(header + tail)) if tail else pd.read_csv(io.BytesIO(header))
+    with open(path, 'rb') as f:
+        fingerprint = _prefix_fingerprint(f, new_offset)
+    new_state = {'offset': new_offset, 'fingerprint': fingerprint}
+    return rows, new_state, is_full
+
+
+def _months(dates: pd.Series) -> set:
+    return set(pd.to_datetime(dates).dt.strftime('%Y-%m').dropna())
+
+
+def _month_bounds(month: str):
+    start = pd.Timestamp(f"{month}-01")
+    return start, start + pd.offsets.MonthEnd(0)
+
+
+def run_incremental_ingest(export_csv: bool = False, save: bool = True) -> dict:
+    """Ingest only new raw sales rows and rebuild the affected months.
+
+    New rows (including late corrections for days already loaded) are
+    validated, appended to the staging tables, and fact_sales_daily is
+    re-aggregated for just the month partitions they touch. Aggregation
+    rules are the same as the full run (exact duplicates dropped, the rest
+    summed), so the result matches a full rebuild.
+
+    The new watermarks are returned as summary['state']. With save=False
+    they are not written, so a caller that builds more on top of the
+    ingest can save them once that is on disk; until then the next run
+    reads the same rows again, and re-appending them to staging leaves
+    the facts unchanged since exact duplicates are dropped.
+    """
+    print("Running incremental ingest...")
+    state = load_state()
+
+    # Reference data is small, re-read every run
+    sku_map = pd.read_csv("data/raw/sku_map.csv")
+    inv = pd.read_csv("data/raw/inventory.csv")
+
+    reads = {name: read_new_rows(src['path'], state.get(name, {})) for name, src in SOURCES.items()}
+    full_reload = any(is_full for _, _, is_full in reads.values()) or not all(
+        has_curated(src['staging']) for src in SOURCES.values()
+    )
+    if full_reload:
+        # First run, or a source was rewritten: rebuild staging and facts from
+        # scratch so they stay consistent with the raw files
+        print("No usable watermark for every source, running a full load")
+        reads = {name: read_new_rows(src['path'], {}) for name, src in SOURCES.items()}
+        for table in [src['staging'] for src in SOURCES.values()] + ['fact_sales_daily']:
+            shutil.rmtree(os.path.join(PARQUET_DIR, table), ignore_errors=True)
+        state = {}
+
+    deltas = {}
+    for name, (rows, _, _) in reads.items():
+        if rows.empty:
+            # Header-only reads come back as object columns; give them the
+            # staging dtypes so schema validation still passes
+            dtypes = CURATED_TABLES[SOURCES[name]['staging']]['dtypes']
+            rows = rows.astype({c: ('int64' if t.startswith('int') else t) for c, t in dtypes.items()})
+        deltas[name] = rows
+    new_state = {name: src_state for name, (_, src_state, _) in reads.items()}
+    rows_in = sum(len(rows) for rows in deltas.values())
+
+    sku_map, pos, ecom, inv = validate_frames(sku_map, deltas['pos'], deltas['ecom'], inv,
+                                              append_dq=not full_reload)
+
+    affected = _months(pos['date']) | _months(ecom['date'])
+    for name, delta in (('pos', pos), ('ecom', ecom)):
+        watermark = state.get(name, {}).get('max_date')
+        dates = delta['date'].dropna()
+        if watermark and (dates <= pd.Timestamp(watermark)).any():
+            print(f"{name}: {(dates <= pd.Timestamp(watermark)).sum()} late-arriving rows "
+                  f"at or before watermark {watermark}")
+        candidates = [pd.Timestamp(d) for d in (watermark, dates.max() if not dates.empty else None) if d]
+        new_state[name]['max_date'] = max(candidates).strftime('%Y-%m-%d') if candidates else None
+
+    rebuilt = {}
+    for month in sorted(affected):
+        start, end = _month_bounds(month)
+        stg = {}
+        for name, delta in (('pos', pos), ('ecom', ecom)):
+            table = SOURCES[name]['staging']
+            month_delta = delta[(delta['date'] >= start) & (delta['date'] <= end)]
+            if has_curated(table):
+                month_delta = pd.concat([read_curated(table, start=start, end=end), month_delta], ignore_index=True)
+            stg[name] = month_delta
+            write_curated(month_delta, table, export_csv=False, months=[month])
+        rebuilt[month] = create_fact_sales_daily(stg['pos'].copy(), stg['ecom'].copy())
+
+    if rebuilt:
+        fact_sales = pd.concat(rebuilt.values(), ignore_index=True)
+        fact_sales = fact_sales.merge(sku_map[['sku', 'category']], on='sku', how='left')
+        write_curated(fact_sales, 'fact_sales_daily', export_csv=False, months=sorted(affected))
+    write_curated(sku_map, 'dim_product', export_csv=export_csv)
+    write_curated(inv, 'fact_inventory_daily', export_csv=export_csv)
+    if export_csv:
+        read_curated('fact_sales_daily').to_csv("data/curated/fact_sales_daily.csv", index=False)
+
+    if save:
+        save_state(new_state)
+    summary = {
+        'mode': 'full' if full_reload else 'incremental',
+        'rows_in': int(rows_in),
+        'months_rebuilt': sorted(affected),
+        'state': new_state,
+    }
+    print(f"Incremental ingest done ({summary['mode']}): {summary['rows_in']} new rows, "
+          f"{len(affected)} month partition(s) rebuilt.")
+    return summary
+
+
+def update_features(previous: pd.DataFrame, summary: dict, config: dict | None = None) -> pd.DataFrame:
+    """Model input after an incremental ingest, recomputing only what changed.
+
+    Rows from the first rebuilt month onwards are recomputed from a panel
+    that starts history_length days earlier, enough for every lag and
+    rolling window; older rows are kept from `previous`. Series already in
+    `previous` are extended from the window start even without sales in
+    it, as a full build does. Falls back to a full build without a previous
+    model input, after a full load, or with EWMAs (unbounded lookback).
+    """
+    config = {**DEFAULT_FEATURE_CONFIG, **(config or {})}
+    months = summary['months_rebuilt']
+    if previous is None or summary['mode'] == 'full' or config['ewm_spans']:
+        panel = build_panel(read_curated('fact_sales_daily'), attrs=['category'])
+        return add_features(panel.to_frame(), config).reset_index(drop=True)
+    if not months:
+        return previous
+
+    start = _month_bounds(min(months))[0]
+    window_start = start - pd.Timedelta(days=history_length(config))
+    fact = read_curated('fact_sales_daily', start=window_start)
+    known = previous.drop_duplicates(SERIES_KEYS)[SERIES_KEYS + ['category']]
+    in_window = pd.MultiIndex.from_frame(known[SERIES_KEYS].astype(str)).isin(
+        pd.MultiIndex.from_frame(fact[SERIES_KEYS].astype(str)))
+    idle = known[~in_window].assign(date=window_start, units_sold=0, revenue=0.0, promo_flag=0)
+    fact = pd.concat([fact.astype({c: object for c in SERIES_KEYS + ['category']}),
+                      idle.astype({c: object for c in SERIES_KEYS + ['category']})], ignore_index=True)
+    panel = build_panel(fact, attrs=['category'])
+    # Series that sold before the window have history at its first day
+    seen = pd.MultiIndex.from_frame(panel.keys[SERIES_KEYS].astype(str)).isin(
+        pd.MultiIndex.from_frame(known[SERIES_KEYS].astype(str)))
+    panel.first_day[seen] = 0
+    fresh = add_features(panel.to_frame(), config)
+
+    out = pd.concat([previous[previous['date'] < start], fresh[fresh['date'] >= start]], ignore_index=True)
+    # Categories as a full build would have them: the values present
+    for col in previous.columns:
+        if isinstance(previous[col].dtype, pd.CategoricalDtype) or isinstance(fresh[col].dtype, pd.CategoricalDtype):
+            out[col] = out[col].astype(object).astype('category')
+        elif out[col].dtype != previous[col].dtype:
+            out[col] = out[col].astype(previous[col].dtype)
+    return out.sort_values(SERIES_KEYS + ['date'], kind='stable', ignore_index=True)
+
+
+def run_incremental_transform(export_csv: bool = False, previous: pd.DataFrame = None):
+    """Incremental counterpart of run_transform.
+
+    The curated store is only updated for new rows and features are only
+    recomputed for the months they touch (see update_features). Returns
+    (model_input, inv, sku_map, changed, state); changed is False when
+    there was nothing new and `previous` is returned as-is. The ingest
+    watermarks in `state` are not saved: pass them to save_state once
+    model_input is written, so a run that fails in between is redone.
+    """
+    summary = run_incremental_ingest(export_csv=export_csv, save=False)
+    sku_map = read_curated('dim_product')
+    inv = read_curated('fact_inventory_daily')
+    model_input = update_features(previous, summary)
+    return model_input, inv, sku_map, model_input is not previous, summary['state']
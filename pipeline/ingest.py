@@ -1,9 +1,8 @@
 
 import pandas as pd
 import pandera as pa
-from pandera.typing import DataFrame, Series
 import os
-from typing import Dict, Tuple
+from pipeline.profiling import stage
 
 # Schemas
 # Schemas
@@ -40,15 +39,34 @@ InventorySchema = pa.DataFrameSchema({
     "lead_time_days": pa.Column(int, checks=pa.Check.ge(0)),
 })
 
-def ingest_and_validate() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    print("Loading data...")
-    
-    # Load raw
-    sku_map = pd.read_csv("data/raw/sku_map.csv")
-    pos = pd.read_csv("data/raw/pos_sales.csv")
-    ecom = pd.read_csv("data/raw/ecommerce_sales.csv")
-    inv = pd.read_csv("data/raw/inventory.csv")
+def ingest_and_validate() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    with stage('ingest') as record:
+        print("Loading data...")
+        
+        # Load raw
+        sku_map = pd.read_csv("data/raw/sku_map.csv")
+        pos = pd.read_csv("data/raw/pos_sales.csv")
+        ecom = pd.read_csv("data/raw/ecommerce_sales.csv")
+        inv = pd.read_csv("data/raw/inventory.csv")
+        record['rows_in'] = len(pos) + len(ecom)
+
+        sku_map, pos, ecom, inv = validate_frames(sku_map, pos, ecom, inv)
+        record['rows_out'] = len(pos) + len(ecom)
+        return sku_map, pos, ecom, inv
+
+def _write_dq(df: pd.DataFrame, path: str, append: bool):
+    if append and os.path.exists(path):
+        df.to_csv(path, mode='a', header=False)
+    else:
+        df.to_csv(path)
+
+def validate_frames(sku_map: pd.DataFrame, pos: pd.DataFrame, ecom: pd.DataFrame, inv: pd.DataFrame,
+                    append_dq: bool = False) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Clean and schema-check raw frames (also used on incremental deltas).
 
+    append_dq adds flagged rows to the existing dq_* files instead of
+    replacing them, for runs that only see new rows.
+    """
     # Dates
     pos['date'] = pd.to_datetime(pos['date'], errors='coerce')
     ecom['date'] = pd.to_datetime(ecom['date'], errors='coerce')
@@ -56,6 +74,10 @@ def ingest_and_validate() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.
     
     # Handle boolean/int flags
     pos['promo_flag'] = pos['promo_flag'].astype(int)
+    # Money columns are float even when a file (or delta) only holds whole numbers
+    pos['unit_price'] = pos['unit_price'].astype(float)
+    ecom['unit_price'] = ecom['unit_price'].astype(float)
+    ecom['discount'] = ecom['discount'].astype(float)
     sku_map['active_flag'] = sku_map['active_flag'].astype(int)
     
     # 1. Negative Unit Validation (Flag & Filter)
@@ -67,13 +89,13 @@ def ingest_and_validate() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.
     invalid_pos = pos[pos['units_sold'] < 0].copy()
     if not invalid_pos.empty:
         print(f"WARNING: Dropping {len(invalid_pos)} negative units rows from POS")
-        invalid_pos.to_csv("data/outputs/dq_negative_pos.csv")
+        _write_dq(invalid_pos, "data/outputs/dq_negative_pos.csv", append_dq)
         pos = pos[pos['units_sold'] >= 0]
         
     invalid_ecom = ecom[ecom['units_sold'] < 0].copy()
     if not invalid_ecom.empty:
         print(f"WARNING: Dropping {len(invalid_ecom)} negative units rows from Ecom")
-        invalid_ecom.to_csv("data/outputs/dq_negative_ecom.csv")
+        _write_dq(invalid_ecom, "data/outputs/dq_negative_ecom.csv", append_dq)
         ecom = ecom[ecom['units_sold'] >= 0]
 
     # 2. SKU Existence Check
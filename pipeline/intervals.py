@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+# Per-step interval offsets learned by the backtest and applied by the forecast
+INTERVALS_PATH = "data/outputs/interval_offsets.csv"
+SERIES_KEYS = ['channel', 'sku']
+DEFAULT_COVERAGE = 0.8
+INTERVAL_METHODS = ('conformal', 'quantile')
+# Series/step cells with fewer backtest residuals use the offsets pooled
+# over every series of the same model and step instead
+MIN_RESIDUALS = 4
+# Offsets pooled over all series are written with these placeholder keys
+POOLED = '*'
+# Backtest model whose residuals stand in for each forecast model_version;
+# anything not listed (the statistical baselines) uses Baseline_SMA's
+MODEL_FAMILY = {'GradientBoosting': 'ML', 'GlobalHistGB': 'ML'}
+OFFSET_COLUMNS = SERIES_KEYS + ['model', 'step', 'n', 'lower', 'upper']
+
+
+def _group_offsets(res: pd.DataFrame, keys: list, coverage: float, method: str) -> pd.DataFrame:
+    """Lower/upper error offsets per group, all groups in one pass.
+
+    'conformal' is split-conformal on absolute errors: the
+    ceil((n + 1) * coverage)-th smallest |y - yhat| of the group, used
+    symmetrically. 'quantile' takes the empirical (1 - coverage) / 2 and
+    (1 + coverage) / 2 quantiles of the signed errors, so bands can be skewed.
+    """
+    g = res.groupby(keys, sort=True)
+    sizes = g.size()
+    n = sizes.to_numpy()
+    out = sizes.index.to_frame(index=False)
+    out['n'] = n
+    if method == 'conformal':
+        codes = g.ngroup().to_numpy()
+        abs_err = np.abs(res['err'].to_numpy())
+        sorted_abs = abs_err[np.lexsort((abs_err, codes))]
+        start = np.concatenate(([0], np.cumsum(n)[:-1]))
+        k = np.minimum(np.ceil((n + 1) * coverage).astype(int), n)
+        q = sorted_abs[start + k - 1]
+        out['lower'], out['upper'] = -q, q
+    elif method == 'quantile':
+        alpha = 1 - coverage
+        out['lower'] = g['err'].quantile(alpha / 2).to_numpy()
+        out['upper'] = g['err'].quantile(1 - alpha / 2).to_numpy()
+    else:
+        raise ValueError(f"Unknown interval method {method!r}, expected one of {INTERVAL_METHODS}")
+    return out
+
+
+def interval_offsets(residuals: pd.DataFrame, coverage: float = DEFAULT_COVERAGE,
+                     method: str = 'conformal') -> pd.DataFrame:
+    """Interval offsets per series, model and horizon step from backtest residuals.
+
+    residuals is the long frame from run_backtest (cutoff, date, y, yhat per
+    series/fold/model); step is days after the cutoff. Cells with fewer than
+    MIN_RESIDUALS errors take the pooled offsets of their model and step,
+    which are also returned as rows keyed POOLED for series the backtest
+    never saw.
+    """
+    res = residuals.dropna(subset=['y', 'yhat'])
+    res = res.assign(
+        step=(pd.to_datetime(res['date']) - pd.to_datetime(res['cutoff'])).dt.days,
+        err=res['y'].to_numpy(dtype=float) - res['yhat'].to_numpy(dtype=float),
+    )
+    if res.empty:
+        return pd.DataFrame(columns=OFFSET_COLUMNS)
+    per_series = _group_offsets(res, SERIES_KEYS + ['model', 'step'], coverage, method)
+    pooled = _group_offsets(res, ['model', 'step'], coverage, method)
+
+    fallback = per_series[['model', 'step']].merge(pooled, on=['model', 'step'], how='left')
+    thin = (per_series['n'] < MIN_RESIDUALS).to_numpy()
+    for col in ('lower', 'upper'):
+        per_series[col] = np.where(thin, fallback[col], per_series[col])
+    pooled[SERIES_KEYS] = POOLED
+    return pd.concat([per_series, pooled], ignore_index=True)[OFFSET_COLUMNS]
+
+
+def apply_intervals(forecast_df: pd.DataFrame, offsets: pd.DataFrame) -> pd.DataFrame:
+    """Replace yhat_lower/yhat_upper with yhat plus the backtest offsets.
+
+    forecast_df is sorted by series then date, so a row's step is its
+    position in the series. Steps past the backtest horizon reuse its last
+    step's offsets widened by sqrt(step / last_step), as for a random walk.
+    Rows with no offsets at all keep their existing band.
+    """
+    if offsets.empty:
+        return forecast_df
+    fc = forecast_df.reset_index(drop=True)
+    step = fc.groupby(SERIES_KEYS, sort=False).cumcount().to_numpy() + 1
+    max_step = int(offsets['step'].max())
+    lookup = fc[SERIES_KEYS].assign(
+        model=fc['model_version'].map(MODEL_FAMILY).fillna('Baseline_SMA'),
+        step=np.minimum(step, max_step),
+    )
+    pooled = offsets[offsets['channel'] == POOLED].drop(columns=SERIES_KEYS + ['n'])
+    per_series = offsets[offsets['channel'] != POOLED].drop(columns=['n'])
+    hit = lookup.merge(per_series, on=SERIES_KEYS + ['model', 'step'], how='left')
+    pool = lookup.merge(pooled, on=['model', 'step'], how='left')
+    scale = np.sqrt(step / lookup['step'].to_numpy())
+    lower = hit['lower'].fillna(pool['lower']).to_numpy() * scale
+    upper = hit['upper'].fillna(pool['upper']).to_numpy() * scale
+
+    yhat = fc['yhat'].to_numpy()
+    known = ~np.isnan(lower)
+    # Keep yhat inside the band even when the errors are one-sided
+    fc['yhat_lower'] = np.where(known, np.clip(yhat + lower, 0, yhat), fc['yhat_lower'])
+    fc['yhat_upper'] = np.where(known, np.maximum(yhat + upper, yhat), fc['yhat_upper'])
+    return fc
+
+
+def load_offsets(path: str = INTERVALS_PATH) -> pd.DataFrame:
+    try:
+        return pd.read_csv(path, dtype={'channel': str, 'sku': str})
+    except FileNotFoundError:
+        return pd.DataFrame(columns=OFFSET_COLUMNS)
@@ -0,0 +1,165 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+SERIES_KEYS = ['channel', 'sku']
+
+# Compact storage per value column; days without sales are explicit zeros
+VALUE_DTYPES = {
+    'units_sold': np.int32,
+    'revenue': np.float64,
+    'promo_flag': np.int8,
+}
+
+
+class SalesPanel:
+    """Dense series x days view of fact_sales_daily.
+
+    `values[col]` is a 2-D array (n_series, n_days) over one shared daily
+    calendar `dates`; `keys` holds one row per series (key columns plus any
+    per-series attributes such as category) in the same order. Row i of every
+    array is the same series, so downstream code slices by position instead
+    of re-sorting or re-grouping.
+    """
+
+    def __init__(self, keys: pd.DataFrame, dates: pd.DatetimeIndex, values: dict, first_day: np.ndarray,
+                 key_cols: list | None = None):
+        self.keys = keys.reset_index(drop=True)
+        self.dates = dates
+        self.values = values
+        # Index of each series' first observed day; earlier days are pre-launch
+        self.first_day = first_day
+        self.key_cols = key_cols or SERIES_KEYS
+
+    @property
+    def n_series(self) -> int:
+        return len(self.keys)
+
+    @property
+    def n_days(self) -> int:
+        return len(self.dates)
+
+    def series_index(self, **key) -> int:
+        mask = np.ones(self.n_series, dtype=bool)
+        for col, val in key.items():
+            mask &= (self.keys[col] == val).to_numpy()
+        hits = np.flatnonzero(mask)
+        if len(hits) != 1:
+            raise KeyError(f"No unique series for {key}")
+        return int(hits[0])
+
+    def subset(self, rows) -> 'SalesPanel':
+        """Panel of the series at `rows` (a slice or index array), sharing the calendar."""
+        values = {col: mat[rows] for col, mat in self.values.items()}
+        return SalesPanel(self.keys.iloc[rows], self.dates, values, self.first_day[rows], key_cols=self.key_cols)
+
+    def row_offsets(self, trim_leading: bool = True) -> np.ndarray:
+        """Start row of each series in to_frame(trim_leading); len n_series + 1."""
+        lengths = self.n_days - self.first_day if trim_leading else np.full(self.n_series, self.n_days)
+        return np.concatenate(([0], np.cumsum(lengths)))
+
+    def to_frame(self, trim_leading: bool = True) -> pd.DataFrame:
+        """Long frame sorted by series then date, one row per calendar day.
+
+        With trim_leading, days before a series' first sale are dropped so new
+        products don't get a history of fake zeros.
+        """
+        day = np.tile(np.arange(self.n_days), self.n_series)
+        series = np.repeat(np.arange(self.n_series), self.n_days)
+        keep = day >= self.first_day[series] if trim_leading else slice(None)
+
+        series, day = series[keep], day[keep]
+        out = self.keys.iloc[series].reset_index(drop=True)
+        out.insert(0, 'date', self.dates[day])
+        for col, mat in self.values.items():
+            out[col] = mat.ravel()[keep]
+        return out
+
+
+def _compact_dtype(values: np.ndarray, dtype) -> np.dtype:
+    # Smallest dtype holding every value and the zero fill: the narrowest
+    # integer type for counts/flags, float32 for floats
+    if np.issubdtype(dtype, np.floating):
+        return np.dtype(np.float32)
+    if values.size == 0:
+        return np.dtype(np.uint8)
+    lo, hi = min(int(values.min()), 0), int(values.max())
+    return np.result_type(np.min_scalar_type(lo), np.min_scalar_type(hi))
+
+
+def build_panel(fact_sales: pd.DataFrame, keys: list | None = None, attrs: list | None = None,
+                start: pd.Timestamp = None, end: pd.Timestamp = None, compact: bool = False,
+                columns: list | None = None) -> SalesPanel:
+    """Reindex every series in fact_sales onto a full daily calendar.
+
+    fact_sales has at most one row per (keys, date), as produced by
+    create_fact_sales_daily. `attrs` are per-series columns (e.g. category)
+    carried onto panel.keys. compact stores keys as categoricals and each
+    value matrix in the smallest dtype that fits (mostly uint8 for daily
+    units at store grain), chosen from the column before the matrix is
+    allocated so the wide dtype never exists; for panels with many sparse
+    series. `columns` limits the value matrices built (default: all of
+    VALUE_DTYPES present).
+    """
+    keys = keys or SERIES_KEYS
+    attrs = [a for a in (attrs or []) if a in fact_sales.columns]
+    dates = pd.to_datetime(fact_sales['date'])
+    start = pd.Timestamp(start) if start is not None else dates.min()
+    end = pd.Timestamp(end) if end is not None else dates.max()
+    calendar = pd.date_range(start, end, freq='D')
+
+    in_range = ((dates >= start) & (dates <= end)).to_numpy()
+    fact_sales, dates = fact_sales[in_range], dates[in_range]
+
+    series_keys = fact_sales[keys + attrs].drop_duplicates(keys).sort_values(keys, kind='stable')
+    series_keys = series_keys.reset_index(drop=True)
+    series_idx = pd.MultiIndex.from_frame(series_keys[keys]).get_indexer(
+        pd.MultiIndex.from_frame(fact_sales[keys])
+    )
+    day_idx = ((dates - start) // pd.Timedelta(days=1)).to_numpy()
+
+    values = {}
+    for col, dtype in VALUE_DTYPES.items():
+        if col not in fact_sales.columns or (columns is not None and col not in columns):
+            continue
+        col_values = fact_sales[col].to_numpy()
+        if compact:
+            dtype = _compact_dtype(col_values, dtype)
+        mat = np.zeros((len(series_keys), len(calendar)), dtype=dtype)
+        mat[series_idx, day_idx] = col_values
+        values[col] = mat
+
+    first_day = np.full(len(series_keys), len(calendar), dtype=np.int64)
+    np.minimum.at(first_day, series_idx, day_idx)
+    if compact:
+        series_keys = series_keys.astype('category')
+    return SalesPanel(series_keys, calendar, values, first_day, key_cols=keys)
+
+
+def save_panel(panel: SalesPanel, directory: str) -> None:
+    """Write a panel with each value matrix as a sparse CSR .npz.
+
+    Days without sales are zeros, so at store grain most of the matrix
+    never reaches disk.
+    """
+    os.makedirs(directory, exist_ok=True)
+    panel.keys.to_parquet(os.path.join(directory, 'keys.parquet'), index=False)
+    for col, mat in panel.values.items():
+        sp.save_npz(os.path.join(directory, f'{col}.npz'), sp.csr_matrix(mat))
+    np.save(os.path.join(directory, 'first_day.npy'), panel.first_day)
+    meta = {'start': str(panel.dates[0].date()) if panel.n_days else None, 'n_days': panel.n_days,
+            'key_cols': panel.key_cols, 'values': list(panel.values)}
+    with open(os.path.join(directory, 'panel.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_panel(directory: str) -> SalesPanel:
+    with open(os.path.join(directory, 'panel.json')) as f:
+        meta = json.load(f)
+    dates = pd.date_range(meta['start'], periods=meta['n_days'], freq='D')
+    values = {col: sp.load_npz(os.path.join(directory, f'{col}.npz')).toarray() for col in meta['values']}
+    keys = pd.read_parquet(os.path.join(directory, 'keys.parquet'))
+    first_day = np.load(os.path.join(directory, 'first_day.npy'))
+    return SalesPanel(keys, dates, values, first_day, key_cols=meta['key_cols'])
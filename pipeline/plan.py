@@ -1,65 +1,208 @@
 
 import pandas as pd
 import numpy as np
+from pipeline.storage import read_curated
+from pipeline.profiling import stage
+from pipeline import simulation
 
-def generate_production_plan():
-    print("Generating production plan...")
-    
+# Planning knobs (overridable per run)
+SAFETY_FACTOR = 0.2
+MOQ = 50
+
+FORECAST_PATH = "data/outputs/forecast_daily.csv"
+STORE_FORECAST_PATH = "data/outputs/forecast_store_daily.csv"
+STORE_PLAN_PATH = "data/outputs/store_demand_weekly.csv"
+CHUNK_ROWS = 1_000_000  # store forecast rows read at a time
+
+
+def _weekly_sku_demand(forecast_path: str, keys: list) -> pd.DataFrame:
+    # Sum yhat per (week_start, keys) one chunk at a time, so a store-level
+    # forecast file never has to fit in memory
+    parts, rows = [], 0
+    for chunk in pd.read_csv(forecast_path, usecols=['date', *keys, 'yhat'], parse_dates=['date'],
+                             dtype={k: 'category' for k in keys}, chunksize=CHUNK_ROWS):
+        rows += len(chunk)
+        chunk['week_start'] = chunk['date'].dt.to_period('W').dt.start_time
+        parts.append(chunk.groupby(['week_start', *keys], observed=True)['yhat'].sum())
+    weekly = pd.concat(parts).groupby(level=list(range(len(keys) + 1))).sum()
+    return weekly.rename('forecast_units').reset_index(), rows
+
+
+def generate_store_demand_plan(forecast_path: str = STORE_FORECAST_PATH):
+    """Weekly forecast units per store and sku, for store replenishment.
+
+    share_of_sku is the store's part of the sku's total weekly demand, the
+    split to allocate the production plan's output by.
+    """
+    with stage('plan_store') as record:
+        print("Generating store demand plan...")
+        plan, record['rows_in'] = _weekly_sku_demand(forecast_path, ['store_id', 'sku'])
+        sku_total = plan.groupby(['week_start', 'sku'], observed=True)['forecast_units'].transform('sum')
+        plan['share_of_sku'] = (plan['forecast_units'] / sku_total.where(sku_total > 0)).fillna(0)
+        plan.to_csv(STORE_PLAN_PATH, index=False)
+        record['rows_out'] = len(plan)
+    return plan
+
+
+def project_inventory(demand: np.ndarray, on_hand: np.ndarray, on_order: np.ndarray, lead_weeks: np.ndarray,
+                      safety_factor: float = SAFETY_FACTOR, moq=MOQ, safety_stock: np.ndarray = None) -> dict:
+    """Rolling-horizon MRP for every SKU at once.
+
+    demand is (n_skus, n_weeks); on_hand, on_order and lead_weeks are per
+    SKU. Production released in week t is available from week
+    t + lead_weeks, and stock already on order lands in week lead_weeks.
+    Each week that production can still reach gets a receipt covering
+    demand plus safety stock, rounded up to the MOQ. Earlier weeks live
+    off stock and on-order only. Unmet demand is lost, not backordered.
+    Safety stock is demand * safety_factor unless safety_stock (per SKU,
+    or per SKU and week) is given. moq may also be per SKU.
+    The loop runs over weeks; every step is array math over all SKUs.
+    Returns (n_skus, n_weeks) arrays keyed safety_stock, start_on_hand,
+    receipts, production (releases by week), end_on_hand and shortage.
+    """
+    n_skus, n_weeks = demand.shape
+    rows = np.arange(n_skus)
+    lead = np.asarray(lead_weeks, dtype=int)
+    if safety_stock is None:
+        safety = demand * safety_factor
+    else:
+        safety = np.broadcast_to(np.reshape(safety_stock, (n_skus, -1)), demand.shape).astype(float)
+
+    receipts = np.zeros((n_skus, n_weeks))
+    arrives = lead < n_weeks
+    receipts[rows[arrives], lead[arrives]] += on_order[arrives]
+    production = np.zeros((n_skus, n_weeks))
+    start_on_hand = np.zeros((n_skus, n_weeks))
+    end_on_hand = np.zeros((n_skus, n_weeks))
+    shortage = np.zeros((n_skus, n_weeks))
+
+    stock = np.asarray(on_hand, dtype=float)
+    for t in range(n_weeks):
+        start_on_hand[:, t] = stock
+        available = stock + receipts[:, t]
+        net = demand[:, t] + safety[:, t] - available
+        plannable = (t >= lead) & (net > 0)
+        qty = np.where(plannable, np.ceil(net / moq) * moq, 0.0)
+        receipts[:, t] += qty
+        production[rows[plannable], t - lead[plannable]] = qty[plannable]
+        stock = available + qty - demand[:, t]
+        shortage[:, t] = np.maximum(-stock, 0)
+        stock = np.maximum(stock, 0)
+        end_on_hand[:, t] = stock
+
+    return {'safety_stock': safety, 'start_on_hand': start_on_hand, 'receipts': receipts,
+            'production': production, 'end_on_hand': end_on_hand, 'shortage': shortage}
+
+
+def _service_safety_stock(forecast_path, skus, lead_days, stock_position, target, metric, moq, paths) -> pd.DataFrame:
+    # Simulated safety stock per sku for the target service level; also
+    # written out with the stockout probability and fill rate it achieves
+    calibrated = simulation.bands_calibrated(forecast_path)
+    if not calibrated:
+        print("Warning: forecast intervals are not backtest-calibrated (run `backtest`, then `forecast`); "
+              "service levels are approximate")
+    mean, sd = simulation.daily_sku_demand(forecast_path)
+    mean, sd = mean.reindex(skus, fill_value=0.0), sd.reindex(skus, fill_value=0.0)
+    service = simulation.order_for_service(mean.to_numpy(), sd.to_numpy(), lead_days, stock_position,
+                                           target, metric, moq=moq, n_paths=paths)
+    service.insert(0, 'sku', skus)
+    service.insert(1, 'target', target)
+    service.insert(2, 'metric', metric)
+    service.insert(3, 'calibrated', calibrated)
+    service.to_csv(simulation.SERVICE_PATH, index=False)
+    return service
+
+
+def plan_inputs(forecast_path: str = FORECAST_PATH) -> dict:
+    """Weekly demand (sku x week frame) and per-sku starting position arrays.
+
+    Keys: demand, on_hand, on_order, lead_days (aligned with demand's
+    rows), sku_map and rows_in (forecast rows read).
+    """
     # Load inputs
-    forecast = pd.read_csv("data/outputs/forecast_daily.csv")
-    inventory = pd.read_csv("data/curated/fact_inventory_daily.csv")
-    sku_map = pd.read_csv("data/curated/dim_product.csv")
-    
+    inventory = read_curated('fact_inventory_daily', columns=['date', 'sku', 'on_hand', 'on_order', 'lead_time_days'])
+    sku_map = read_curated('dim_product', columns=['sku', 'product_name', 'pack_size'])
+    # Latest snapshot per sku is the starting position
+    inventory = inventory.sort_values('date').drop_duplicates('sku', keep='last')
+
     # 1. Aggregate Forecast to Weekly per SKU (ignore channel split for production)
-    # We need total demand per sku
-    forecast['week_start'] = pd.to_datetime(forecast['date']).dt.to_period('W').apply(lambda r: r.start_time)
-    
-    # Sum forecast units across channels and days
-    weekly_demand = forecast.groupby(['week_start', 'sku'])['yhat'].sum().reset_index()
-    weekly_demand.rename(columns={'yhat': 'forecast_units'}, inplace=True)
-    
+    # We need total demand per sku, summed across channels (and stores) and days.
+    # forecast_path may be the channel or the store-level forecast.
+    weekly_demand, rows_in = _weekly_sku_demand(forecast_path, ['sku'])
+    weekly_demand['sku'] = weekly_demand['sku'].astype(str)
+    demand = weekly_demand.pivot_table(index='sku', columns='week_start', values='forecast_units',
+                                       aggfunc='sum', fill_value=0.0)
+
     # 2. Planning Parameters
-    # Merge inventory snapshot (assuming inventory is "current" at start of planning)
-    # real world: inventory changes over time. here: static snapshot for "Next Week Plan"
-    
-    # We implement a "First Week Plan" only for the demo
-    next_week = weekly_demand['week_start'].min()
-    plan = weekly_demand[weekly_demand['week_start'] == next_week].copy()
-    
-    plan = plan.merge(inventory[['sku', 'on_hand', 'on_order', 'lead_time_days']], on='sku', how='left')
-    plan = plan.merge(sku_map[['sku', 'product_name', 'pack_size']], on='sku', how='left')
+    # Starting position per sku from the inventory snapshot; SKUs without
+    # one start empty with no lead time
+    position = inventory.set_index('sku').reindex(demand.index)
+    return {
+        'demand': demand,
+        'on_hand': position['on_hand'].fillna(0).to_numpy(dtype=float),
+        'on_order': position['on_order'].fillna(0).to_numpy(dtype=float),
+        'lead_days': position['lead_time_days'].fillna(0).to_numpy(dtype=float),
+        'sku_map': sku_map,
+        'rows_in': rows_in,
+    }
+
+
+def generate_production_plan(safety_factor: float = SAFETY_FACTOR, moq: int = MOQ,
+                             forecast_path: str = FORECAST_PATH, service_level: float | None = None,
+                             service_metric: str = 'cycle', paths: int = simulation.DEFAULT_PATHS):
+    """Weekly production plan for every SKU over the whole forecast horizon.
+
+    Weekly demand is laid out as a sku x week matrix and projected with
+    project_inventory from the latest inventory snapshot, honouring each
+    SKU's lead time. With service_level set, safety stock comes from a
+    Monte Carlo simulation of demand over lead time + review
+    (pipeline.simulation) instead of safety_factor.
+    """
+    with stage('plan') as record:
+        print("Generating production plan...")
     
-    # 3. Logic
-    # Safety Stock (heuristic: 1.65 * sqrt(lead_time_weeks) * std_dev_demand)
-    # We don't have std_dev directly here easily without history. 
-    # Heuristic: 20% of demand * lead_time factor
-    # Let's trust the "forecast" and add 20% buffer.
+        inputs = plan_inputs(forecast_path)
+        demand, sku_map, record['rows_in'] = inputs['demand'], inputs['sku_map'], inputs['rows_in']
+        skus, weeks = demand.index, demand.columns
+        on_hand, on_order, lead_days = inputs['on_hand'], inputs['on_order'], inputs['lead_days']
+        lead_weeks = np.ceil(lead_days / 7).astype(int)
     
-    plan['safety_stock'] = plan['forecast_units'] * 0.2
-    plan['target_on_hand'] = plan['forecast_units'] + plan['safety_stock']
+        safety_stock = None
+        if service_level is not None:
+            service = _service_safety_stock(forecast_path, skus, lead_days, on_hand + on_order, service_level,
+                                            service_metric, moq, paths)
+            safety_stock = service['safety_stock'].to_numpy()
+            record['service_level'] = service_level
+            record['service_calibrated'] = bool(service['calibrated'].all())
     
-    # Net Requirements
-    plan['net_demand'] = plan['target_on_hand'] - (plan['on_hand'] + plan['on_order'])
-    plan['suggested_production'] = plan['net_demand'].apply(lambda x: max(0, x))
+        # 3. Logic: project every SKU week by week
+        projection = project_inventory(demand.to_numpy(dtype=float), on_hand, on_order, lead_weeks, safety_factor, moq,
+                                       safety_stock=safety_stock)
     
-    # MOQ Constraint
-    MOQ = 50
-    plan['suggested_production'] = np.ceil(plan['suggested_production'] / MOQ) * MOQ
+        # Output, one row per sku and week
+        plan = pd.DataFrame({
+            'week_start': np.tile(weeks, len(skus)),
+            'sku': np.repeat(skus, len(weeks)),
+            'forecast_units': demand.to_numpy().ravel(),
+        })
+        plan['safety_stock'] = projection['safety_stock'].ravel()
+        plan['on_hand'] = projection['start_on_hand'].ravel()
+        plan['planned_receipts'] = projection['receipts'].ravel()
+        plan['suggested_production'] = projection['production'].ravel()
+        plan['projected_on_hand'] = projection['end_on_hand'].ravel()
+        plan['shortage'] = projection['shortage'].ravel()
+        plan = plan.merge(sku_map[['sku', 'product_name', 'pack_size']], on='sku', how='left')
     
-    # Notes
-    def get_notes(row):
-        notes = []
-        if row['suggested_production'] > 0:
-            notes.append(f"Rounded to MOQ {MOQ}")
-        if row['on_hand'] < row['safety_stock']:
-            notes.append("Low Stock")
-        return "; ".join(notes)
-        
-    plan['notes'] = plan.apply(get_notes, axis=1)
+        # Notes
+        rounded = np.where(plan['suggested_production'] > 0, f"Rounded to MOQ {moq}", "")
+        low = np.where(plan['on_hand'] < plan['safety_stock'], "Low Stock", "")
+        plan['notes'] = pd.Series(rounded).str.cat(low, sep="; ").str.strip("; ").to_numpy()
     
-    # Output
-    output_cols = ['week_start', 'sku', 'product_name', 'forecast_units', 'safety_stock', 'on_hand', 'suggested_production', 'notes']
-    plan[output_cols].to_csv("data/outputs/production_plan_weekly.csv", index=False)
+        output_cols = ['week_start', 'sku', 'product_name', 'forecast_units', 'safety_stock', 'on_hand',
+                       'planned_receipts', 'suggested_production', 'projected_on_hand', 'shortage', 'notes']
+        plan[output_cols].to_csv("data/outputs/production_plan_weekly.csv", index=False)
+        record['rows_out'] = len(plan)
+        record['weeks'] = len(weeks)
     
     print("Production plan generated.")
     return plan
@@ -0,0 +1,150 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, RSS fields are reported as null
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # optional: without it live worker processes are not counted
+    psutil = None
+
+# Profiler collecting stage records for the current run, if any. Pipeline
+# functions call stage(...) unconditionally; without an active profiler the
+# records are simply dropped.
+_ACTIVE = None
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _child_cpu():
+    # CPU used by worker processes (e.g. the joblib pool). getrusage only
+    # sees reaped children, and loky keeps its workers alive between calls,
+    # so live children are sampled with psutil when it is installed
+    total = 0.0
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        total += usage.ru_utime + usage.ru_stime
+    if psutil is not None:
+        for child in psutil.Process().children(recursive=True):
+            try:
+                times = child.cpu_times()
+            except psutil.Error:  # exited since listed; counted once reaped
+                continue
+            total += times.user + times.system
+    return total
+
+
+class StageProfiler:
+    """Collects wall/CPU time, peak RSS and row throughput per stage.
+
+    With profile_dir set, each top-level stage also runs under cProfile and
+    dumps <stage>.prof plus a <stage>.txt summary of the top functions.
+    """
+
+    def __init__(self, profile_dir: str | None = None):
+        self.profile_dir = profile_dir
+        self.stages = {}
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name: str):
+        record = {'rows_in': None, 'rows_out': None}
+        profiler = None
+        if self.profile_dir and not self._stack:
+            # cProfile can't nest, so only top-level stages get a dump
+            profiler = cProfile.Profile()
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(name)
+
+        rss_before = _peak_rss_mb()
+        wall0, cpu0, child0 = time.perf_counter(), time.process_time(), _child_cpu()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            wall = time.perf_counter() - wall0
+            self._stack.pop()
+            record.update({
+                'wall_seconds': round(wall, 4),
+                'cpu_seconds': round(time.process_time() - cpu0 + _child_cpu() - child0, 4),
+                # Process high-water mark at stage end, and how much this stage raised it
+                'peak_rss_mb': _peak_rss_mb(),
+                'peak_rss_growth_mb': (
+                    round(_peak_rss_mb() - rss_before, 1) if rss_before is not None else None
+                ),
+            })
+            rows = record['rows_in'] if record['rows_in'] is not None else record['rows_out']
+            record['rows_per_second'] = round(rows / wall, 1) if rows is not None and wall > 0 else None
+            if parent:
+                record['parent'] = parent
+            if profiler:
+                record['profile'] = self._dump(name, profiler)
+            self.stages[name] = record
+
+    def _dump(self, name: str, profiler: cProfile.Profile) -> str:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{name}.prof")
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(30)
+        with open(os.path.join(self.profile_dir, f"{name}.txt"), "w") as f:
+            f.write(out.getvalue())
+        return path
+
+    def report(self) -> dict:
+        return self.stages
+
+
+@contextmanager
+def activate(profiler: StageProfiler):
+    global _ACTIVE
+    previous, _ACTIVE = _ACTIVE, profiler
+    try:
+        yield profiler
+    finally:
+        _ACTIVE = previous
+
+
+@contextmanager
+def stage(name: str):
+    """Record a stage on the active profiler; a no-op record otherwise."""
+    if _ACTIVE is None:
+        yield {}
+        return
+    with _ACTIVE.stage(name) as record:
+        yield record
+
+
+def histogram(values, bins: int = 10) -> dict:
+    """Compact summary of per-series timings for the report."""
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return {'count': 0}
+    counts, edges = np.histogram(values, bins=bins)
+    return {
+        'count': int(values.size),
+        'total_seconds': round(float(values.sum()), 4),
+        'p50': round(float(np.percentile(values, 50)), 4),
+        'p95': round(float(np.percentile(values, 95)), 4),
+        'max': round(float(values.max()), 4),
+        'bin_edges': [round(float(e), 4) for e in edges],
+        'counts': counts.tolist(),
+    }
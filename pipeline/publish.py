@@ -0,0 +1,250 @@
+import gzip
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:  # optional: without it only .gz siblings are written
+    brotli = None
+
+DASHBOARD_DATA_DIR = "dashboard/public/data"
+OUTPUTS_DIR = "data/outputs"
+PRODUCT_PATH = "data/curated/dim_product.csv"
+# Unhashed entry point the pages read first: artifact name -> hashed file
+MANIFEST = "manifest.json"
+# Rows kept in the ranked tables (worst MAPE, largest plan variance, ...)
+TOP_N = 50
+CHUNK_ROWS = 1_000_000
+DECIMALS = 2
+
+
+def columnar(df: pd.DataFrame) -> dict:
+    """{column: [values]} with dates as ISO strings and floats rounded.
+
+    Column-wise lists repeat each key once instead of once per row and
+    compress well, since runs of skus/channels/dates sit together.
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            s = s.dt.strftime('%Y-%m-%d')
+        elif pd.api.types.is_float_dtype(s):
+            s = s.round(DECIMALS)
+        out[col] = [None if v is None or (isinstance(v, float) and np.isnan(v)) else v for v in s.tolist()]
+    return out
+
+
+def _read(name: str, **kwargs) -> pd.DataFrame:
+    path = os.path.join(OUTPUTS_DIR, name)
+    return pd.read_csv(path, **kwargs) if os.path.exists(path) else None
+
+
+def _products() -> pd.DataFrame:
+    if not os.path.exists(PRODUCT_PATH):
+        return pd.DataFrame(columns=['sku', 'product_name', 'category', 'pack_size', 'active_flag'])
+    return pd.read_csv(PRODUCT_PATH, dtype={'sku': str, 'active_flag': str})
+
+
+def forecast_rollups(path: str, products: pd.DataFrame) -> dict:
+    """Daily sku totals plus weekly channel and category rollups of a forecast.
+
+    Read in chunks and summed over channels (and stores) as it goes, so
+    the artifact grows with skus x horizon, not with the forecast's grain.
+    Interval bounds are summed too, which is conservative for a total.
+    """
+    if not os.path.exists(path):
+        return None
+    values = ['yhat', 'yhat_lower', 'yhat_upper']
+    category = products.set_index('sku')['category']
+    daily, channel = [], []
+    for chunk in pd.read_csv(path, usecols=['date', 'channel', 'sku', *values], parse_dates=['date'],
+                             dtype={'sku': 'category', 'channel': 'category'}, chunksize=CHUNK_ROWS):
+        daily.append(chunk.groupby(['sku', 'date'], observed=True)[values].sum())
+        channel.append(chunk.groupby(['channel', 'date'], observed=True)['yhat'].sum())
+    daily = pd.concat(daily).groupby(level=[0, 1]).sum().reset_index()
+    daily['sku'] = daily['sku'].astype(str)
+    channel = pd.concat(channel).groupby(level=[0, 1]).sum().reset_index()
+
+    def weekly(df, key):
+        week = df['date'].dt.to_period('W').dt.start_time.rename('week_start')
+        return df.groupby([week, df[key].astype(str)])['yhat'].sum().reset_index()
+
+    daily['category'] = daily['sku'].map(category).fillna('Unknown')
+    return {
+        'daily_by_sku': columnar(daily[['date', 'sku', *values]]),
+        'weekly_by_channel': columnar(weekly(channel, 'channel')),
+        'weekly_by_category': columnar(weekly(daily, 'category')),
+        'sku_totals': daily.groupby('sku')['yhat'].sum(),
+    }
+
+
+def _report_summary() -> dict:
+    path = os.path.join(OUTPUTS_DIR, 'pipeline_report.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        report = json.load(f)
+    keys = ['status', 'timestamp', 'runtime_seconds', 'steps', 'cached_steps']
+    return {k: report[k] for k in keys if k in report}
+
+
+def build_artifacts(top_n: int = TOP_N) -> dict:
+    """Per-page payloads for the dashboard: {artifact name: bytes}.
+
+    Each page gets one JSON with its KPIs computed over all rows, rollups
+    and top-N tables, so what the browser downloads stays flat as history
+    and the sku count grow. The full weekly plan CSV is kept as a download.
+    """
+    products = _products()
+    forecast = forecast_rollups(os.path.join(OUTPUTS_DIR, 'forecast_daily.csv'), products)
+    metrics = _read('forecast_metrics.csv', dtype={'sku': str})
+    plan = _read('production_plan_weekly.csv', dtype={'sku': str})
+    negative = _read('dq_negative_pos.csv', usecols=['date', 'sku', 'units_sold'], parse_dates=['date'],
+                     dtype={'sku': str})
+    beers = products[products['category'] == 'Beer']
+    catalog_counts = {
+        'products': len(products),
+        'beers': len(beers),
+        'active_beers': int((beers['active_flag'] == '1').sum()),
+    }
+    pages = {}
+
+    overview = {'report': _report_summary(), 'catalog': catalog_counts, 'metrics': None, 'dq': None}
+    if metrics is not None:
+        worst = metrics.sort_values('mape_ml', ascending=False).head(top_n)
+        overview['metrics'] = {
+            'series': len(metrics),
+            'avg_mape_ml': round(float(metrics['mape_ml'].mean()), 4) if len(metrics) else None,
+            'ml_best_share': round(float((metrics['best_model'] == 'ML').mean()), 4) if len(metrics) else None,
+            'worst': columnar(worst[['channel', 'sku', 'best_model', 'mape_ml', 'mape_baseline']]),
+        }
+    if negative is not None:
+        month = negative['date'].dt.to_period('M').astype(str).rename('month')
+        overview['dq'] = {
+            'negative_pos_rows': len(negative),
+            'by_month': columnar(negative.groupby(month)['units_sold'].agg(['size', 'sum']).reset_index()
+                                 .rename(columns={'size': 'rows', 'sum': 'units'})),
+        }
+    pages['overview'] = overview
+
+    if forecast is not None:
+        pages['forecast'] = {k: v for k, v in forecast.items() if k != 'sku_totals'}
+
+    if plan is not None:
+        plan['week_start'] = pd.to_datetime(plan['week_start'])
+        sums = ['forecast_units', 'suggested_production'] + (['shortage'] if 'shortage' in plan else [])
+        action = plan[plan['suggested_production'] > 0] if 'suggested_production' in plan else plan
+        top = action.sort_values(['suggested_production', 'week_start'], ascending=[False, True]).head(top_n)
+        cols = [c for c in ['week_start', 'sku', 'product_name', 'forecast_units', 'safety_stock', 'on_hand',
+                            'suggested_production', 'projected_on_hand', 'notes'] if c in plan]
+        pages['planning'] = {
+            'rows': len(plan),
+            'weekly': columnar(plan.groupby('week_start')[sums].sum().reset_index()),
+            'top_production': columnar(top[cols].fillna({'notes': ''}) if 'notes' in cols else top[cols]),
+        }
+
+        by_sku = plan.groupby('sku').agg(product_name=('product_name', 'first'),
+                                         planned_sales=('forecast_units', 'sum'),
+                                         suggested_production=('suggested_production', 'sum'))
+        totals = forecast['sku_totals'] if forecast is not None else pd.Series(dtype=float)
+        by_sku['forecasted_sales'] = totals.reindex(by_sku.index).fillna(0.0)
+        by_sku['variance'] = by_sku['planned_sales'] - by_sku['forecasted_sales']
+        sales = by_sku.reset_index()
+        sales = sales.loc[sales['variance'].abs().sort_values(ascending=False, kind='stable').index[:top_n]]
+        pages['sales_plan'] = {
+            'totals': {k: round(float(by_sku[k].sum()), DECIMALS)
+                       for k in ['forecasted_sales', 'planned_sales', 'suggested_production', 'variance']},
+            'skus': len(by_sku),
+            'top_variance': columnar(sales[['sku', 'product_name', 'forecasted_sales', 'planned_sales',
+                                            'suggested_production', 'variance']]),
+        }
+
+    def counts(s):
+        return s.fillna('Unknown').value_counts().to_dict()
+
+    pages['catalog'] = {
+        **catalog_counts,
+        'by_category': counts(products['category']),
+        'beer_pack_sizes': counts(beers['pack_size']),
+        'beer_products': columnar(beers[['sku', 'product_name', 'pack_size', 'active_flag']]),
+    }
+
+    artifacts = {f"{name}.json": json.dumps(payload, separators=(',', ':'), default=_plain).encode()
+                 for name, payload in pages.items()}
+    plan_csv = os.path.join(OUTPUTS_DIR, 'production_plan_weekly.csv')
+    if os.path.exists(plan_csv):
+        with open(plan_csv, 'rb') as f:
+            artifacts['production_plan_weekly.csv'] = f.read()
+    return artifacts
+
+
+def _plain(value):
+    # numpy scalars in dict payloads (value_counts, aggregates)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def hashed_name(name: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _siblings(path: str) -> list:
+    return [path, path + '.gz', path + '.br']
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_artifacts(artifacts: dict, dest_dir: str = DASHBOARD_DATA_DIR) -> dict:
+    """Write content-hashed artifacts with .gz (and .br) siblings; returns counts.
+
+    A hashed file that already exists has the same content, so only new
+    or changed artifacts are written. The manifest is replaced atomically
+    after its files exist, then files of the previous manifest that are
+    no longer referenced are removed. Hashed files can be served with a
+    far-future cache lifetime; only the manifest needs revalidation.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    manifest_path = os.path.join(dest_dir, MANIFEST)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f).get('files', {})
+
+    files, stats = {}, {'written': 0, 'unchanged': 0, 'removed': 0, 'bytes': 0, 'gzip_bytes': 0}
+    for name, data in sorted(artifacts.items()):
+        target = hashed_name(name, data)
+        path = os.path.join(dest_dir, target)
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if all(os.path.exists(p) for p in _siblings(path)[:2]):
+            stats['unchanged'] += 1
+        else:
+            _write_atomic(path, data)
+            _write_atomic(path + '.gz', compressed)
+            if brotli is not None:
+                _write_atomic(path + '.br', brotli.compress(data))
+            stats['written'] += 1
+        files[name] = {'path': target, 'bytes': len(data), 'gzip_bytes': len(compressed)}
+        stats['bytes'] += len(data)
+        stats['gzip_bytes'] += len(compressed)
+
+    if files != previous:
+        _write_atomic(manifest_path, json.dumps({'files': files}, indent=2, sort_keys=True).encode())
+    live = {entry['path'] for entry in files.values()}
+    for entry in previous.values():
+        if entry['path'] not in live:
+            for p in _siblings(os.path.join(dest_dir, entry['path'])):
+                if os.path.exists(p):
+                    os.remove(p)
+                    stats['removed'] += 1
+    return stats
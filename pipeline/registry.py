@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import joblib
+import pandas as pd
+
+MODEL_DIR = "data/models"
+INDEX_NAME = "index.json"
+# Size cap for stored model files; least recently used entries go first
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# When a stored model may be reused instead of refitting:
+#   always  - never reuse, refit everything (stored models are still saved)
+#   changed - reuse only if the training data and hyperparameters are identical
+#   drift   - also reuse on changed data unless the model's recent error drifted
+#   never   - predict-only: reuse whatever is stored, fit only series without a model
+REFIT_POLICIES = ('always', 'changed', 'drift', 'never')
+# 'drift' refits when recent MAPE exceeds the stored holdout MAPE by this share
+DRIFT_TOLERANCE = 0.25
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """sha256 of a frame's values (row hashes), independent of its index."""
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def params_digest(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ModelRegistry:
+    """Fitted models on disk, keyed by series, training data and hyperparameters.
+
+    Each entry is one joblib file plus a row in index.json holding its
+    hashes, size, holdout metrics and a logical last-used clock. `latest`
+    points every (series, params) pair at its newest entry, so a changed
+    series can still predict from its previous model. Once
+    the files exceed max_bytes (or max_entries), the least recently used
+    entries are deleted. Not safe for concurrent writers: forecast.py reads
+    and writes it from the parent process only.
+    """
+
+    def __init__(self, root: str = MODEL_DIR, max_bytes: int = DEFAULT_MAX_BYTES, max_entries: int | None = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.index_path = os.path.join(root, INDEX_NAME)
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'clock': 0, 'entries': {}, 'latest': {}}
+
+    @staticmethod
+    def key(series: str, data_hash: str, params_hash: str) -> str:
+        return hashlib.sha256(f"{series}|{data_hash}|{params_hash}".encode()).hexdigest()[:24]
+
+    def _tick(self) -> int:
+        self.index['clock'] += 1
+        return self.index['clock']
+
+    def _load(self, key: str) -> dict:
+        entry = self.index['entries'][key]
+        entry['last_used'] = self._tick()
+        return {**entry, 'key': key, 'model': joblib.load(os.path.join(self.root, entry['path']))}
+
+    def get(self, series: str, data_hash: str, params_hash: str):
+        """Entry (with its loaded model) for exactly this data, or None."""
+        key = self.key(series, data_hash, params_hash)
+        return self._load(key) if key in self.index['entries'] else None
+
+    def latest(self, series: str, params_hash: str):
+        """Newest entry for the series with these hyperparameters, or None."""
+        key = self.index['latest'].get(f"{series}|{params_hash}")
+        return self._load(key) if key in self.index['entries'] else None
+
+    def put(self, series: str, data_hash: str, params_hash: str, model, metrics=None) -> str:
+        key = self.key(series, data_hash, params_hash)
+        os.makedirs(self.root, exist_ok=True)
+        path = f"{key}.joblib"
+        joblib.dump(model, os.path.join(self.root, path))
+        self.index['entries'][key] = {
+            'series': series,
+            'data_hash': data_hash,
+            'params_hash': params_hash,
+            'path': path,
+            'bytes': os.path.getsize(os.path.join(self.root, path)),
+            'metrics': metrics,
+            'last_used': self._tick(),
+        }
+        self.index['latest'][f"{series}|{params_hash}"] = key
+        return key
+
+    def evict(self) -> list:
+        """Drop least recently used entries until within the size/count caps."""
+        entries = self.index['entries']
+        total = sum(e['bytes'] for e in entries.values())
+        evicted = []
+        for key in sorted(entries, key=lambda k: entries[k]['last_used']):
+            over_count = self.max_entries is not None and len(entries) > self.max_entries
+            if total <= self.max_bytes and not over_count:
+                break
+            entry = entries.pop(key)
+            total -= entry['bytes']
+            path = os.path.join(self.root, entry['path'])
+            if os.path.exists(path):
+                os.remove(path)
+            evicted.append(key)
+        self.index['latest'] = {s: k for s, k in self.index['latest'].items() if k in entries}
+        return evicted
+
+    def save(self) -> None:
+        """Evict, then write the index atomically."""
+        self.evict()
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp, self.index_path)
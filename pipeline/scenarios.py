@@ -0,0 +1,137 @@
+import itertools
+import json
+import numpy as np
+import pandas as pd
+from pipeline.plan import FORECAST_PATH, MOQ, SAFETY_FACTOR, plan_inputs, project_inventory
+from pipeline.profiling import stage
+from pipeline.storage import read_curated
+
+SCENARIO_PATH = "data/outputs/scenario_comparison.csv"
+# Scenario keys and their defaults (the plan's own knobs). moq and
+# demand_shock take a number, or a {sku: value} dict with '*' for the rest.
+# promo_weeks lists dates (or week numbers from 0) whose weeks are on promotion,
+# for promo_skus (default all) with demand scaled by promo_lift (default:
+# each sku's historical promo / non-promo sales ratio).
+SCENARIO_DEFAULTS = {
+    'safety_factor': SAFETY_FACTOR,
+    'moq': MOQ,
+    'demand_shock': 1.0,
+    'promo_weeks': [],
+    'promo_skus': None,
+    'promo_lift': None,
+}
+
+
+def expand_scenarios(spec) -> list:
+    """Scenario dicts from a list of scenarios and/or a {'grid': {key: [values]}}.
+
+    A grid expands to the cartesian product of its values. Unnamed
+    scenarios are named after the keys they set.
+    """
+    if isinstance(spec, dict):
+        grid = spec.get('grid', {})
+        scenarios = list(spec.get('scenarios', []))
+        keys = list(grid)
+        scenarios += [dict(zip(keys, values)) for values in itertools.product(*grid.values())] if keys else []
+    else:
+        scenarios = list(spec)
+    for sc in scenarios:
+        unknown = set(sc) - set(SCENARIO_DEFAULTS) - {'name'}
+        if unknown:
+            raise ValueError(f"Unknown scenario keys {sorted(unknown)}, expected {sorted(SCENARIO_DEFAULTS)}")
+    return [{'name': sc.get('name') or (",".join(f"{k}={json.dumps(v)}" for k, v in sc.items()) or 'base'),
+             **SCENARIO_DEFAULTS, **sc} for sc in scenarios]
+
+
+def promo_lift(df: pd.DataFrame = None) -> pd.Series:
+    """Historical promo uplift per sku: mean units on promo / off promo days.
+
+    Skus never (or always) on promo use the lift pooled over all skus.
+    """
+    if df is None:
+        df = read_curated('fact_sales_daily', columns=['sku', 'units_sold', 'promo_flag'])
+    df = df.assign(sku=df['sku'].astype(str), promo=df['promo_flag'].astype(bool))
+    means = df.groupby(['sku', 'promo'])['units_sold'].mean().unstack()
+    pooled = df.groupby('promo')['units_sold'].mean()
+    default = pooled.get(True, np.nan) / pooled.get(False, np.nan)
+    default = default if np.isfinite(default) else 1.0
+    if True not in means.columns or False not in means.columns:
+        return pd.Series(default, index=means.index)
+    return (means[True] / means[False]).replace([np.inf, -np.inf], np.nan).fillna(default)
+
+
+def _per_sku(value, skus: pd.Index, default: float) -> np.ndarray:
+    if isinstance(value, dict):
+        return pd.Series(value, dtype=float).reindex(skus).fillna(value.get('*', default)).to_numpy()
+    return np.full(len(skus), float(value))
+
+
+def _scenario_arrays(sc: dict, demand: pd.DataFrame, lift: pd.Series):
+    # Demand (n_skus, n_weeks), safety stock and per-sku MOQ for one scenario
+    skus, weeks = demand.index, demand.columns
+    base = demand.to_numpy(dtype=float) * _per_sku(sc['demand_shock'], skus, 1.0)[:, None]
+    if sc['promo_weeks']:
+        # Dates map to their week; weeks outside the forecast horizon are ignored
+        numbered = [w for w in sc['promo_weeks'] if isinstance(w, int)]
+        dated = pd.DatetimeIndex([w for w in sc['promo_weeks'] if not isinstance(w, int)])
+        on_promo = np.isin(np.arange(len(weeks)), numbered)
+        found = weeks.get_indexer(dated.to_period('W').start_time)
+        on_promo[found[found >= 0]] = True
+        promo_skus = skus.isin(sc['promo_skus']) if sc['promo_skus'] is not None else np.ones(len(skus), dtype=bool)
+        sku_lift = (_per_sku(sc['promo_lift'], skus, 1.0) if sc['promo_lift'] is not None
+                    else lift.reindex(skus).fillna(1.0).to_numpy())
+        base = np.where(promo_skus[:, None] & on_promo[None, :], base * sku_lift[:, None], base)
+    return base, base * sc['safety_factor'], _per_sku(sc['moq'], skus, MOQ)
+
+
+def evaluate_scenarios(scenarios: list, inputs: dict, lift: pd.Series = None) -> pd.DataFrame:
+    """Plan every scenario in one batched projection and compare them.
+
+    Scenario x sku rows are stacked into a single (n_scenarios * n_skus,
+    n_weeks) problem for project_inventory, so the shared forecast and
+    inventory arrays are used as-is and nothing upstream re-runs. One
+    row per scenario.
+    """
+    demand = inputs['demand']
+    n_skus, n_weeks = demand.shape
+    if lift is None:
+        lift = pd.Series(dtype=float)
+    arrays = [_scenario_arrays(sc, demand, lift) for sc in scenarios]
+    D, safety, moq = (np.concatenate(parts) for parts in zip(*arrays))
+    n_scen = len(scenarios)
+    projection = project_inventory(
+        D, np.tile(inputs['on_hand'], n_scen), np.tile(inputs['on_order'], n_scen),
+        np.tile(np.ceil(inputs['lead_days'] / 7).astype(int), n_scen), moq=moq, safety_stock=safety,
+    )
+
+    def per_scenario(a):
+        return a.reshape(n_scen, n_skus, n_weeks)
+
+    production, shortage = per_scenario(projection['production']), per_scenario(projection['shortage'])
+    total_demand = per_scenario(D).sum(axis=(1, 2))
+    out = pd.DataFrame({
+        'scenario': [sc['name'] for sc in scenarios],
+        'demand_units': total_demand,
+        'production_units': production.sum(axis=(1, 2)),
+        'production_runs': (production > 0).sum(axis=(1, 2)),
+        'peak_week_production': production.sum(axis=1).max(axis=1),
+        'avg_on_hand': per_scenario(projection['end_on_hand']).sum(axis=1).mean(axis=1),
+        'shortage_units': shortage.sum(axis=(1, 2)),
+        'skus_short': (shortage.sum(axis=2) > 0).sum(axis=1),
+    })
+    out['fill_rate'] = 1 - np.divide(out['shortage_units'], total_demand, out=np.zeros(n_scen), where=total_demand > 0)
+    return out
+
+
+def run_scenarios(spec, forecast_path: str = FORECAST_PATH, path: str = SCENARIO_PATH) -> pd.DataFrame:
+    with stage('scenarios') as record:
+        scenarios = expand_scenarios(spec)
+        print(f"Evaluating {len(scenarios)} scenario(s)...")
+        inputs = plan_inputs(forecast_path)
+        needs_lift = any(sc['promo_weeks'] and sc['promo_lift'] is None for sc in scenarios)
+        table = evaluate_scenarios(scenarios, inputs, promo_lift() if needs_lift else None)
+        table.to_csv(path, index=False)
+        record['rows_in'] = len(scenarios) * inputs['demand'].size
+        record['rows_out'] = len(table)
+    print(f"Scenario comparison written to {path}")
+    return table
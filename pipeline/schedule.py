@@ -0,0 +1,229 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.optimize import Bounds, LinearConstraint, milp
+from pipeline.plan import MOQ
+from pipeline.profiling import stage
+from pipeline.storage import read_curated
+
+PLAN_PATH = "data/outputs/production_plan_weekly.csv"
+SCHEDULE_PATH = "data/outputs/production_schedule_weekly.csv"
+# Optional line setup, one row per line x compatible sku ('*' = every sku):
+# line, sku, units_per_hour, hours_per_week, changeover_hours
+LINES_PATH = "data/config/production_lines.csv"
+LINE_COLUMNS = ['line', 'sku', 'units_per_hour', 'hours_per_week', 'changeover_hours']
+# Without a lines file every pack size gets one line with these settings
+DEFAULT_UNITS_PER_HOUR = 200
+DEFAULT_HOURS_PER_WEEK = 80
+DEFAULT_CHANGEOVER_HOURS = 2
+
+SOLVERS = ('auto', 'milp', 'greedy')
+TIME_LIMIT = 30  # seconds for the MILP
+# 'auto' skips the MILP above this many line x sku x week setup binaries. HiGHS
+# checks time_limit between cut rounds, so very large models can overrun it.
+MAX_MILP_SETUPS = 10_000
+# Objective weights, per unit-week and per changeover hour
+HOLDING_COST = 1.0
+LATE_COST = 20.0
+CHANGEOVER_COST = 50.0
+
+
+def load_lines(skus, path: str = LINES_PATH, products: pd.DataFrame = None) -> pd.DataFrame:
+    """Line x sku compatibility with rates, capacities and changeover times.
+
+    Rows with sku '*' apply to every sku. Without a lines file each pack
+    size gets its own line (LINE_6PK, ...) using the DEFAULT_* settings.
+    """
+    skus = pd.Index(skus, dtype=str)
+    if os.path.exists(path):
+        lines = pd.read_csv(path, dtype={'line': str, 'sku': str})
+        wildcard = lines['sku'] == '*'
+        expanded = lines[wildcard].drop(columns='sku').merge(pd.DataFrame({'sku': skus}), how='cross')
+        lines = pd.concat([lines[~wildcard], expanded], ignore_index=True)
+    else:
+        products = products if products is not None else read_curated('dim_product', columns=['sku', 'pack_size'])
+        pack = products.set_index('sku')['pack_size'].astype(str).reindex(skus).fillna('OTHER')
+        lines = pd.DataFrame({
+            'line': 'LINE_' + pack.to_numpy(),
+            'sku': skus,
+            'units_per_hour': DEFAULT_UNITS_PER_HOUR,
+            'hours_per_week': DEFAULT_HOURS_PER_WEEK,
+            'changeover_hours': DEFAULT_CHANGEOVER_HOURS,
+        })
+    lines = lines[lines['sku'].isin(skus)].drop_duplicates(['line', 'sku'], keep='last')
+    return lines[LINE_COLUMNS].reset_index(drop=True)
+
+
+def _solve_milp(req: np.ndarray, pairs: pd.DataFrame, sku_of: np.ndarray, line_of: np.ndarray,
+                hours: np.ndarray, moq: int, time_limit: float):
+    """Lot-sizing MILP over all line x sku pairs and weeks.
+
+    k[p, t] integer MOQ batches of pair p in week t, y[p, t] its setup
+    binary (pays the pair's changeover), e[s, t] / b[s, t] the sku's
+    cumulative surplus / backlog after week t against the plan's releases.
+    Capacity: sum over a line's pairs of k * moq / rate + changeover * y
+    within its weekly hours. Minimises holding + late + changeover cost.
+    Returns the (n_pairs, n_weeks) batches, or None if HiGHS found no
+    feasible solution within the time limit.
+    """
+    n_skus, n_weeks = req.shape
+    n_pairs = len(pairs)
+    n_py, n_sw = n_pairs * n_weeks, n_skus * n_weeks
+    rate = pairs['units_per_hour'].to_numpy(dtype=float)
+    change = pairs['changeover_hours'].to_numpy(dtype=float)
+    batch_hours = moq / rate
+    max_batches = np.floor(np.maximum(hours[line_of] - change, 0) / batch_hours)
+
+    # Variable blocks: k, y, e, b; every block is row-major over (pair or sku, week)
+    k0, y0, e0, b0 = 0, n_py, 2 * n_py, 2 * n_py + n_sw
+    pt = np.arange(n_py)
+    p_of, t_of = np.divmod(pt, n_weeks)
+    st = np.arange(n_sw)
+    t_st = st % n_weeks
+
+    # k <= max_batches * y
+    link = sp.csr_matrix((np.concatenate([np.ones(n_py), -max_batches[p_of]]),
+                          (np.tile(pt, 2), np.concatenate([k0 + pt, y0 + pt]))), shape=(n_py, 2 * n_py + 2 * n_sw))
+    # Line hours per week
+    cap_row = line_of[p_of] * n_weeks + t_of
+    capacity = sp.csr_matrix((np.concatenate([batch_hours[p_of], change[p_of]]),
+                              (np.tile(cap_row, 2), np.concatenate([k0 + pt, y0 + pt]))),
+                             shape=(len(hours) * n_weeks, 2 * n_py + 2 * n_sw))
+    # Balance: moq * sum_p k[p, t] + (e - b)[s, t-1] - (e - b)[s, t] = req[s, t]
+    prev = t_st > 0
+    bal_rows = np.concatenate([sku_of[p_of] * n_weeks + t_of, st, st, st[prev], st[prev]])
+    bal_cols = np.concatenate([k0 + pt, e0 + st, b0 + st, e0 + st[prev] - 1, b0 + st[prev] - 1])
+    bal_vals = np.concatenate([np.full(n_py, float(moq)), -np.ones(n_sw), np.ones(n_sw),
+                               np.ones(prev.sum()), -np.ones(prev.sum())])
+    balance = sp.csr_matrix((bal_vals, (bal_rows, bal_cols)), shape=(n_sw, 2 * n_py + 2 * n_sw))
+
+    c = np.concatenate([np.zeros(n_py), CHANGEOVER_COST * change[p_of],
+                        np.full(n_sw, HOLDING_COST), np.full(n_sw, LATE_COST)])
+    upper = np.concatenate([max_batches[p_of], np.ones(n_py), np.full(2 * n_sw, np.inf)])
+    integrality = np.concatenate([np.ones(2 * n_py), np.zeros(2 * n_sw)])
+    constraints = [
+        LinearConstraint(link, -np.inf, 0),
+        LinearConstraint(capacity, -np.inf, np.repeat(hours, n_weeks)),
+        LinearConstraint(balance, req.ravel(), req.ravel()),
+    ]
+    res = milp(c, constraints=constraints, integrality=integrality, bounds=Bounds(0, upper),
+               options={'time_limit': time_limit, 'mip_rel_gap': 1e-3})
+    if res.x is None:
+        return None, res.message
+    return np.round(res.x[:n_py]).reshape(n_pairs, n_weeks), res.message
+
+
+def _solve_greedy(req: np.ndarray, pairs: pd.DataFrame, sku_of: np.ndarray, line_of: np.ndarray,
+                  hours: np.ndarray, moq: int) -> np.ndarray:
+    """Week-by-week heuristic with a bounded O(weeks x pairs) cost.
+
+    Each week serves the sku's backlog plus its planned release, skus
+    with the fewest compatible lines first, on the line with the most
+    hours left. Nothing is built ahead; shortfalls roll into next week.
+    """
+    n_skus, n_weeks = req.shape
+    rate = pairs['units_per_hour'].to_numpy(dtype=float)
+    change = pairs['changeover_hours'].to_numpy(dtype=float)
+    batch_hours = moq / rate
+    pairs_of = [np.flatnonzero(sku_of == s) for s in range(n_skus)]
+    order = np.argsort([len(p) for p in pairs_of], kind='stable')
+    batches = np.zeros((len(pairs), n_weeks))
+    carry = np.zeros(n_skus)
+    for t in range(n_weeks):
+        left = hours.astype(float).copy()
+        need = carry + req[:, t]
+        for s in order:
+            if need[s] <= 0:
+                continue
+            for p in sorted(pairs_of[s], key=lambda p: -left[line_of[p]]):
+                fits = np.floor((left[line_of[p]] - change[p]) / batch_hours[p])
+                n = min(np.ceil(need[s] / moq), fits)
+                if n <= 0:
+                    continue
+                batches[p, t] = n
+                left[line_of[p]] -= change[p] + n * batch_hours[p]
+                need[s] -= n * moq
+                if need[s] <= 0:
+                    break
+        carry = need
+    return batches
+
+
+def schedule_cost(req: np.ndarray, batches: np.ndarray, sku_of: np.ndarray, change: np.ndarray, moq: int) -> float:
+    """The MILP objective of any schedule, so solvers can be compared."""
+    produced = np.zeros_like(req)
+    np.add.at(produced, sku_of, batches * moq)
+    position = np.cumsum(produced - req, axis=1)
+    return float(HOLDING_COST * np.maximum(position, 0).sum() + LATE_COST * np.maximum(-position, 0).sum()
+                 + CHANGEOVER_COST * (change[:, None] * (batches > 0)).sum())
+
+
+def schedule_production(plan: pd.DataFrame, lines: pd.DataFrame, moq: int = MOQ, solver: str = 'auto',
+                        time_limit: float = TIME_LIMIT):
+    """Assign the plan's suggested_production to lines, week by week.
+
+    Returns (schedule, info): one row per line, sku and week with units,
+    run and changeover hours, plus the solver used and its status.
+    The greedy schedule is always built (it is cheap); 'auto' also runs the
+    MILP unless the problem has more than MAX_MILP_SETUPS setups ('milp'
+    runs it regardless of size). The cheaper schedule wins, so a MILP
+    stopped by time_limit never does worse than the heuristic.
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver {solver!r}, expected one of {SOLVERS}")
+    req_df = plan.assign(sku=plan['sku'].astype(str)).pivot_table(
+        index='sku', columns='week_start', values='suggested_production', aggfunc='sum', fill_value=0.0)
+    skus, weeks = req_df.index, req_df.columns
+    req = req_df.to_numpy(dtype=float)
+    pairs = lines[lines['sku'].isin(skus)].reset_index(drop=True)
+    sku_of = skus.get_indexer(pairs['sku'])
+    line_names, line_of = np.unique(pairs['line'].to_numpy(dtype=str), return_inverse=True)
+    hours = pairs.groupby(line_of)['hours_per_week'].max().to_numpy(dtype=float)
+
+    change = pairs['changeover_hours'].to_numpy(dtype=float)
+    batches = _solve_greedy(req, pairs, sku_of, line_of, hours, moq)
+    info = {'solver': 'greedy', 'status': None, 'objective': schedule_cost(req, batches, sku_of, change, moq)}
+    if len(pairs) and (solver == 'milp' or (solver == 'auto' and len(pairs) * len(weeks) <= MAX_MILP_SETUPS)):
+        start = time.perf_counter()
+        exact, info['status'] = _solve_milp(req, pairs, sku_of, line_of, hours, moq, time_limit)
+        info['solve_seconds'] = time.perf_counter() - start
+        cost = schedule_cost(req, exact, sku_of, change, moq) if exact is not None else np.inf
+        if cost <= info['objective']:
+            batches, info['solver'], info['objective'] = exact, 'milp', cost
+
+    units = batches * moq
+    produced = np.zeros_like(req)
+    np.add.at(produced, sku_of, units)
+    # Planned releases still not produced by the end of the horizon
+    info['unmet_units'] = float(np.maximum(req.sum(axis=1) - produced.sum(axis=1), 0).sum())
+
+    p, t = np.nonzero(units)
+    schedule = pd.DataFrame({
+        'week_start': weeks[t],
+        'line': line_names[line_of[p]],
+        'sku': pairs['sku'].to_numpy()[p],
+        'units': units[p, t],
+        'run_hours': units[p, t] / pairs['units_per_hour'].to_numpy(dtype=float)[p],
+        'changeover_hours': change[p],
+    }).sort_values(['week_start', 'line', 'sku'], ignore_index=True)
+    return schedule, info
+
+
+def generate_production_schedule(moq: int = MOQ, solver: str = 'auto', time_limit: float = TIME_LIMIT,
+                                 lines_path: str = LINES_PATH, plan_path: str = PLAN_PATH):
+    with stage('schedule') as record:
+        print("Scheduling production...")
+        plan = pd.read_csv(plan_path, dtype={'sku': str})
+        lines = load_lines(plan['sku'].unique(), lines_path)
+        record['rows_in'] = len(plan)
+        unplaceable = set(plan.loc[plan['suggested_production'] > 0, 'sku']) - set(lines['sku'])
+        if unplaceable:
+            print(f"No compatible line for {len(unplaceable)} sku(s), left unscheduled: {sorted(unplaceable)[:5]}")
+        schedule, info = schedule_production(plan, lines, moq=moq, solver=solver, time_limit=time_limit)
+        schedule.to_csv(SCHEDULE_PATH, index=False)
+        record.update(info)
+        record['rows_out'] = len(schedule)
+    print(f"Production schedule generated ({info['solver']}, {info['unmet_units']:.0f} units unmet).")
+    return schedule
@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+import numpy as np
+import pandas as pd
+from pipeline.publish import DASHBOARD_DATA_DIR, MANIFEST
+
+FORECAST_PATH = "data/outputs/forecast_daily.csv"
+PLAN_PATH = "data/outputs/production_plan_weekly.csv"
+PRODUCT_PATH = "data/curated/dim_product.csv"
+# Rewritten atomically by `publish`, so a new manifest marks a finished run
+MANIFEST_PATH = os.path.join(DASHBOARD_DATA_DIR, MANIFEST)
+HOST = "127.0.0.1"
+PORT = 8765
+CACHE_SIZE = 1024
+RELOAD_INTERVAL = 2.0
+DEFAULT_DAYS = 7
+# Forecast rows summed over channels are indexed under this channel
+ALL_CHANNELS = "*"
+FORECAST_VALUES = ['yhat', 'yhat_lower', 'yhat_upper']
+
+
+class ReadIndex:
+    """Immutable in-memory view of one pipeline run.
+
+    Forecast rows are sorted by (sku, channel, date) into flat numpy
+    arrays, with a dict from (sku, channel) to its row range, so a query
+    is a dict lookup plus a binary search on that range's dates. Channel
+    totals per sku are indexed under channel '*'. Plan rows are kept as
+    records grouped by week_start and (week_start, sku).
+    """
+
+    def __init__(self, forecast: pd.DataFrame, plan: pd.DataFrame, products: pd.DataFrame):
+        forecast = forecast.assign(sku=forecast['sku'].astype(str), channel=forecast['channel'].astype(str))
+        totals = forecast.groupby(['sku', 'date'], as_index=False)[FORECAST_VALUES].sum()
+        forecast = pd.concat([forecast, totals.assign(channel=ALL_CHANNELS)], ignore_index=True)
+        forecast = forecast.sort_values(['sku', 'channel', 'date'], kind='stable', ignore_index=True)
+        self.dates = forecast['date'].to_numpy(dtype='datetime64[D]')
+        values = forecast[FORECAST_VALUES].to_numpy(dtype=float)
+        # NaN is not valid JSON; missing values are served as null
+        self.values = np.where(np.isfinite(values), values, None)
+        self.models = forecast['model_version'].fillna('').astype(str).to_numpy() \
+            if 'model_version' in forecast else np.full(len(forecast), '')
+        keys = forecast[['sku', 'channel']].to_numpy()
+        starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)]) if len(keys) else []
+        bounds = np.r_[starts, len(keys)]
+        self.ranges = {(keys[s][0], keys[s][1]): (int(s), int(e)) for s, e in zip(bounds[:-1], bounds[1:])}
+        self.channels = {}
+        for sku, channel in self.ranges:
+            if channel != ALL_CHANNELS:
+                self.channels.setdefault(sku, []).append(channel)
+
+        names = products['product_name'].astype(object).where(products['product_name'].notna(), None)
+        names = names.set_axis(products['sku'].astype(str)).to_dict()
+        plan = plan.assign(sku=plan['sku'].astype(str),
+                           week_start=pd.to_datetime(plan['week_start']).dt.strftime('%Y-%m-%d'))
+        records = json.loads(plan.to_json(orient='records'))
+        self.weeks, self.plan_rows = {}, {}
+        for rec in records:
+            self.weeks.setdefault(rec['week_start'], []).append(rec)
+            self.plan_rows.setdefault((rec['week_start'], rec['sku']), []).append(rec)
+        self.products = names
+        self.rows = {'forecast': int((forecast['channel'] != ALL_CHANNELS).sum()), 'plan': len(records)}
+
+    @classmethod
+    def load(cls, forecast_path: str = FORECAST_PATH, plan_path: str = PLAN_PATH,
+             product_path: str = PRODUCT_PATH) -> 'ReadIndex':
+        forecast = pd.read_csv(forecast_path, usecols=lambda c: c in {'date', 'channel', 'sku', 'model_version',
+                                                                      *FORECAST_VALUES},
+                               parse_dates=['date'], dtype={'sku': str, 'channel': str})
+        plan = pd.read_csv(plan_path, dtype={'sku': str}) if os.path.exists(plan_path) else \
+            pd.DataFrame(columns=['week_start', 'sku'])
+        products = pd.read_csv(product_path, dtype={'sku': str}) if os.path.exists(product_path) else \
+            pd.DataFrame(columns=['sku', 'product_name'])
+        return cls(forecast, plan, products)
+
+    def forecast(self, sku: str, days: int = DEFAULT_DAYS, start: str | None = None,
+                 channel: str | None = None) -> dict:
+        """Daily forecast of one sku for `days` days from `start` (default: first forecast day).
+
+        Without a channel the channels are summed. Raises KeyError for an
+        unknown sku/channel.
+        """
+        key = (sku, channel or ALL_CHANNELS)
+        if key not in self.ranges:
+            raise KeyError(f"no forecast for sku {sku!r}" + (f" channel {channel!r}" if channel else ""))
+        lo, hi = self.ranges[key]
+        dates = self.dates[lo:hi]
+        first = np.datetime64(start, 'D') if start else dates[0]
+        i = lo + np.searchsorted(dates, first)
+        j = lo + np.searchsorted(dates, first + np.timedelta64(days, 'D'))
+        return {
+            'sku': sku,
+            'product_name': self.products.get(sku),
+            'channel': channel or ALL_CHANNELS,
+            'channels': self.channels.get(sku, []),
+            'forecast': [{'date': str(d), 'yhat': v[0], 'yhat_lower': v[1], 'yhat_upper': v[2],
+                          **({'model_version': m} if channel else {})}
+                         for d, v, m in zip(self.dates[i:j], self.values[i:j].tolist(), self.models[i:j])],
+        }
+
+    def plan(self, week: str, sku: str | None = None) -> dict:
+        """Plan rows of the week containing `week` (any date), optionally one sku."""
+        day = pd.Timestamp(week)
+        week_start = (day - pd.Timedelta(days=day.weekday())).strftime('%Y-%m-%d')
+        rows = self.plan_rows.get((week_start, sku), []) if sku else self.weeks.get(week_start, [])
+        return {'week_start': week_start, 'rows': rows}
+
+
+def _signature(paths) -> tuple:
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sig.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append((path, None, None))
+    return tuple(sig)
+
+
+class ReadService:
+    """Serves queries from the current ReadIndex with an LRU response cache.
+
+    A background thread polls the source files (and the publish
+    manifest). When they change it builds a complete new index and then
+    swaps the reference in one assignment, so a request sees either the
+    old run or the new one, never a mix. If the files changed again while
+    loading (a run still writing), the new index is dropped and the load
+    retried on the next poll. Cached responses are keyed by generation,
+    so a swap invalidates them.
+    """
+
+    def __init__(self, forecast_path: str = FORECAST_PATH, plan_path: str = PLAN_PATH,
+                 product_path: str = PRODUCT_PATH, manifest_path: str = MANIFEST_PATH,
+                 cache_size: int = CACHE_SIZE):
+        self.paths = (forecast_path, plan_path, product_path)
+        self.watched = (*self.paths, manifest_path)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        # last_reload_error is the failed load still pending, if any, as shown by /health
+        self.stats = {'hits': 0, 'misses': 0, 'reloads': 0, 'reload_errors': 0, 'last_reload_error': None}
+        self.generation = 0
+        self.index, self.signature, self.failed, self.loaded_at = None, None, None, None
+        self._stop = threading.Event()
+        if not self.reload():
+            raise FileNotFoundError(f"Cannot load {forecast_path}; run the pipeline first")
+
+    def reload(self) -> bool:
+        """Load the run on disk if it differs from the served one; True if swapped."""
+        before = _signature(self.watched)
+        if before in (self.signature, self.failed):
+            return False
+        try:
+            index = ReadIndex.load(*self.paths)
+        except (OSError, ValueError, KeyError, pd.errors.ParserError) as exc:
+            with self.lock:
+                self.stats['reload_errors'] += 1
+                self.stats['last_reload_error'] = f"{type(exc).__name__}: {exc}"
+            self.failed = before
+            return False
+        if _signature(self.watched) != before:
+            return False
+        with self.lock:
+            self.index, self.signature = index, before
+            self.generation += 1
+            self.loaded_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            self.cache.clear()
+            self.stats['reloads'] += 1
+            self.stats['last_reload_error'] = None
+        return True
+
+    def watch(self, interval: float = RELOAD_INTERVAL) -> threading.Thread:
+        def loop():
+            while not self._stop.wait(interval):
+                if self.reload():
+                    print(f"Reloaded run (generation {self.generation})")
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _answer(self, index: ReadIndex, route: str, params: dict):
+        if route == '/forecast':
+            if 'sku' not in params:
+                return 400, {'error': "sku is required"}
+            days = int(params.get('days', DEFAULT_DAYS))
+            return 200, index.forecast(params['sku'], days, params.get('start'), params.get('channel'))
+        if route == '/plan':
+            if 'week' not in params:
+                return 400, {'error': "week is required"}
+            return 200, index.plan(params['week'], params.get('sku'))
+        if route == '/skus':
+            return 200, {'skus': sorted({sku for sku, _ in index.ranges} | set(index.products))}
+        return 404, {'error': f"unknown path {route}"}
+
+    def respond(self, target: str):
+        """(status, JSON bytes) for a request target such as '/forecast?sku=X&days=14'."""
+        parts = urlsplit(target)
+        if parts.path == '/health':
+            with self.lock:
+                body = {'generation': self.generation, 'loaded_at': self.loaded_at, 'rows': self.index.rows,
+                        'cache_entries': len(self.cache), **self.stats}
+            return 200, json.dumps(body).encode()
+        with self.lock:
+            index, generation = self.index, self.generation
+            query = parse_qsl(parts.query)
+            key = (generation, parts.path, tuple(sorted(query)))
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return self.cache[key]
+        params = dict(query)
+        try:
+            status, body = self._answer(index, parts.path, params)
+        except KeyError as exc:
+            status, body = 404, {'error': exc.args[0]}
+        except ValueError as exc:
+            status, body = 400, {'error': str(exc)}
+        try:
+            response = (status, json.dumps(body, allow_nan=False).encode())
+        except ValueError as exc:
+            response = (500, json.dumps({'error': str(exc)}).encode())
+        with self.lock:
+            self.stats['misses'] += 1
+            if status == 200 and generation == self.generation:
+                self.cache[key] = response
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return response
+
+
+def make_server(service: ReadService, host: str = HOST, port: int = PORT) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            status, body = service.respond(self.path)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
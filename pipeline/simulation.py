@@ -0,0 +1,171 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from pipeline.intervals import DEFAULT_COVERAGE, INTERVALS_PATH, load_offsets
+
+SERVICE_PATH = "data/outputs/service_levels.csv"
+SERVICE_METRICS = ('cycle', 'fill')
+DEFAULT_PATHS = 2000
+# Days between planning runs, covered on top of the lead time
+REVIEW_DAYS = 7
+# Actual lead times are drawn uniformly within +/- this share of lead_time_days
+LEAD_TIME_SPREAD = 0.25
+# Cap on the sku x path x day draw array of one chunk
+MAX_SIM_BYTES = 256 * 1024 * 1024
+CHUNK_ROWS = 1_000_000
+
+
+def daily_sku_demand(forecast_path: str, coverage: float = DEFAULT_COVERAGE):
+    """(mean, sd) sku x date frames of daily demand from a forecast file.
+
+    The sd of each series-day is backed out of the upper half of its
+    interval as a normal band at `coverage`: apply_intervals clips
+    yhat_lower at zero, so for slow movers the full band would understate
+    it. Channels (and stores) are summed as independent series. Read in
+    chunks like the plan's weekly demand.
+    """
+    z = norm.ppf(0.5 + coverage / 2)
+    parts = []
+    for chunk in pd.read_csv(forecast_path, usecols=['date', 'sku', 'yhat', 'yhat_lower', 'yhat_upper'],
+                             parse_dates=['date'], dtype={'sku': 'category'}, chunksize=CHUNK_ROWS):
+        chunk['var'] = ((chunk['yhat_upper'] - chunk['yhat']) / z) ** 2
+        parts.append(chunk.groupby(['sku', 'date'], observed=True)[['yhat', 'var']].sum())
+    daily = pd.concat(parts).groupby(level=[0, 1]).sum()
+    daily.index = daily.index.set_levels(daily.index.levels[0].astype(str), level=0)
+    mean = daily['yhat'].unstack(fill_value=0.0)
+    sd = np.sqrt(daily['var'].unstack(fill_value=0.0))
+    return mean, sd
+
+
+def bands_calibrated(forecast_path: str, intervals_path: str = INTERVALS_PATH) -> bool:
+    """Whether the forecast's intervals came from backtest offsets.
+
+    Without them yhat_lower/yhat_upper are fixed multiples of yhat, so the
+    sd daily_sku_demand backs out scales with the forecast rather than its
+    error and the simulated service levels are uncalibrated. Offsets
+    written after the forecast were not applied to it.
+    """
+    if not os.path.exists(intervals_path) or load_offsets(intervals_path).empty:
+        return False
+    return os.path.getmtime(intervals_path) <= os.path.getmtime(forecast_path)
+
+
+def _extend(daily: np.ndarray, n_days: int) -> np.ndarray:
+    # Days past the forecast horizon repeat its last week
+    horizon = daily.shape[1]
+    days = np.arange(n_days)
+    period = min(7, horizon)
+    idx = np.where(days < horizon, days, horizon - period + (days - horizon) % period)
+    return daily[:, idx]
+
+
+def protection_demand(mean: np.ndarray, sd: np.ndarray, lead_days: np.ndarray, n_paths: int = DEFAULT_PATHS,
+                      review_days: int = REVIEW_DAYS, spread: float = LEAD_TIME_SPREAD, rng=None) -> np.ndarray:
+    """Simulated demand over lead time + review period, (n_skus, n_paths).
+
+    Daily demand is lognormal with the forecast's mean and sd (non-negative,
+    right-skewed for slow movers), drawn as one float32 sku x path x day
+    array; each path also draws its lead time. Callers bound memory by
+    passing chunks of skus.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    lead = np.asarray(lead_days, dtype=float)
+    lo = np.floor(lead * (1 - spread)).astype(int)
+    hi = np.ceil(lead * (1 + spread)).astype(int)
+    days = rng.integers(lo[:, None], hi[:, None] + 1, size=(len(lead), n_paths)) + review_days
+    n_days = int(days.max()) if days.size else 0
+
+    m = _extend(np.asarray(mean, dtype=float), n_days)
+    s = _extend(np.asarray(sd, dtype=float), n_days)
+    # Lognormal parameters matching mean m and sd s; zero-mean days stay zero
+    sigma2 = np.log1p(np.divide(s ** 2, m ** 2, out=np.zeros_like(m), where=m > 0))
+    mu = np.log(np.maximum(m, 1e-12)) - sigma2 / 2
+    draws = rng.standard_normal((len(lead), n_paths, n_days), dtype=np.float32)
+    draws *= np.sqrt(sigma2, dtype=np.float32)[:, None, :]
+    draws += mu.astype(np.float32)[:, None, :]
+    np.exp(draws, out=draws)
+    draws *= (m > 0)[:, None, :]
+    np.cumsum(draws, axis=2, out=draws)
+    return np.take_along_axis(draws, days[:, :, None] - 1, axis=2)[:, :, 0].astype(float)
+
+
+def service_at(demand: np.ndarray, stock: np.ndarray):
+    """Stockout probability and fill rate per sku when `stock` covers the paths.
+
+    stock is (n_skus,) or (n_skus, k) candidate stock levels; returns
+    arrays of the same shape.
+    """
+    stock = np.asarray(stock, dtype=float)
+    level = stock[..., None] if stock.ndim == 2 else stock[:, None]
+    d = demand[:, None, :] if stock.ndim == 2 else demand
+    stockout = (d > level).mean(axis=-1)
+    short = np.maximum(d - level, 0).mean(axis=-1)
+    expected = demand.mean(axis=1)
+    expected = expected[:, None] if stock.ndim == 2 else expected
+    fill = 1 - np.divide(short, expected, out=np.zeros_like(short), where=expected > 0)
+    return stockout, fill
+
+
+def required_stock(demand: np.ndarray, target: float, metric: str = 'cycle') -> np.ndarray:
+    """Smallest stock level per sku that meets the target service.
+
+    'cycle' is the target quantile of protection-period demand (P(no
+    stockout) >= target). 'fill' finds where expected shortfall drops to
+    (1 - target) of expected demand, exactly on the sorted paths: between
+    consecutive sorted demands the shortfall is linear in the stock level.
+    """
+    if metric == 'cycle':
+        return np.quantile(demand, target, axis=1, method='higher')
+    if metric != 'fill':
+        raise ValueError(f"Unknown service metric {metric!r}, expected one of {SERVICE_METRICS}")
+    n = demand.shape[1]
+    d = np.sort(demand, axis=1)
+    # suffix[:, j] = sum of d[:, j:]
+    suffix = np.concatenate([np.cumsum(d[:, ::-1], axis=1)[:, ::-1], np.zeros((len(d), 1))], axis=1)
+    j = np.arange(n)
+    budget = (1 - target) * d.mean(axis=1, keepdims=True) * n
+    # Total shortfall with stock at each sorted demand
+    short = suffix[:, 1:] - (n - 1 - j) * d
+    first = np.argmax(short <= budget, axis=1)
+    rows = np.arange(len(d))
+    # Interpolate inside the segment ending at d[first]
+    level = (suffix[rows, first] - budget[:, 0]) / (n - first)
+    lower = np.where(first > 0, d[rows, np.maximum(first - 1, 0)], 0.0)
+    return np.clip(level, lower, d[rows, first])
+
+
+def order_for_service(mean: np.ndarray, sd: np.ndarray, lead_days: np.ndarray, position: np.ndarray,
+                      target: float, metric: str = 'cycle', moq: int = 1, n_paths: int = DEFAULT_PATHS,
+                      seed: int = 0, max_bytes: int = MAX_SIM_BYTES) -> pd.DataFrame:
+    """Order quantity per sku that reaches the target service level.
+
+    mean/sd are (n_skus, n_days) daily demand, position is on hand + on
+    order. Skus are simulated in chunks sized so the sku x path x day
+    array stays under max_bytes. The order is the MOQ-rounded gap between
+    the required stock and the position; safety_stock is the required
+    stock above mean protection-period demand. Columns: protection_demand,
+    required_stock, order_qty, safety_stock, stockout_prob, fill_rate.
+    """
+    rng = np.random.default_rng(seed)
+    lead = np.asarray(lead_days, dtype=float)
+    position = np.asarray(position, dtype=float)
+    max_days = int(np.ceil(lead.max() * (1 + LEAD_TIME_SPREAD))) + REVIEW_DAYS if len(lead) else 1
+    chunk = max(1, max_bytes // (n_paths * max_days * 4))
+    parts = []
+    for start in range(0, len(lead), chunk):
+        sl = slice(start, start + chunk)
+        demand = protection_demand(mean[sl], sd[sl], lead[sl], n_paths, rng=rng)
+        need = required_stock(demand, target, metric)
+        order = np.ceil(np.maximum(need - position[sl], 0) / moq) * moq
+        stockout, fill = service_at(demand, position[sl] + order)
+        expected = demand.mean(axis=1)
+        parts.append(pd.DataFrame({
+            'protection_demand': expected,
+            'required_stock': need,
+            'order_qty': order,
+            'safety_stock': np.maximum(need - expected, 0),
+            'stockout_prob': stockout,
+            'fill_rate': fill,
+        }))
+    return pd.concat(parts, ignore_index=True)
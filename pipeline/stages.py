@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+from datetime import date
+from pathlib import Path
+import pandas as pd
+from pipeline import profiling
+
+CACHE_DIR = "data/.cache"
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+RAW_FILES = [
+    "data/raw/sku_map.csv",
+    "data/raw/pos_sales.csv",
+    "data/raw/ecommerce_sales.csv",
+    "data/raw/inventory.csv",
+]
+MODEL_INPUT_PATH = os.path.join(CACHE_DIR, "model_input.parquet")
+FORECAST_OUTPUTS = ["data/outputs/forecast_daily.csv", "data/outputs/forecast_metrics.csv",
+                    "data/outputs/forecast_hierarchy.csv"]
+PLAN_OUTPUTS = ["data/outputs/production_plan_weekly.csv"]
+SERVICE_OUTPUTS = ["data/outputs/service_levels.csv"]
+SCHEDULE_OUTPUTS = ["data/outputs/production_schedule_weekly.csv"]
+# Store grain (--granularity store)
+STORE_PANEL_DIR = os.path.join(CACHE_DIR, "store_panel")
+STORE_FORECAST_OUTPUTS = ["data/outputs/forecast_store_daily.csv"]
+STORE_PLAN_OUTPUTS = PLAN_OUTPUTS + ["data/outputs/store_demand_weekly.csv"]
+GRANULARITIES = ('channel', 'store')
+
+# Source modules each stage depends on; editing any of them invalidates the stage
+STAGE_CODE = {
+    'generate': ['generate_data.py'],
+    'transform': ['ingest.py', 'incremental.py', 'transform.py', 'panel.py', 'storage.py', 'stages.py'],
+    'forecast': ['forecast.py', 'transform.py', 'baselines.py', 'panel.py', 'registry.py', 'intervals.py', 'hierarchy.py'],
+    'plan': ['plan.py', 'simulation.py', 'storage.py'],
+    'schedule': ['schedule.py', 'storage.py'],
+    'transform_store': ['ingest.py', 'transform.py', 'panel.py', 'storage.py', 'stages.py'],
+    'forecast_store': ['forecast.py', 'baselines.py', 'panel.py'],
+}
+
+
+def _hash_file(path: str, h) -> None:
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file, or of every file under a directory (sorted)."""
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                h.update(os.path.relpath(full, path).encode())
+                _hash_file(full, h)
+    elif os.path.exists(path):
+        _hash_file(path, h)
+    else:
+        return 'missing'
+    return h.hexdigest()
+
+
+def code_version(stage: str) -> str:
+    h = hashlib.sha256()
+    for module in STAGE_CODE.get(stage, []):
+        _hash_file(str(PACKAGE_DIR / module), h)
+    return h.hexdigest()
+
+
+def fingerprint(stage: str, inputs: list, params: dict | None = None) -> str:
+    """Hash of input file contents, the stage's code and its parameters."""
+    payload = {
+        'inputs': {path: file_digest(path) for path in sorted(inputs)},
+        'code': code_version(stage),
+        'params': params or {},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _manifest_path(stage: str) -> str:
+    return os.path.join(CACHE_DIR, f"{stage}.json")
+
+
+def is_fresh(stage: str, fp: str, outputs: list) -> bool:
+    path = _manifest_path(stage)
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('fingerprint') != fp:
+        return False
+    # Outputs must still be exactly what this stage wrote
+    return all(manifest['outputs'].get(out) == file_digest(out) for out in outputs)
+
+
+def record(stage: str, fp: str, outputs: list) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    manifest = {'fingerprint': fp, 'outputs': {out: file_digest(out) for out in outputs}}
+    tmp = _manifest_path(stage) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, _manifest_path(stage))
+
+
+def run_stage(stage: str, compute, load, inputs: list, outputs: list, params: dict | None = None, force: bool = False):
+    """Run `compute` unless the stage's fingerprint matches the last run.
+
+    Returns (result, ran). When cached, `load` rebuilds the result from the
+    stage's outputs instead of recomputing it.
+    """
+    fp = fingerprint(stage, inputs, params)
+    if not force and is_fresh(stage, fp, outputs):
+        print(f"[{stage}] inputs unchanged, using cached outputs")
+        with profiling.stage(stage) as stage_record:
+            stage_record['cached'] = True
+            return load(), False
+    result = compute()
+    record(stage, fp, outputs)
+    return result, True
+
+
+# Stage DAG: generate -> transform -> forecast -> plan (-> schedule). Each stage's inputs
+# are its upstream stage's outputs, so a change anywhere re-runs exactly the
+# stages downstream of it.
+
+def generate_stage(force: bool = False):
+    from pipeline import generate_data
+    # Synthetic data is anchored on today's date, so refresh it once a day
+    return run_stage(
+        'generate', generate_data.main, lambda: None,
+        inputs=[], outputs=RAW_FILES, params={'as_of': date.today().isoformat()}, force=force,
+    )
+
+
+def transform_stage(force: bool = False, incremental: bool = False):
+    """Curated tables and model input, cached on the raw files' content.
+
+    With incremental (and not force) the raw files are not hashed: ingest
+    watermarks pick up appended rows and only the months they touch are
+    re-aggregated and re-featured (run_incremental_transform). The model
+    input is rewritten only when something changed, so downstream stages
+    stay cached otherwise. The ingest watermarks are saved only after the
+    model input is written, so an interrupted run is redone next time.
+    """
+    from pipeline.storage import read_curated
+    from pipeline.transform import run_transform
+
+    if incremental and not force:
+        from pipeline.incremental import run_incremental_transform, save_state
+        previous = pd.read_parquet(MODEL_INPUT_PATH) if os.path.exists(MODEL_INPUT_PATH) else None
+        with profiling.stage('transform') as stage_record:
+            model_input, inv, sku_map, changed, state = run_incremental_transform(previous=previous)
+            stage_record['cached'] = not changed
+            stage_record['rows_out'] = len(model_input)
+        if changed:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            model_input.to_parquet(MODEL_INPUT_PATH, index=False)
+        save_state(state)
+        return (model_input, inv, sku_map), changed
+
+    def compute():
+        model_input, inv, sku_map = run_transform()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        model_input.to_parquet(MODEL_INPUT_PATH, index=False)
+        return model_input, inv, sku_map
+
+    def load():
+        return pd.read_parquet(MODEL_INPUT_PATH), read_curated('fact_inventory_daily'), read_curated('dim_product')
+
+    return run_stage('transform', compute, load, inputs=RAW_FILES, outputs=[MODEL_INPUT_PATH], force=force)
+
+
+def forecast_stage(df: pd.DataFrame, engine: str = 'local', n_jobs: int = 1, horizon: int = 7,
+                   baseline_method: str = 'auto', refit: str = 'changed', reconcile: str = 'none',
+                   force: bool = False):
+    from pipeline.forecast import train_forecast_model
+    from pipeline.intervals import INTERVALS_PATH
+    # n_jobs doesn't change the result, so it's not part of the fingerprint
+    return run_stage(
+        'forecast',
+        lambda: train_forecast_model(df, n_jobs=n_jobs, engine=engine, horizon=horizon,
+                                     baseline_method=baseline_method, refit=refit, reconcile=reconcile),
+        lambda: pd.read_csv(FORECAST_OUTPUTS[0], parse_dates=['date']),
+        inputs=[MODEL_INPUT_PATH, INTERVALS_PATH], outputs=FORECAST_OUTPUTS,
+        params={'engine': engine, 'horizon': horizon, 'baseline_method': baseline_method, 'refit': refit,
+                'reconcile': reconcile},
+        force=force,
+    )
+
+
+def store_transform_stage(force: bool = False):
+    from pipeline.panel import load_panel, save_panel
+    from pipeline.storage import read_curated
+    from pipeline.transform import run_store_transform
+
+    def compute():
+        panel, inv, sku_map = run_store_transform()
+        save_panel(panel, STORE_PANEL_DIR)
+        return panel, inv, sku_map
+
+    def load():
+        return load_panel(STORE_PANEL_DIR), read_curated('fact_inventory_daily'), read_curated('dim_product')
+
+    return run_stage('transform_store', compute, load, inputs=RAW_FILES, outputs=[STORE_PANEL_DIR], force=force)
+
+
+def store_forecast_stage(panel, engine: str = 'baseline', horizon: int = 7, baseline_method: str = 'auto',
+                         batch_size: int | None = None, force: bool = False):
+    from pipeline.forecast import STORE_BATCH_SIZE, train_store_forecast_model
+    # batch_size only bounds memory, so it's not part of the fingerprint
+    return run_stage(
+        'forecast_store',
+        lambda: train_store_forecast_model(panel, engine=engine, horizon=horizon, baseline_method=baseline_method,
+                                           batch_size=batch_size or STORE_BATCH_SIZE),
+        lambda: None,
+        inputs=[STORE_PANEL_DIR], outputs=STORE_FORECAST_OUTPUTS,
+        params={'engine': engine, 'horizon': horizon, 'baseline_method': baseline_method}, force=force,
+    )
+
+
+def plan_stage(params: dict | None = None, force: bool = False, granularity: str = 'channel'):
+    from pipeline.plan import generate_production_plan, generate_store_demand_plan
+    from pipeline.storage import PARQUET_DIR
+    params = params or {}
+    forecast_path = STORE_FORECAST_OUTPUTS[0] if granularity == 'store' else FORECAST_OUTPUTS[0]
+    inputs = [forecast_path, os.path.join(PARQUET_DIR, 'fact_inventory_daily'),
+              os.path.join(PARQUET_DIR, 'dim_product')]
+
+    def compute():
+        plan = generate_production_plan(**params, forecast_path=forecast_path)
+        if granularity == 'store':
+            generate_store_demand_plan(forecast_path)
+        return plan
+
+    outputs = STORE_PLAN_OUTPUTS if granularity == 'store' else PLAN_OUTPUTS
+    if params.get('service_level') is not None:
+        outputs = outputs + SERVICE_OUTPUTS
+    return run_stage(
+        'plan', compute,
+        lambda: pd.read_csv(PLAN_OUTPUTS[0]),
+        inputs=inputs, outputs=outputs,
+        params={**params, 'granularity': granularity}, force=force,
+    )
+
+
+def schedule_stage(params: dict | None = None, force: bool = False):
+    from pipeline.schedule import LINES_PATH, generate_production_schedule
+    from pipeline.storage import PARQUET_DIR
+    params = params or {}
+    lines_path = params.get('lines_path', LINES_PATH)
+    return run_stage(
+        'schedule', lambda: generate_production_schedule(**params),
+        lambda: pd.read_csv(SCHEDULE_OUTPUTS[0]),
+        inputs=[PLAN_OUTPUTS[0], lines_path, os.path.join(PARQUET_DIR, 'dim_product')],
+        outputs=SCHEDULE_OUTPUTS, params=params, force=force,
+    )
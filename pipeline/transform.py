@@ -2,8 +2,18 @@
 import pandas as pd
 import numpy as np
 from pipeline.ingest import ingest_and_validate
+from pipeline.panel import build_panel
+from pipeline.storage import write_curated
+from pipeline.profiling import stage
 
-def create_fact_sales_daily(pos: pd.DataFrame, ecom: pd.DataFrame) -> pd.DataFrame:
+# Store-level grain: e-commerce orders have no store, so they get one virtual store
+STORE_KEYS = ['store_id', 'channel', 'sku']
+ONLINE_STORE = 'ONLINE'
+
+
+def create_fact_sales_daily(pos: pd.DataFrame, ecom: pd.DataFrame, by_store: bool = False) -> pd.DataFrame:
+    # by_store keeps POS store_id (ecommerce rows go to ONLINE_STORE), with
+    # the key columns as categoricals so the store x sku grain stays compact
     # 1. Standardize columns
     pos['channel'] = 'Retail'
     pos['revenue'] = pos['units_sold'] * pos['unit_price']
@@ -13,8 +23,14 @@ def create_fact_sales_daily(pos: pd.DataFrame, ecom: pd.DataFrame) -> pd.DataFra
     ecom['promo_flag'] = 0 # Default for ecom in this simple model, or derive from discount
     
     # 2. Combine
-    cols = ['date', 'channel', 'sku', 'units_sold', 'revenue', 'promo_flag']
+    keys = ['date', 'channel', 'sku']
+    if by_store:
+        ecom['store_id'] = ONLINE_STORE
+        keys = ['date'] + STORE_KEYS
+    cols = keys + ['units_sold', 'revenue', 'promo_flag']
     combined = pd.concat([pos[cols], ecom[cols]], ignore_index=True)
+    if by_store:
+        combined = combined.astype({k: 'category' for k in STORE_KEYS})
     
     # 3. Aggregate Daily (Deduplicate rule: sum units if multiple entries per day/sku/channel)
     # The requirement said "Deduplicate using (date... keep latest)". 
@@ -30,7 +46,7 @@ def create_fact_sales_daily(pos: pd.DataFrame, ecom: pd.DataFrame) -> pd.DataFra
     combined = combined.drop_duplicates()
     
     # Now group by day/sku/channel to be safe
-    daily = combined.groupby(['date', 'channel', 'sku'], as_index=False).agg({
+    daily = combined.groupby(keys, as_index=False, observed=True).agg({
         'units_sold': 'sum',
         'revenue': 'sum',
         'promo_flag': 'max'
@@ -38,42 +54,225 @@ def create_fact_sales_daily(pos: pd.DataFrame, ecom: pd.DataFrame) -> pd.DataFra
     
     return daily
 
-def add_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.sort_values(['channel', 'sku', 'date'])
+# Feature engine config. Lags are counted in rows of the (channel, sku, date)
+# sorted series, i.e. days when fed a dense panel frame. Rolling windows are
+# trailing with min_periods=1; whether they include the current row is set
+# by rolling_closed. EWMAs use adjust=False so they can be updated one step
+# at a time.
+DEFAULT_FEATURE_CONFIG = {
+    'lags': (7, 14),
+    'rolling_windows': (7,),
+    'rolling_stats': ('mean',),  # any of 'mean', 'std'
+    # 'right' includes the current row (pandas default); 'left' covers only
+    # the previous w rows, so the feature is known before the day's sales are in
+    'rolling_closed': 'right',
+    'ewm_spans': (),
+    'dow_encoding': 'ordinal',  # 'ordinal', 'cyclical' (sin/cos) or 'onehot'
+}
+
+SERIES_KEYS = ['channel', 'sku']
+
+
+def feature_columns(config: dict | None = None) -> list:
+    """Names of the columns add_features generates for a given config."""
+    config = {**DEFAULT_FEATURE_CONFIG, **(config or {})}
+    cols = ['day_of_week', 'month']
+    if config['dow_encoding'] == 'cyclical':
+        cols += ['dow_sin', 'dow_cos']
+    elif config['dow_encoding'] == 'onehot':
+        cols += [f'dow_{d}' for d in range(7)]
+    cols += [f'lag_{k}' for k in config['lags']]
+    for w in config['rolling_windows']:
+        cols += [f'rolling_{stat}_{w}' for stat in config['rolling_stats']]
+    cols += [f'ewm_{span}' for span in config['ewm_spans']]
+    return cols
+
+
+def _group_layout(df: pd.DataFrame, keys: list):
+    # df must already be sorted by keys. Returns, for every row, the row
+    # index where its group starts and its position inside the group.
+    codes = df.groupby(keys, sort=False).ngroup().to_numpy()
+    is_start = np.empty(len(codes), dtype=bool)
+    is_start[:1] = True
+    is_start[1:] = codes[1:] != codes[:-1]
+    starts = np.flatnonzero(is_start)
+    lengths = np.diff(np.append(starts, len(codes)))
+    row_start = np.repeat(starts, lengths)
+    return row_start, np.arange(len(codes)) - row_start
+
+
+def _grouped_lag(x: np.ndarray, pos: np.ndarray, k: int) -> np.ndarray:
+    out = np.zeros(len(x))
+    out[k:] = x[:-k] if k else x
+    out[pos < k] = 0
+    return out
+
+
+def _grouped_window_sums(x: np.ndarray, row_start: np.ndarray, w: int, closed: str = 'right'):
+    # Trailing window [max(i - w + 1, group start), i] via cumulative sums,
+    # one pass for every group at once. closed='left' shifts it to end at i - 1.
+    idx = np.arange(len(x))
+    hi = idx + 1 if closed == 'right' else idx
+    lo = np.minimum(np.maximum(hi - w, row_start), hi)
+    csum = np.concatenate(([0.0], np.cumsum(x)))
+    csq = np.concatenate(([0.0], np.cumsum(x * x)))
+    count = hi - lo
+    return csum[hi] - csum[lo], csq[hi] - csq[lo], count
+
+
+def _window_stats(s: np.ndarray, sq: np.ndarray, n: np.ndarray, stats) -> dict:
+    # Mean and sample std (ddof=1, like pandas) from window sums; an empty
+    # window gives 0 like a missing lag, a single observation a std of 0
+    out = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if 'mean' in stats:
+            out['mean'] = np.where(n > 0, s / n, 0.0)
+        if 'std' in stats:
+            var = (sq - s * s / n) / (n - 1)
+            out['std'] = np.sqrt(np.where(n > 1, np.maximum(var, 0), 0))
+    return out
+
+
+def _calendar_features(out, dates: pd.Series, config: dict):
+    # `out` is a DataFrame or a dict of columns
+    dates = pd.Series(dates)
+    dow = dates.dt.dayofweek.to_numpy()
+    out['day_of_week'] = dow
+    out['month'] = dates.dt.month.to_numpy()
+    if config['dow_encoding'] == 'cyclical':
+        out['dow_sin'] = np.sin(2 * np.pi * dow / 7)
+        out['dow_cos'] = np.cos(2 * np.pi * dow / 7)
+    elif config['dow_encoding'] == 'onehot':
+        for d in range(7):
+            out[f'dow_{d}'] = (dow == d).astype(np.int8)
+
+
+def history_length(config: dict | None = None) -> int:
+    """Trailing days of history next_step_features needs per series."""
+    config = {**DEFAULT_FEATURE_CONFIG, **(config or {})}
+    return max((*config['lags'], *config['rolling_windows']), default=1)
+
+
+def next_step_features(history: np.ndarray, dates, config: dict | None = None,
+                       extra: dict | None = None) -> pd.DataFrame:
+    """Features for the day after `history`, for every series at once.
+
+    history is a (n_series, history_length) array of the latest daily units,
+    oldest first, NaN-padded on the left for series with less history.
+    dates holds each series' target day; `extra` columns (series keys,
+    known future inputs) are added as-is. Matches add_features on a dense
+    panel, so a recursive forecaster can append each step's prediction to
+    history and call this again. Needs rolling_closed='left'; with 'right'
+    the window would include the day being predicted.
+    """
+    config = {**DEFAULT_FEATURE_CONFIG, **(config or {})}
+    if config['rolling_closed'] != 'left' and config['rolling_windows']:
+        raise ValueError("next_step_features needs rolling_closed='left'")
+    if config['ewm_spans']:
+        raise ValueError("next_step_features does not support ewm_spans")
+    history = np.asarray(history, dtype=float)
+    # Columns are collected in a dict and framed once; this runs every
+    # forecast step, where per-column DataFrame inserts would dominate
+    out = dict(extra or {})
+    _calendar_features(out, dates, config)
+    for k in config['lags']:
+        out[f'lag_{k}'] = np.nan_to_num(history[:, -k]) if k <= history.shape[1] else np.zeros(len(history))
+    for w in config['rolling_windows']:
+        window = history[:, -w:]
+        n = (~np.isnan(window)).sum(axis=1)
+        s, sq = np.nansum(window, axis=1), np.nansum(window * window, axis=1)
+        for stat, values in _window_stats(s, sq, n, config['rolling_stats']).items():
+            out[f'rolling_{stat}_{w}'] = values
+    return pd.DataFrame(out, index=range(len(history)))
+
+
+def add_features(df: pd.DataFrame, config: dict | None = None, keys: list | None = None) -> pd.DataFrame:
+    """Calendar, lag, rolling and EWMA features for every series at once.
+
+    All features are computed on the flat sorted arrays using each row's
+    group start, so there is no per-group Python callback; see
+    DEFAULT_FEATURE_CONFIG for the knobs.
+    """
+    config = {**DEFAULT_FEATURE_CONFIG, **(config or {})}
+    keys = keys or SERIES_KEYS
+    df = df.sort_values(keys + ['date'], kind='stable')
     
     # Date features
-    df['day_of_week'] = df['date'].dt.dayofweek
-    df['month'] = df['date'].dt.month
+    _calendar_features(df, df['date'], config)
     
-    # Lags & Rolling
-    # We need to group by channel/sku
-    g = df.groupby(['channel', 'sku'])
+    # Lags & Rolling, computed once per group layout
+    x = df['units_sold'].to_numpy(dtype=float)
+    row_start, pos = _group_layout(df, keys)
     
-    df['lag_7'] = g['units_sold'].shift(7).fillna(0)
-    df['lag_14'] = g['units_sold'].shift(14).fillna(0)
-    df['rolling_mean_7'] = g['units_sold'].transform(lambda x: x.rolling(7, min_periods=1).mean()).fillna(0)
+    for k in config['lags']:
+        df[f'lag_{k}'] = _grouped_lag(x, pos, k)
+    
+    for w in config['rolling_windows']:
+        s, sq, n = _grouped_window_sums(x, row_start, w, config['rolling_closed'])
+        for stat, values in _window_stats(s, sq, n, config['rolling_stats']).items():
+            df[f'rolling_{stat}_{w}'] = values
+    
+    if config['ewm_spans']:
+        g = df.groupby(keys, sort=False)['units_sold']
+        for span in config['ewm_spans']:
+            ewm = g.ewm(span=span, adjust=False).mean()
+            df[f'ewm_{span}'] = ewm.to_numpy()
     
     return df
 
-def run_transform():
+def run_transform(export_csv: bool = True):
     print("Running transformation...")
     sku_map, pos, ecom, inv = ingest_and_validate()
     
-    fact_sales = create_fact_sales_daily(pos, ecom)
-    
-    # Add product details
-    fact_sales = fact_sales.merge(sku_map[['sku', 'category']], on='sku', how='left')
-    
-    # Feature Engineering
-    model_input = add_features(fact_sales)
-    
-    # Save Curated
-    fact_sales.to_csv("data/curated/fact_sales_daily.csv", index=False)
-    sku_map.to_csv("data/curated/dim_product.csv", index=False)
-    inv.to_csv("data/curated/fact_inventory_daily.csv", index=False)
+    with stage('transform') as record:
+        record['rows_in'] = len(pos) + len(ecom)
+        fact_sales = create_fact_sales_daily(pos, ecom)
+        
+        # Add product details
+        fact_sales = fact_sales.merge(sku_map[['sku', 'category']], on='sku', how='left')
+        
+        # Feature Engineering on the gap-filled calendar, so lag_7 is 7 days ago
+        # and not 7 sales rows ago for sparse series
+        panel = build_panel(fact_sales, attrs=['category'])
+        model_input = add_features(panel.to_frame())
+        
+        # Save Curated (Parquet store, CSV kept as an optional export)
+        write_curated(fact_sales, 'fact_sales_daily', export_csv=export_csv)
+        write_curated(sku_map, 'dim_product', export_csv=export_csv)
+        write_curated(inv, 'fact_inventory_daily', export_csv=export_csv)
+        record['rows_out'] = len(model_input)
     
     print("Transformation complete. Saved curated data.")
     return model_input, inv, sku_map
 
+
+def run_store_transform(export_csv: bool = False):
+    """Store x channel x sku fact table and dense panel.
+
+    Returns (panel, inv, sku_map). One or two orders of magnitude more
+    series than the channel grain, so no long feature frame is built: the
+    panel keeps categorical keys and the smallest int dtype that fits, and
+    the forecast works through it in batches of series.
+    """
+    print("Running store-level transformation...")
+    sku_map, pos, ecom, inv = ingest_and_validate()
+
+    with stage('transform') as record:
+        record['rows_in'] = len(pos) + len(ecom)
+        fact_sales = create_fact_sales_daily(pos, ecom, by_store=True)
+        fact_sales = fact_sales.merge(sku_map[['sku', 'category']], on='sku', how='left')
+        # revenue isn't forecast, so its float matrix is never built at this grain
+        panel = build_panel(fact_sales, keys=STORE_KEYS, attrs=['category'], compact=True,
+                            columns=['units_sold', 'promo_flag'])
+
+        write_curated(fact_sales, 'fact_sales_store_daily', export_csv=export_csv)
+        write_curated(sku_map, 'dim_product', export_csv=export_csv)
+        write_curated(inv, 'fact_inventory_daily', export_csv=export_csv)
+        record['rows_out'] = len(fact_sales)
+        record['series'] = panel.n_series
+
+    print("Store-level transformation complete.")
+    return panel, inv, sku_map
+
 if __name__ == "__main__":
     run_transform()
@@ -1,5 +1,6 @@
 
 import pytest
+import numpy as np
 import pandas as pd
 from pipeline.ingest import ingest_and_validate
 from pipeline.transform import add_features
@@ -38,3 +39,1008 @@ def test_production_plan_moq():
     rounded = np.ceil(suggested / MOQ) * MOQ
     assert rounded == 100
 
+
+
+def _synthetic_sales(n_days=60, skus=('SKU1', 'SKU2'), channels=('Retail', 'Ecommerce'), seed=0):
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2023-01-01', periods=n_days, freq='D')
+    frames = []
+    for channel in channels:
+        for sku in skus:
+            frames.append(pd.DataFrame({
+                'date': dates,
+                'channel': channel,
+                'sku': sku,
+                'units_sold': rng.poisson(5, n_days),
+                'promo_flag': 0,
+            }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_parallel_forecast_matches_serial(tmp_path, monkeypatch):
+    from pipeline.forecast import train_forecast_model
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+
+    df = add_features(_synthetic_sales())
+    # refit='always' so the parallel run fits again instead of loading the serial run's models
+    serial = train_forecast_model(df, n_jobs=1, refit='always')
+    serial_metrics = pd.read_csv('data/outputs/forecast_metrics.csv')
+    parallel = train_forecast_model(df, n_jobs=2, refit='always')
+    parallel_metrics = pd.read_csv('data/outputs/forecast_metrics.csv')
+
+    pd.testing.assert_frame_equal(serial, parallel)
+    pd.testing.assert_frame_equal(serial_metrics, parallel_metrics)
+
+
+def test_global_engine_covers_short_series(tmp_path, monkeypatch):
+    from pipeline.forecast import train_forecast_model
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+
+    history = _synthetic_sales(skus=('SKU1',))
+    new_product = _synthetic_sales(n_days=10, skus=('NEW1',), channels=('Retail',))
+    new_product['date'] = new_product['date'] + pd.Timedelta(days=50)
+    df = add_features(pd.concat([history, new_product], ignore_index=True))
+
+    local = train_forecast_model(df, engine='local')
+    assert 'NEW1' not in set(local['sku'])
+
+    fc = train_forecast_model(df, engine='global')
+    assert set(fc['sku']) == {'SKU1', 'NEW1'}
+    assert len(fc) == 3 * 7
+    assert (fc['yhat'] >= 0).all()
+
+
+def test_feature_engine_matches_per_group_pandas():
+    df = _synthetic_sales(n_days=40)
+    # Drop some days so groups have different lengths
+    df = df.sample(frac=0.8, random_state=1)
+    config = {
+        'lags': (1, 7),
+        'rolling_windows': (3, 7),
+        'rolling_stats': ('mean', 'std'),
+        'ewm_spans': (5,),
+        'dow_encoding': 'onehot',
+    }
+    res = add_features(df, config)
+
+    g = res.groupby(['channel', 'sku'])['units_sold']
+    expected_std = g.transform(lambda x: x.rolling(7, min_periods=1).std()).fillna(0)
+    expected_ewm = g.transform(lambda x: x.ewm(span=5, adjust=False).mean())
+    assert (res['lag_1'] == g.shift(1).fillna(0)).all()
+    assert ((res['rolling_std_7'] - expected_std).abs() < 1e-9).all()
+    assert ((res['ewm_5'] - expected_ewm).abs() < 1e-9).all()
+    assert (res[[f'dow_{d}' for d in range(7)]].sum(axis=1) == 1).all()
+
+
+def test_dense_panel_fills_gaps_with_zeros():
+    from pipeline.panel import build_panel
+    fact = pd.DataFrame({
+        'date': pd.to_datetime(['2023-01-01', '2023-01-04', '2023-01-02', '2023-01-03']),
+        'channel': ['Ecommerce', 'Ecommerce', 'Retail', 'Retail'],
+        'sku': ['SKU1', 'SKU1', 'SKU1', 'SKU1'],
+        'units_sold': [5, 3, 2, 4],
+        'revenue': [50.0, 30.0, 20.0, 40.0],
+        'promo_flag': [0, 1, 0, 0],
+        'category': ['Beer'] * 4,
+    })
+    panel = build_panel(fact, attrs=['category'])
+
+    assert panel.values['units_sold'].shape == (2, 4)
+    eco = panel.series_index(channel='Ecommerce', sku='SKU1')
+    assert panel.values['units_sold'][eco].tolist() == [5, 0, 0, 3]
+
+    frame = panel.to_frame()
+    # Retail launched on day 2, so its leading day is trimmed
+    assert len(frame) == 4 + 3
+    assert panel.row_offsets().tolist() == [0, 4, 7]
+    feats = add_features(frame, {'lags': (3,)})
+    eco_rows = feats[feats['channel'] == 'Ecommerce']
+    assert eco_rows['lag_3'].tolist() == [0, 0, 0, 5]
+
+
+def test_curated_parquet_roundtrip_prunes_dates(tmp_path, monkeypatch):
+    from pipeline.storage import write_curated, read_curated
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'curated').mkdir(parents=True)
+
+    fact = _synthetic_sales(n_days=70)
+    fact['revenue'] = fact['units_sold'] * 10.0
+    fact['category'] = 'Beer'
+    write_curated(fact, 'fact_sales_daily', export_csv=False)
+
+    months = sorted(p.name for p in (tmp_path / 'data/curated/parquet/fact_sales_daily').iterdir())
+    assert months == ['month=2023-01', 'month=2023-02', 'month=2023-03']
+    assert not (tmp_path / 'data/curated/fact_sales_daily.csv').exists()
+
+    res = read_curated('fact_sales_daily', columns=['sku', 'units_sold'], start='2023-02-01', end='2023-02-28')
+    assert list(res.columns) == ['sku', 'units_sold']
+    assert str(res['units_sold'].dtype) == 'int32'
+    expected = fact[fact['date'].dt.month == 2]['units_sold'].sum()
+    assert res['units_sold'].sum() == expected
+
+    # A full rewrite whose window rolled forward drops the months it no longer has
+    write_curated(fact[fact['date'] >= '2023-02-01'], 'fact_sales_daily', export_csv=False)
+    months = sorted(p.name for p in (tmp_path / 'data/curated/parquet/fact_sales_daily').iterdir())
+    assert months == ['month=2023-02', 'month=2023-03']
+    assert read_curated('fact_sales_daily')['date'].min() == pd.Timestamp('2023-02-01')
+
+
+def _write_raw(tmp_path, pos, ecom):
+    raw = tmp_path / 'data' / 'raw'
+    raw.mkdir(parents=True, exist_ok=True)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True, exist_ok=True)
+    (tmp_path / 'data' / 'curated').mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({
+        'sku': ['SKU1', 'SKU2'], 'product_name': ['A', 'B'], 'category': ['Beer', 'Beer'],
+        'pack_size': ['6PK', '4PK'], 'active_flag': [1, 1],
+    }).to_csv(raw / 'sku_map.csv', index=False)
+    pd.DataFrame({
+        'date': ['2023-03-01'] * 2, 'sku': ['SKU1', 'SKU2'], 'on_hand': [10, 20],
+        'on_order': [0, 5], 'lead_time_days': [7, 14],
+    }).to_csv(raw / 'inventory.csv', index=False)
+    pos.to_csv(raw / 'pos_sales.csv', index=False)
+    ecom.to_csv(raw / 'ecommerce_sales.csv', index=False)
+
+
+def test_incremental_ingest_matches_full_rebuild(tmp_path, monkeypatch):
+    from pipeline.incremental import run_incremental_ingest
+    from pipeline.storage import read_curated
+    from pipeline.transform import create_fact_sales_daily
+    monkeypatch.chdir(tmp_path)
+
+    def pos_rows(dates, units):
+        return pd.DataFrame({'date': dates, 'store_id': 'S001', 'sku': 'SKU1',
+                             'units_sold': units, 'unit_price': 10.0, 'promo_flag': False})
+
+    ecom = pd.DataFrame({'date': ['2023-01-05', '2023-02-10'], 'sku': ['SKU2', 'SKU2'],
+                         'units_sold': [3, 4], 'unit_price': [12.0, 12.0], 'discount': [0.0, 0.0]})
+    first = pos_rows(['2023-01-01', '2023-01-02', '2023-02-01'], [5, 6, 7])
+    _write_raw(tmp_path, first, ecom)
+    assert run_incremental_ingest()['mode'] == 'full'
+
+    # New day plus a late row for a January day that was already loaded
+    delta = pos_rows(['2023-02-02', '2023-01-02'], [8, 2])
+    delta.to_csv('data/raw/pos_sales.csv', mode='a', header=False, index=False)
+    summary = run_incremental_ingest()
+    assert summary['mode'] == 'incremental'
+    assert summary['rows_in'] == 2
+    assert summary['months_rebuilt'] == ['2023-01', '2023-02']
+
+    all_pos = pd.concat([first, delta], ignore_index=True)
+    all_pos['date'] = pd.to_datetime(all_pos['date'])
+    all_pos['promo_flag'] = all_pos['promo_flag'].astype(int)
+    ecom['date'] = pd.to_datetime(ecom['date'])
+    expected = create_fact_sales_daily(all_pos, ecom).sort_values(['date', 'channel', 'sku'])
+    got = read_curated('fact_sales_daily').sort_values(['date', 'channel', 'sku'])
+    assert got['units_sold'].tolist() == expected['units_sold'].tolist()
+    assert got.loc[got['date'] == '2023-01-02', 'units_sold'].item() == 8
+
+    # Nothing new: no partitions touched
+    assert run_incremental_ingest()['months_rebuilt'] == []
+
+
+
+def test_incremental_transform_refeatures_only_new_months(tmp_path, monkeypatch):
+    from pipeline.incremental import run_incremental_transform, save_state, update_features
+    monkeypatch.chdir(tmp_path)
+
+    def pos_rows(dates, units):
+        return pd.DataFrame({'date': dates, 'store_id': 'S001', 'sku': 'SKU1',
+                             'units_sold': units, 'unit_price': 10.0, 'promo_flag': False})
+
+    days = pd.date_range('2023-01-01', '2023-02-20').strftime('%Y-%m-%d')
+    # SKU2 only sold on ecommerce in early January: idle in the recomputed window
+    ecom = pd.DataFrame({'date': ['2023-01-05'], 'sku': ['SKU2'], 'units_sold': [3],
+                         'unit_price': [12.0], 'discount': [0.0]})
+    _write_raw(tmp_path, pos_rows(days, np.arange(len(days)) % 9), ecom)
+    first, _, _, changed, state = run_incremental_transform()
+    assert changed
+    save_state(state)
+
+    delta = pos_rows(['2023-03-01', '2023-03-02', '2023-02-15'], [4, 5, 6])
+    delta.to_csv('data/raw/pos_sales.csv', mode='a', header=False, index=False)
+    updated, _, _, changed, state = run_incremental_transform(previous=first)
+    assert changed
+    save_state(state)
+    # January rows are carried over untouched
+    jan = first[first['date'] < '2023-02-01'].reset_index(drop=True)
+    pd.testing.assert_frame_equal(updated[updated['date'] < '2023-02-01'].reset_index(drop=True), jan)
+    full = update_features(None, {'mode': 'full', 'months_rebuilt': []})
+    pd.testing.assert_frame_equal(updated, full)
+
+    again, _, _, changed, _ = run_incremental_transform(previous=updated)
+    assert not changed and again is updated
+
+
+def test_incremental_transform_stage_redoes_a_failed_run(tmp_path, monkeypatch):
+    import pipeline.incremental as incremental
+    from pipeline.stages import transform_stage
+    monkeypatch.chdir(tmp_path)
+    pos = pd.DataFrame({'date': pd.date_range('2023-01-01', '2023-01-31').strftime('%Y-%m-%d'), 'store_id': 'S001',
+                        'sku': 'SKU1', 'units_sold': 5, 'unit_price': 10.0, 'promo_flag': False})
+    ecom = pd.DataFrame({'date': ['2023-01-05'], 'sku': ['SKU2'], 'units_sold': [3],
+                         'unit_price': [12.0], 'discount': [0.0]})
+    _write_raw(tmp_path, pos, ecom)
+    transform_stage(incremental=True)
+    pos.iloc[:1].assign(date='2023-02-01', units_sold=7).to_csv('data/raw/pos_sales.csv', mode='a', header=False,
+                                                                index=False)
+
+    # Ingest succeeds, the crash comes before the model input is written
+    def crash(previous, summary, config=None):
+        raise RuntimeError("interrupted")
+    with monkeypatch.context() as m:
+        m.setattr(incremental, 'update_features', crash)
+        with pytest.raises(RuntimeError):
+            transform_stage(incremental=True)
+
+    # The watermarks were not advanced, so the next run picks the row up
+    (model_input, _, _), changed = transform_stage(incremental=True)
+    assert changed
+    assert model_input.loc[model_input['date'] == '2023-02-01', 'units_sold'].sum() == 7
+    pd.testing.assert_frame_equal(model_input, incremental.update_features(None, {'mode': 'full', 'months_rebuilt': []}))
+
+
+def test_run_stage_skips_unchanged_inputs(tmp_path, monkeypatch):
+    from pipeline.stages import run_stage
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'in.csv').write_text('a\n1\n')
+    calls = []
+
+    def compute():
+        calls.append(1)
+        (tmp_path / 'out.csv').write_text(f'{len(calls)}\n')
+        return 'computed'
+
+    def run(params=None, force=False):
+        return run_stage('plan', compute, lambda: 'cached', inputs=['in.csv'], outputs=['out.csv'],
+                         params=params, force=force)
+
+    assert run({'moq': 50}) == ('computed', True)
+    assert run({'moq': 50}) == ('cached', False)
+    assert run({'moq': 100}) == ('computed', True)
+    assert run({'moq': 100}, force=True) == ('computed', True)
+    (tmp_path / 'in.csv').write_text('a\n2\n')
+    assert run({'moq': 100}) == ('computed', True)
+    assert len(calls) == 4
+
+
+def test_stage_profiler_records_nested_stages(tmp_path):
+    from pipeline.profiling import StageProfiler, activate, stage, histogram
+    profiler = StageProfiler(profile_dir=str(tmp_path))
+    with activate(profiler):
+        with stage('transform') as outer:
+            with stage('ingest') as inner:
+                inner['rows_in'] = 1000
+            outer['rows_out'] = 10
+
+    report = profiler.report()
+    assert report['ingest']['parent'] == 'transform'
+    assert report['ingest']['rows_per_second'] > 0
+    assert report['transform']['wall_seconds'] >= report['ingest']['wall_seconds']
+    # Only the top-level stage is profiled (cProfile can't nest)
+    assert (tmp_path / 'transform.prof').exists()
+    assert not (tmp_path / 'ingest.prof').exists()
+
+    # Without an active profiler, stage() is a no-op
+    with stage('plan') as record:
+        record['rows_in'] = 1
+    assert 'plan' not in profiler.report()
+    assert histogram([0.1, 0.2, 0.3])['count'] == 3
+
+
+def test_generator_is_seeded_and_scalable(tmp_path):
+    from pipeline import generate_data
+    config = dict(n_stores=3, n_skus=8, days=20, end_date='2023-02-01', chunk_cells=50)
+    generate_data.main(out_dir=str(tmp_path / 'a'), **config)
+    generate_data.main(out_dir=str(tmp_path / 'b'), **config)
+    for name in ['sku_map.csv', 'pos_sales.csv', 'ecommerce_sales.csv', 'inventory.csv']:
+        assert (tmp_path / 'a' / name).read_bytes() == (tmp_path / 'b' / name).read_bytes()
+
+    generate_data.main(out_dir=str(tmp_path / 'c'), unknown_sku_rate=1.0, negative_rate=0.0, **config)
+    pos = pd.read_csv(tmp_path / 'c' / 'pos_sales.csv')
+    assert len(pd.read_csv(tmp_path / 'c' / 'sku_map.csv')) == 8
+    assert set(pos['store_id']) == {'S001', 'S002', 'S003'}
+    assert (pos['sku'] == 'SKU_NOT_IN_MAP').all()
+    assert (pos['units_sold'] > 0).all()
+    assert pos['date'].max() == '2023-01-31'
+
+
+def test_benchmark_compare_flags_regressions():
+    from pipeline.benchmark import compare
+    baseline = {'results': {'1x': {
+        'add_features': {'seconds': 1.0, 'peak_mb': 10.0},
+        'generate_production_plan': {'seconds': 0.5, 'peak_mb': 2.0},
+    }}}
+    current = {'results': {
+        '1x': {
+            'add_features': {'seconds': 1.2, 'peak_mb': 30.0},
+            'generate_production_plan': {'seconds': 0.9, 'peak_mb': 2.0},
+        },
+        '10x': {'add_features': {'seconds': 9.0, 'peak_mb': 99.0}},  # no baseline, ignored
+    }}
+    regressions = compare(current, baseline, threshold=0.25)
+    assert {(r['benchmark'], r['metric']) for r in regressions} == {
+        ('add_features', 'peak_mb'), ('generate_production_plan', 'seconds'),
+    }
+    assert compare(baseline, baseline) == []
+
+
+def test_recursive_forecast_feeds_predictions_back_as_lags(tmp_path, monkeypatch):
+    import numpy as np
+    from pipeline.forecast import FEATURE_CONFIG, train_forecast_model
+    from pipeline.transform import history_length, next_step_features
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+
+    # next_step_features reproduces add_features for the day after the history
+    df = add_features(_synthetic_sales(n_days=30), FEATURE_CONFIG)
+    g = df.groupby(['channel', 'sku'])['units_sold']
+    expected = g.transform(lambda x: x.rolling(7, min_periods=1).mean().shift(1)).fillna(0)
+    assert np.allclose(df['rolling_mean_7'], expected)
+    lookback = history_length(FEATURE_CONFIG)
+    history = np.stack([grp.to_numpy(float)[-lookback - 1:-1] for _, grp in g])
+    last_rows = df.groupby(['channel', 'sku']).tail(1)
+    step = next_step_features(history, last_rows['date'].reset_index(drop=True), FEATURE_CONFIG)
+    for col in ['lag_7', 'lag_14', 'rolling_mean_7', 'day_of_week']:
+        assert np.allclose(step[col], last_rows[col])
+
+    fc = train_forecast_model(add_features(_synthetic_sales()), engine='global', horizon=91)
+    assert len(fc) == 4 * 91
+    for _, series in fc.groupby(['channel', 'sku']):
+        # Beyond the first week, lag_7 is the model's own prediction a week earlier
+        assert np.allclose(series['lag_7'].to_numpy()[7:], series['yhat'].to_numpy()[:-7])
+
+
+def test_backtest_rolling_origins_and_zero_safe_metrics(tmp_path, monkeypatch):
+    import numpy as np
+    from pipeline.backtest import rolling_origins, run_backtest, score
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+
+    cutoffs = rolling_origins('2023-03-01', n_folds=3, horizon=7)
+    assert cutoffs == [pd.Timestamp(d) for d in ('2023-02-08', '2023-02-15', '2023-02-22')]
+
+    residuals = pd.DataFrame({'model': 'ML', 'y': [0.0, 2.0, 4.0], 'yhat': [1.0, 1.0, 6.0]})
+    m = score(residuals, keys=['model']).iloc[0]
+    assert m['mae'] == pytest.approx(4 / 3)
+    assert m['wape'] == pytest.approx(4 / 6)
+    assert m['bias'] == pytest.approx(2 / 3)
+    assert m['mape'] == pytest.approx((0.5 + 0.5) / 2)  # zero actual skipped, not divided by 1
+
+    metrics = run_backtest(_synthetic_sales(n_days=60), n_folds=2, horizon=7)
+    assert len(metrics) == 4 * 2 * 2  # series x folds x models
+    assert set(metrics['model']) == {'ML', 'Baseline_SMA'}
+    assert (metrics['n'] == 7).all()
+    assert np.isfinite(metrics[['mae', 'wape', 'bias']]).all().all()
+
+
+def test_baselines_match_reference_and_cover_every_series(tmp_path, monkeypatch):
+    import numpy as np
+    from pipeline import baselines
+    from pipeline.forecast import train_forecast_model
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+
+    # Row 0 launches on day 2 (NaN before), row 1 is intermittent, row 2 never sold
+    Y = np.array([
+        [np.nan, np.nan, 4, 6, 2, 8, 5, 3, 7, 1],
+        [0, 0, 5, 0, 0, 0, 3, 0, 0, 4],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    ], dtype=float)
+
+    def ses_loop(x, alpha):
+        level = x[0]
+        for v in x[1:]:
+            level = alpha * v + (1 - alpha) * level
+        return level
+
+    assert np.allclose(baselines.ses(Y, 2)[0], ses_loop(Y[0, 2:], baselines.SES_ALPHA))
+    assert np.allclose(baselines.sma(Y, 1)[:, 0], np.nanmean(Y[:, -7:], axis=1))
+    assert np.allclose(baselines.seasonal_naive(Y, 9)[0], Y[0, [3, 4, 5, 6, 7, 8, 9, 3, 4]])
+    # Croston row 1: sizes 5, 3, 4 at intervals 3, 4, 3
+    a = baselines.CROSTON_ALPHA
+    expected = ses_loop(np.array([5, 3, 4.]), a) / ses_loop(np.array([3, 4, 3.]), a)
+    assert baselines.croston(Y, 1)[1, 0] == pytest.approx(expected)
+    assert baselines.sba(Y, 1)[1, 0] == pytest.approx(expected * (1 - a / 2))
+    F, methods = baselines.forecast_matrix(Y, 7)
+    assert list(methods) == ['sma', 'sba', 'sba']
+    assert (F[2] == 0).all()
+    with pytest.raises(ValueError):
+        baselines.forecast_matrix(Y, 7, 'arima')
+
+    history = _synthetic_sales(skus=('SKU1',))
+    new_product = _synthetic_sales(n_days=10, skus=('NEW1',), channels=('Retail',))
+    new_product['date'] = new_product['date'] + pd.Timedelta(days=50)
+    fc = train_forecast_model(add_features(pd.concat([history, new_product], ignore_index=True)), engine='baseline')
+    assert set(fc['sku']) == {'SKU1', 'NEW1'}
+    assert len(fc) == 3 * 7
+    assert set(fc['model_version']) <= {'Baseline_SMA', 'SBA'}
+    metrics = pd.read_csv('data/outputs/forecast_metrics.csv')
+    assert (metrics['best_model'] == 'Baseline').all()
+
+
+def test_model_registry_reuses_unchanged_series_and_evicts_lru(tmp_path, monkeypatch):
+    from pipeline.forecast import train_forecast_model
+    from pipeline.registry import ModelRegistry
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+
+    from pipeline.profiling import StageProfiler, activate
+
+    def run(df, **kwargs):
+        profiler = StageProfiler()
+        with activate(profiler):
+            fc = train_forecast_model(df, **kwargs)
+        return fc, profiler.report()['forecast']['fit_seconds']['count']
+
+    df = add_features(_synthetic_sales())
+    first, n_first = run(df)
+    assert n_first == 4
+    again, n_again = run(df)
+    assert n_again == 0  # nothing changed, every model reused
+    pd.testing.assert_frame_equal(first, again)
+
+    # A promo change on one series refits only that series under 'changed'...
+    changed = df.copy()
+    changed.loc[(changed['sku'] == 'SKU1') & (changed['channel'] == 'Retail'), 'promo_flag'] = 1
+    _, n_changed = run(changed)
+    assert n_changed == 1
+    # ...and nothing in predict-only mode
+    changed.loc[changed.index[-1], 'units_sold'] += 3
+    _, n_never = run(changed, refit='never')
+    assert n_never == 0
+
+    registry = ModelRegistry(max_entries=2)
+    assert len(registry.index['entries']) == 5
+    registry.save()
+    kept = ModelRegistry().index
+    assert len(kept['entries']) == 2
+    assert set(kept['latest'].values()) <= set(kept['entries'])
+    assert len(list((tmp_path / 'data' / 'models').glob('*.joblib'))) == 2
+
+
+def test_refit_forecast_does_not_depend_on_earlier_runs(tmp_path, monkeypatch):
+    from pipeline.forecast import train_forecast_model
+    from pipeline.registry import ModelRegistry
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+    df = add_features(_synthetic_sales())
+    # The one series where the GBR beats the baseline on its holdout
+    series = (df['sku'] == 'SKU2') & (df['channel'] == 'Ecommerce')
+
+    # Nightly runs under 'changed': the same series changes twice
+    history = tmp_path / 'history'
+    for bump in (0, 1, 2):
+        data = df.copy()
+        data.loc[series & (data['date'] == data['date'].max()), 'units_sold'] += bump
+        nightly = train_forecast_model(data, registry=ModelRegistry(str(history)))
+    fresh = train_forecast_model(data, registry=ModelRegistry(str(tmp_path / 'fresh')))
+    assert (nightly.loc[(nightly['sku'] == 'SKU2') & (nightly['channel'] == 'Ecommerce'), 'model_version']
+            == 'GradientBoosting').all()
+    pd.testing.assert_frame_equal(nightly, fresh)
+
+
+def test_backtest_residuals_drive_forecast_intervals(tmp_path, monkeypatch):
+    import numpy as np
+    from pipeline.backtest import run_backtest
+    from pipeline.forecast import train_forecast_model
+    from pipeline.intervals import POOLED, apply_intervals, interval_offsets, load_offsets
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+
+    # Split-conformal: ceil((n + 1) * 0.8) = 4th smallest |error| of 4
+    cutoff = pd.Timestamp('2023-01-10')
+    residuals = pd.DataFrame({
+        'channel': 'Retail', 'sku': ['A'] * 4 + ['B'] * 2, 'model': 'ML', 'cutoff': cutoff,
+        'date': cutoff + pd.Timedelta(days=1), 'y': [10.0] * 6, 'yhat': [9, 12, 13, 10, 8, 10.0],
+    })
+    offsets = interval_offsets(residuals, coverage=0.8).set_index('sku')
+    assert offsets.loc['A', ['lower', 'upper']].tolist() == [-3, 3]
+    # B has too few residuals, so it takes the pooled value over all 6
+    assert offsets.loc['B', 'upper'] == offsets.loc[POOLED, 'upper'] == 3
+    quantile = interval_offsets(residuals, coverage=0.5, method='quantile').set_index('sku')
+    assert quantile.loc['A', 'lower'] == pytest.approx(np.quantile([1, -2, -3, 0], 0.25))
+
+    fc = pd.DataFrame({'channel': 'Retail', 'sku': 'NEW', 'yhat': [5.0, 5.0, 5.0, 5.0],
+                       'yhat_lower': 0.0, 'yhat_upper': 0.0, 'model_version': 'GradientBoosting'})
+    banded = apply_intervals(fc, offsets.reset_index())
+    assert banded['yhat_upper'].tolist() == pytest.approx(5 + 3 * np.sqrt([1, 2, 3, 4]))
+
+    df = add_features(_synthetic_sales(n_days=60))
+    run_backtest(df, n_folds=4, horizon=7)
+    assert len(load_offsets()) == 4 * 2 * 7 + 2 * 7  # series x models x steps, plus pooled
+    fc = train_forecast_model(df, refit='always')
+    width = fc['yhat_upper'] - fc['yhat_lower']
+    assert (width > 0).all()
+    assert not np.allclose(fc['yhat_upper'], fc['yhat'] * 1.2)
+    assert (fc['yhat_lower'] <= fc['yhat']).all() and (fc['yhat'] <= fc['yhat_upper']).all()
+
+
+def test_hierarchy_reconciliation_is_coherent(tmp_path, monkeypatch):
+    import numpy as np
+    from pipeline.forecast import train_forecast_model
+    from pipeline.hierarchy import build_hierarchy, reconcile
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+
+    bottom = pd.DataFrame({'channel': ['Ecommerce', 'Ecommerce', 'Retail', 'Retail'],
+                           'sku': ['A', 'B', 'A', 'B'], 'category': ['Beer', 'Cider', 'Beer', 'Cider']})
+    h = build_hierarchy(bottom)
+    # total, 2 channels, 2 categories, 4 category x channel, 2 skus, 4 bottom
+    assert h.n_nodes == 15 and h.n_aggregate == 11
+    rng = np.random.default_rng(0)
+    Yhat = rng.uniform(1, 10, size=(h.n_nodes, 3))
+    S_agg = h.S[:h.n_aggregate].toarray()
+    for method in ('bottom_up', 'ols', 'mint'):
+        Y = reconcile(h, Yhat, method)
+        assert np.allclose(Y[:h.n_aggregate], S_agg @ Y[h.n_aggregate:])
+    assert np.allclose(reconcile(h, Yhat, 'bottom_up')[h.n_aggregate:], Yhat[h.n_aggregate:])
+    # OLS is the orthogonal projection: dense (S'S)^-1 S' formula gives the same answer
+    S = h.S.toarray()
+    assert np.allclose(reconcile(h, Yhat, 'ols'), S @ np.linalg.solve(S.T @ S, S.T @ Yhat))
+    history = np.array([[1.0, 1], [2, 2], [3, 3], [4, 4]])
+    td = reconcile(h, Yhat, 'top_down', history=history)
+    assert np.allclose(td[h.n_aggregate:, 0], Yhat[0, 0] * np.array([1, 2, 3, 4]) / 10)
+
+    df = add_features(_synthetic_sales()).assign(category=lambda d: d['sku'].map({'SKU1': 'Beer', 'SKU2': 'Cider'}))
+    fc = train_forecast_model(df, engine='baseline', reconcile='mint')
+    nodes = pd.read_csv('data/outputs/forecast_hierarchy.csv')
+    total = nodes[nodes['level'] == 'total'].set_index('date')['yhat']
+    assert np.allclose(fc.groupby(fc['date'].astype(str))['yhat'].sum().to_numpy(), total.to_numpy())
+
+
+def test_store_granularity_is_compact_and_batched(tmp_path, monkeypatch):
+    import numpy as np
+    from pipeline.forecast import train_store_forecast_model
+    from pipeline.panel import build_panel, load_panel, save_panel
+    from pipeline.plan import generate_store_demand_plan
+    from pipeline.transform import STORE_KEYS, create_fact_sales_daily
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+
+    pos = pd.DataFrame({
+        'date': pd.to_datetime(['2023-01-01', '2023-01-01', '2023-01-03', '2023-01-05']),
+        'store_id': ['S1', 'S2', 'S1', 'S2'], 'sku': 'A', 'units_sold': [3, 1, 2, 4],
+        'unit_price': 2.0, 'promo_flag': 0,
+    })
+    ecom = pd.DataFrame({'date': pd.to_datetime(['2023-01-02']), 'sku': ['A'], 'units_sold': [5],
+                         'unit_price': [2.0], 'discount': [0.0]})
+    fact = create_fact_sales_daily(pos, ecom, by_store=True)
+    assert set(fact['store_id']) == {'S1', 'S2', 'ONLINE'}
+    assert isinstance(fact['store_id'].dtype, pd.CategoricalDtype)
+
+    panel = build_panel(fact, keys=STORE_KEYS, compact=True, columns=['units_sold', 'promo_flag'])
+    assert panel.values['units_sold'].dtype == np.uint8
+    assert panel.values['promo_flag'].dtype == np.uint8 and 'revenue' not in panel.values
+    assert build_panel(fact, keys=STORE_KEYS, compact=True).values['revenue'].dtype == np.float32
+    save_panel(panel, 'panel')
+    loaded = load_panel('panel')
+    assert np.array_equal(loaded.values['units_sold'], panel.values['units_sold'])
+    assert loaded.first_day.tolist() == panel.first_day.tolist()
+    assert loaded.keys['store_id'].astype(str).tolist() == ['ONLINE', 'S1', 'S2']
+
+    train_store_forecast_model(panel, horizon=7, path='one_batch.csv')
+    rows = train_store_forecast_model(panel, horizon=7, batch_size=1, path='data/outputs/forecast_store_daily.csv')
+    batched = pd.read_csv('data/outputs/forecast_store_daily.csv')
+    assert rows == len(batched) == 3 * 7
+    pd.testing.assert_frame_equal(batched, pd.read_csv('one_batch.csv'))
+    with pytest.raises(ValueError):
+        train_store_forecast_model(panel, engine='local')
+
+    plan = generate_store_demand_plan()
+    shares = plan.groupby(['week_start', 'sku'])['share_of_sku'].sum()
+    assert np.allclose(shares, 1)
+
+
+def test_rolling_plan_honours_lead_time():
+    import numpy as np
+    from pipeline.plan import project_inventory
+    demand = np.array([[100.0] * 6, [10.0] * 6])
+    p = project_inventory(demand, on_hand=np.array([150.0, 100.0]), on_order=np.array([40.0, 0.0]),
+                          lead_weeks=np.array([2, 0]), safety_factor=0.2, moq=50)
+
+    # Lead time 2: weeks 0-1 run on stock, on_order lands in week 2 with the first receipt
+    assert p['production'][0, -2:].sum() == 0
+    assert p['shortage'][0].tolist() == [0, 50, 0, 0, 0, 0]
+    assert p['receipts'][0, 2] >= 40 + 100
+    # Releases arrive exactly lead weeks later and are MOQ multiples
+    np.testing.assert_allclose(p['production'][0, :4], p['receipts'][0, 2:] - [40, 0, 0, 0])
+    assert (p['production'] % 50 == 0).all()
+    # Stock balance: start + receipts - demand + shortage = end, and covers safety stock once reachable
+    np.testing.assert_allclose(p['start_on_hand'] + p['receipts'] - demand + p['shortage'], p['end_on_hand'])
+    assert (p['end_on_hand'][:, 2:] >= 0.2 * demand[:, 2:]).all()
+    # Enough stock for the whole horizon: nothing to make
+    assert p['shortage'][1].sum() == 0 and p['production'][1].sum() == 0
+
+    # 52 weeks x thousands of skus stays well under a second
+    import time
+    rng = np.random.default_rng(0)
+    n = 5000
+    start = time.perf_counter()
+    project_inventory(rng.gamma(2, 50, (n, 52)), rng.integers(0, 500, n).astype(float),
+                      rng.integers(0, 200, n).astype(float), rng.integers(0, 4, n))
+    assert time.perf_counter() - start < 1.0
+
+
+def test_schedule_respects_line_capacity():
+    import time
+    import numpy as np
+    from pipeline.schedule import schedule_production
+    weeks = pd.date_range('2026-01-05', periods=4, freq='W-MON')
+    # Week 3 needs more than a week of line time, so the MILP must build ahead
+    plan = pd.DataFrame({'week_start': np.tile(weeks, 2), 'sku': np.repeat(['A', 'B'], 4),
+                         'suggested_production': [100, 100, 900, 100, 100, 0, 100, 100]})
+    lines = pd.DataFrame({'line': ['L1', 'L1'], 'sku': ['A', 'B'], 'units_per_hour': 100,
+                          'hours_per_week': 8, 'changeover_hours': 1})
+
+    milp_schedule, milp_info = schedule_production(plan, lines, moq=50, solver='milp')
+    greedy_schedule, greedy_info = schedule_production(plan, lines, moq=50, solver='greedy')
+    assert milp_info['solver'] == 'milp' and greedy_info['solver'] == 'greedy'
+    assert milp_info['objective'] < greedy_info['objective']
+    for schedule in (milp_schedule, greedy_schedule):
+        used = (schedule['run_hours'] + schedule['changeover_hours']).groupby(schedule['week_start']).sum()
+        assert (used <= 8 + 1e-9).all()
+        assert (schedule['units'] % 50 == 0).all()
+    # Built ahead: by week 3 A's cumulative production covers its cumulative plan
+    a = milp_schedule[milp_schedule['sku'] == 'A'].set_index('week_start')['units'].reindex(weeks, fill_value=0)
+    assert a.cumsum().iloc[2] >= 1100
+    assert milp_info['unmet_units'] == 0
+
+    # Hundreds of skus: auto hands over to the greedy heuristic in bounded time
+    rng = np.random.default_rng(0)
+    skus = [f"S{i}" for i in range(600)]
+    weeks = pd.date_range('2026-01-05', periods=26, freq='W-MON')
+    big = pd.DataFrame({'week_start': np.tile(weeks, len(skus)), 'sku': np.repeat(skus, len(weeks)),
+                        'suggested_production': rng.choice([0, 50, 100, 200], len(skus) * len(weeks))})
+    big_lines = pd.DataFrame({'line': [f"L{i % 20}" for i in range(len(skus))], 'sku': skus,
+                              'units_per_hour': 200, 'hours_per_week': 120, 'changeover_hours': 2})
+    start = time.perf_counter()
+    _, info = schedule_production(big, big_lines, moq=50, solver='auto', time_limit=5)
+    assert info['solver'] == 'greedy' and time.perf_counter() - start < 5
+
+
+def test_monte_carlo_safety_stock_hits_service_level():
+    import numpy as np
+    from pipeline.simulation import order_for_service, protection_demand, required_stock, service_at
+    rng = np.random.default_rng(0)
+    mean = np.vstack([np.full(28, 20.0), np.full(28, 2.0), np.zeros(28)])
+    sd = np.vstack([np.full(28, 5.0), np.full(28, 3.0), np.zeros(28)])
+
+    demand = protection_demand(mean, sd, np.array([7, 14, 7]), n_paths=5000, rng=rng)
+    assert demand.shape == (3, 5000) and (demand >= 0).all()
+    assert abs(demand[0].mean() - 20 * 14) < 20 * 14 * 0.05
+    stockout, _ = service_at(demand, required_stock(demand, 0.95, 'cycle'))
+    assert (stockout <= 0.05).all()
+    _, fill = service_at(demand, required_stock(demand, 0.99, 'fill'))
+    np.testing.assert_allclose(fill[:2], 0.99, atol=1e-6)
+    # Candidate grid: more stock never hurts
+    stockout, fill = service_at(demand, np.outer(demand.mean(axis=1), [0.8, 1.0, 1.2, 1.5]))
+    assert (np.diff(stockout, axis=1) <= 0).all() and (np.diff(fill, axis=1) >= 0).all()
+
+    # Chunked (one sku per chunk) and MOQ-rounded orders reach the target from the stock position
+    out = order_for_service(mean, sd, np.array([7, 14, 7]), np.array([100.0, 0.0, 0.0]), 0.9,
+                            moq=50, n_paths=2000, max_bytes=2000 * 30 * 4)
+    assert (out['order_qty'] % 50 == 0).all() and (out['stockout_prob'] <= 0.1).all()
+    assert out.loc[2, 'order_qty'] == 0 and out.loc[2, 'safety_stock'] == 0
+    assert out.loc[1, 'safety_stock'] > 0
+
+
+def test_daily_sku_demand_ignores_clipped_lower_bound(tmp_path):
+    import numpy as np
+    from scipy.stats import norm
+    from pipeline.simulation import daily_sku_demand
+    path = tmp_path / 'forecast_daily.csv'
+    # The slow mover's band yhat -/+ 3 has its lower bound clipped at zero
+    pd.DataFrame({'date': ['2026-01-05'] * 3, 'sku': ['A', 'SLOW', 'SLOW'], 'channel': ['Retail', 'Retail', 'Online'],
+                  'yhat': [10.0, 1.0, 1.0], 'yhat_lower': [7.0, 0.0, 0.0],
+                  'yhat_upper': [13.0, 4.0, 4.0]}).to_csv(path, index=False)
+    mean, sd = daily_sku_demand(path)
+    z = norm.ppf(0.9)
+    assert mean.loc['SLOW'].item() == 2.0
+    np.testing.assert_allclose(sd.loc['A'].item(), 3 / z)
+    # Channels add as independent series
+    np.testing.assert_allclose(sd.loc['SLOW'].item(), np.sqrt(2) * 3 / z)
+
+
+def test_service_levels_flag_uncalibrated_bands(tmp_path):
+    import os
+    from pipeline.intervals import OFFSET_COLUMNS
+    from pipeline.simulation import bands_calibrated
+    forecast, offsets = tmp_path / 'forecast_daily.csv', tmp_path / 'interval_offsets.csv'
+    forecast.write_text('date,sku,yhat,yhat_lower,yhat_upper\n')
+    assert not bands_calibrated(forecast, offsets)
+    pd.DataFrame([['A', '1', 'ML', 1, 5, -2.0, 2.0]], columns=OFFSET_COLUMNS).to_csv(offsets, index=False)
+    os.utime(offsets, (0, 0))
+    assert bands_calibrated(forecast, offsets)
+    # Offsets newer than the forecast were not applied to it
+    os.utime(forecast, (0, 0))
+    os.utime(offsets, None)
+    assert not bands_calibrated(forecast, offsets)
+
+
+def test_scenarios_batch_matches_individual_plans():
+    import time
+    import numpy as np
+    from pipeline.plan import project_inventory
+    from pipeline.scenarios import evaluate_scenarios, expand_scenarios, promo_lift
+    weeks = pd.date_range('2026-01-05', periods=8, freq='W-MON')
+    inputs = {
+        'demand': pd.DataFrame([[100.0] * 8, [30.0] * 8], index=pd.Index(['A', 'B'], name='sku'), columns=weeks),
+        'on_hand': np.array([120.0, 40.0]), 'on_order': np.array([0.0, 50.0]), 'lead_days': np.array([7.0, 14.0]),
+    }
+    sales = pd.DataFrame({'sku': ['A', 'A', 'B', 'B'], 'units_sold': [10, 15, 4, 4], 'promo_flag': [0, 1, 0, 1]})
+    lift = promo_lift(sales)
+    assert lift['A'] == 1.5 and lift['B'] == 1.0
+
+    scenarios = expand_scenarios({
+        'scenarios': [{'name': 'base'}, {'name': 'promo', 'promo_weeks': ['2026-01-14', 3, 40], 'promo_skus': ['A']},
+                      {'name': 'shock', 'demand_shock': {'B': 2.0}}, {'name': 'big_moq', 'moq': {'A': 500, '*': 50}}],
+        'grid': {'safety_factor': [0.0, 0.5], 'moq': [10, 100]},
+    })
+    assert len(scenarios) == 8 and scenarios[4]['name'] == 'safety_factor=0.0,moq=10'
+    table = evaluate_scenarios(scenarios, inputs, lift).set_index('scenario')
+
+    # The batched pass gives each scenario the same plan as planning it alone
+    alone = project_inventory(inputs['demand'].to_numpy(), inputs['on_hand'], inputs['on_order'], np.array([1, 2]),
+                              safety_factor=0.5, moq=100)
+    assert table.loc['safety_factor=0.5,moq=100', 'production_units'] == alone['production'].sum()
+    assert table.loc['safety_factor=0.5,moq=100', 'shortage_units'] == alone['shortage'].sum()
+    # Promo lifts A by 1.5x in weeks 1 and 3 only; week 40 is past the horizon
+    assert table.loc['promo', 'demand_units'] == table.loc['base', 'demand_units'] + 2 * 50
+    assert table.loc['shock', 'demand_units'] == table.loc['base', 'demand_units'] + 240
+    assert table.loc['big_moq', 'production_units'] >= 500
+    assert table.loc['safety_factor=0.5,moq=10', 'avg_on_hand'] > table.loc['safety_factor=0.0,moq=10', 'avg_on_hand']
+
+    # Dozens of what-ifs over thousands of skus x 52 weeks in one pass
+    rng = np.random.default_rng(0)
+    n = 2000
+    big = {'demand': pd.DataFrame(rng.gamma(2, 50, (n, 52)), index=[f"S{i}" for i in range(n)],
+                                  columns=pd.date_range('2026-01-05', periods=52, freq='W-MON')),
+           'on_hand': rng.integers(0, 500, n).astype(float), 'on_order': np.zeros(n),
+           'lead_days': rng.choice([7.0, 14.0, 21.0], n)}
+    start = time.perf_counter()
+    table = evaluate_scenarios(expand_scenarios({'grid': {'safety_factor': [0.1, 0.2, 0.3, 0.5], 'moq': [25, 50, 100],
+                                                          'demand_shock': [0.9, 1.0, 1.2]}}), big)
+    assert len(table) == 36 and time.perf_counter() - start < 5
+
+
+def _stub_catalog_server(fixture_dir, failing=()):
+    # Serves recorded products.json pages with ETags over keep-alive HTTP/1.1;
+    # (handle, page) pairs in `failing` answer 500
+    import hashlib
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+    log = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            handle, page = parts.path.split('/')[2], parse_qs(parts.query)['page'][0]
+            fixture = fixture_dir / handle / f"page{page}.json"
+            body = fixture.read_bytes() if fixture.exists() else b'{"products": []}'
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            log.append((self.client_address, self.path))
+            if (handle, int(page)) in failing:
+                self.send_response(500)
+                body = b''
+            elif self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                body = b''
+            else:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, log
+
+
+def test_async_collector_reuses_connections_and_revalidates(tmp_path):
+    import time
+    from pathlib import Path
+    from pipeline.collective_arts_collect import build_catalog, fetch_collections
+    server, log = _stub_catalog_server(Path(__file__).parent / 'fixtures' / 'collective_arts')
+    base = f"http://127.0.0.1:{server.server_address[1]}/collections"
+    urls = [f"{base}/beer-cider", f"{base}/ipa"]
+    try:
+        fetched, stats = fetch_collections(urls, cache_dir=tmp_path / 'http', rate=1000, burst=100)
+        assert [len(fetched[u]) for u in urls] == [3, 2]
+        assert stats['requests'] == len(log) and stats['not_modified'] == 0 and stats['errors'] == 0
+        # Pooled keep-alive connections: fewer sockets than requests
+        assert stats['connections'] < stats['requests']
+        assert len({addr for addr, _ in log}) == stats['connections']
+
+        catalog = build_catalog(fetched)
+        summary = catalog['summary']
+        assert summary['total_products'] == 4 and summary['beer_like_sold_out'] == 2
+        assert summary['collection_counts'] == {'beer-cider': 3, 'ipa': 2}
+
+        # Second run: every page revalidates to a 304 and is served from the cache
+        start = time.perf_counter()
+        again, stats = fetch_collections(urls, cache_dir=tmp_path / 'http', rate=20, burst=1)
+        assert again == fetched
+        assert stats['not_modified'] == stats['requests'] and stats['bytes'] == 0
+        # Token bucket: 20 requests/s with no burst
+        assert time.perf_counter() - start >= (stats['requests'] - 1) / 20 * 0.9
+    finally:
+        server.shutdown()
+
+
+def test_async_collector_marks_failed_pages_incomplete(tmp_path):
+    from pathlib import Path
+    from pipeline.collective_arts_collect import fetch_collections
+    server, _ = _stub_catalog_server(Path(__file__).parent / 'fixtures' / 'collective_arts',
+                                     failing={('beer-cider', 2)})
+    base = f"http://127.0.0.1:{server.server_address[1]}/collections"
+    urls = [f"{base}/beer-cider", f"{base}/ipa"]
+    try:
+        fetched, stats = fetch_collections(urls, cache_dir=None, rate=1000, burst=100)
+    finally:
+        server.shutdown()
+    # The 500 on page 2 is not read as the end of the collection
+    assert stats['errors'] == 1 and stats['incomplete'] == [urls[0]]
+    assert [len(fetched[u]) for u in urls] == [2, 2]
+
+
+def test_catalog_snapshots_store_changes_and_rebuild_as_of(tmp_path):
+    import copy
+    from pipeline.catalog_snapshots import CatalogSnapshots
+    from pipeline.collective_arts_collect import build_catalog
+
+    def product(pid, title, available, price, product_type='Beer'):
+        return {'id': pid, 'title': title, 'handle': title.lower().replace(' ', '-'), 'product_type': product_type,
+                'tags': [], 'variants': [{'available': available, 'price': str(price)}]}
+
+    day1 = {'c/beer-cider': [product(1, 'Lager', True, 4.0), product(2, 'Stout', True, 5.0)],
+            'c/ipa': [product(3, 'Hazy IPA', True, 4.5)]}
+    day2 = copy.deepcopy(day1)
+    day2['c/beer-cider'][1]['variants'][0]['available'] = False  # Stout sells out
+    day2['c/ipa'] = [product(4, 'West Coast IPA', True, 4.75)]    # Hazy IPA delisted, new IPA
+
+    store = CatalogSnapshots(tmp_path / 'snapshots.sqlite')
+    first = store.record(build_catalog(day1)['catalog'], '2026-01-01T06:00:00Z')
+    assert (first['added'], first['changed'], first['removed']) == (3, 0, 0)
+    # An unchanged run writes no product rows
+    assert store.record(build_catalog(day1)['catalog'], '2026-01-01T18:00:00Z')['added'] == 0
+    second = store.record(build_catalog(day2)['catalog'], '2026-01-02T06:00:00Z')
+    assert (second['added'], second['changed'], second['removed']) == (1, 1, 1)
+    assert store.conn.execute("SELECT COUNT(*) FROM product_changes").fetchone()[0] == 6
+
+    # Incremental summary equals a full recompute
+    full = build_catalog(day2)['summary']
+    for key in ('total_products', 'beer_like_total', 'beer_like_available', 'beer_like_sold_out',
+                'collection_counts', 'collection_available_counts'):
+        assert second['summary'][key] == full[key]
+
+    # As-of reconstruction and per-product sold-out history
+    assert [p['title'] for p in store.as_of('2026-01-01')] == ['Hazy IPA', 'Lager', 'Stout']
+    assert store.as_of('2026-01-02') == build_catalog(day2)['catalog']
+    assert store.as_of('2025-12-31') == []
+    assert [h['available'] for h in store.history('2')] == [True, False]
+    assert store.history('3')[-1]['removed']
+    assert store.summary('2026-01-01')['beer_like_sold_out'] == 0
+    store.close()
+
+
+
+def test_publish_writes_compact_hashed_artifacts_only_when_changed(tmp_path, monkeypatch):
+    import gzip
+    import json
+    from pipeline.publish import MANIFEST, build_artifacts, write_artifacts
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'outputs').mkdir(parents=True)
+    (tmp_path / 'data' / 'curated').mkdir(parents=True)
+    pd.DataFrame({'sku': ['A', 'B', 'C'], 'product_name': ['Ale', 'Bock', 'Cider'],
+                  'category': ['Beer', 'Beer', 'Cider'], 'pack_size': ['6PK', '4PK', '4PK'],
+                  'active_flag': [1, 0, 1]}).to_csv('data/curated/dim_product.csv', index=False)
+    dates = pd.date_range('2026-01-01', periods=14)
+    forecast = pd.DataFrame([(d, ch, sku, 10.0, 8.0, 12.0) for d in dates for ch in ['Retail', 'Ecommerce']
+                             for sku in ['A', 'B', 'C']],
+                            columns=['date', 'channel', 'sku', 'yhat', 'yhat_lower', 'yhat_upper'])
+    forecast.to_csv('data/outputs/forecast_daily.csv', index=False)
+    plan = pd.DataFrame({'week_start': ['2025-12-29'] * 3, 'sku': ['A', 'B', 'C'],
+                         'product_name': ['Ale', 'Bock', 'Cider'], 'forecast_units': [100.0, 300.0, 250.0],
+                         'safety_stock': [20.0] * 3, 'on_hand': [50] * 3, 'suggested_production': [100, 0, 200],
+                         'notes': ['', '', 'Low stock']})
+    plan.to_csv('data/outputs/production_plan_weekly.csv', index=False)
+
+    artifacts = build_artifacts(top_n=1)
+    forecast_page = json.loads(artifacts['forecast.json'])
+    # Summed over channels: one row per sku and day, columnar
+    assert len(forecast_page['daily_by_sku']['sku']) == 3 * 14
+    assert set(forecast_page['daily_by_sku']['yhat']) == {20.0}
+    assert sum(forecast_page['weekly_by_category']['yhat']) == pytest.approx(forecast['yhat'].sum())
+    sales = json.loads(artifacts['sales_plan.json'])
+    # Totals cover every sku, the table only the largest variance
+    assert sales['totals']['forecasted_sales'] == pytest.approx(840.0)
+    assert sales['top_variance']['sku'] == ['A']
+    catalog = json.loads(artifacts['catalog.json'])
+    assert (catalog['beers'], catalog['active_beers']) == (2, 1)
+
+    dest = tmp_path / 'public'
+    first = write_artifacts(artifacts, str(dest))
+    assert first['written'] == len(artifacts) and first['removed'] == 0
+    manifest = json.loads((dest / MANIFEST).read_text())['files']
+    for name, entry in manifest.items():
+        assert entry['path'] != name
+        assert gzip.decompress((dest / (entry['path'] + '.gz')).read_bytes()) == artifacts[name]
+    assert write_artifacts(build_artifacts(top_n=1), str(dest))['written'] == 0
+
+    # Only artifacts whose content changed are rewritten; their old files go
+    plan.loc[1, 'suggested_production'] = 400
+    plan.to_csv('data/outputs/production_plan_weekly.csv', index=False)
+    again = write_artifacts(build_artifacts(top_n=1), str(dest))
+    assert again['written'] == 3 and again['unchanged'] == len(artifacts) - 3
+    assert not (dest / manifest['planning.json']['path']).exists()
+    assert (dest / manifest['forecast.json']['path']).exists()
+
+
+def test_read_service_indexes_runs_and_hot_reloads(tmp_path):
+    import json
+    import os
+
+    from pipeline.serve import ReadService
+
+    dates = pd.date_range('2026-01-05', periods=14)
+    forecast = pd.DataFrame([(d, ch, sku, float(i), i - 1.0, i + 1.0, 'M')
+                             for i, d in enumerate(dates) for ch in ['Retail', 'Ecommerce'] for sku in ['A', 'B']],
+                            columns=['date', 'channel', 'sku', 'yhat', 'yhat_lower', 'yhat_upper', 'model_version'])
+    paths = {name: str(tmp_path / f'{name}.csv') for name in ['forecast', 'plan', 'product']}
+    forecast.loc[(forecast['sku'] == 'B') & (forecast['channel'] == 'Retail'), 'yhat_lower'] = np.nan
+    forecast.sample(frac=1, random_state=0).to_csv(paths['forecast'], index=False)
+    pd.DataFrame({'week_start': ['2026-01-05', '2026-01-05', '2026-01-12'], 'sku': ['A', 'B', 'A'],
+                  'suggested_production': [50, 0, 100]}).to_csv(paths['plan'], index=False)
+    pd.DataFrame({'sku': ['A', 'B'], 'product_name': ['Ale', None]}).to_csv(paths['product'], index=False)
+    service = ReadService(paths['forecast'], paths['plan'], paths['product'], str(tmp_path / 'manifest.json'))
+
+    status, body = service.respond('/forecast?sku=A&days=3&start=2026-01-07')
+    result = json.loads(body)
+    assert status == 200 and result['product_name'] == 'Ale'
+    # Channels summed when none is given
+    assert [r['date'] for r in result['forecast']] == ['2026-01-07', '2026-01-08', '2026-01-09']
+    assert [r['yhat'] for r in result['forecast']] == [4.0, 6.0, 8.0]
+    retail = json.loads(service.respond('/forecast?sku=A&channel=Retail&days=30')[1])['forecast']
+    assert len(retail) == 14 and retail[0]['model_version'] == 'M'
+    # Any day of a week maps to its plan week
+    week = json.loads(service.respond('/plan?week=2026-01-15&sku=A')[1])
+    assert week['week_start'] == '2026-01-12' and week['rows'][0]['suggested_production'] == 100
+    assert service.respond('/forecast?sku=Z')[0] == 404
+    assert service.respond('/forecast?days=3')[0] == 400
+    # Missing values come back as null, never as the invalid JSON NaN
+    status, body = service.respond('/forecast?sku=B&channel=Retail&days=1')
+    assert status == 200 and b'NaN' not in body
+    result = json.loads(body)
+    assert result['product_name'] is None and result['forecast'][0]['yhat_lower'] is None
+
+    # Repeated queries are served from the LRU cache
+    service.respond('/forecast?days=3&start=2026-01-07&sku=A')
+    assert service.stats['hits'] == 1
+    assert service.reload() is False
+
+    # A new run replaces the index at once and invalidates cached answers
+    forecast.assign(yhat=forecast['yhat'] * 10).to_csv(paths['forecast'], index=False)
+    os.utime(paths['forecast'], ns=(1, 1))
+    assert service.reload() is True and service.generation == 2
+    result = json.loads(service.respond('/forecast?sku=A&days=3&start=2026-01-07')[1])
+    assert [r['yhat'] for r in result['forecast']] == [40.0, 60.0, 80.0]
+    # A broken run keeps the previous one serving
+    with open(paths['plan'], 'w') as f:
+        f.write('')
+    assert service.reload() is False and service.generation == 2
+    health = json.loads(service.respond('/health')[1])
+    assert health['reload_errors'] == 1 and health['last_reload_error'].startswith('EmptyDataError')
+    assert service.respond('/plan?week=2026-01-05')[0] == 200